@@ -268,9 +268,38 @@ NOSE_ARGS = ['--exclude-dir=libs/dal',
              '--exclude-dir=seed/common']
 
 
+# Import Settings
+# Stage raw rows with one bulk INSERT per chunk instead of two saves per row.
+RAW_SAVE_BULK_INSERT = True
+# Send workers (byte offset, row count) chunk descriptors and let them read the
+# rows from the file, instead of serializing the rows into each task message.
+RAW_SAVE_STREAMING = False
+# Chunk sizing for the save/map/cleanse chords; see seed.utils.chunks.
+IMPORT_CHUNK_MIN_SIZE = 25
+IMPORT_CHUNK_MAX_SIZE = 1000
+IMPORT_CHUNK_DEFAULT_SIZE = 100
+IMPORT_CHUNK_REFERENCE_COLUMNS = 50
+IMPORT_CHUNK_TARGET_SECONDS = 10
+IMPORT_CHUNK_MIN_TASKS = 4
+IMPORT_CHUNK_MAX_TASKS = 500
+# Task locks (seed.decorators.lock_and_track) expire after LOCK_TIMEOUT
+# seconds unless renewed by the running task every LOCK_HEARTBEAT_SECONDS.
+# A task finding its lock held waits up to LOCK_WAIT_SECONDS for it.
+LOCK_TIMEOUT = 60
+LOCK_HEARTBEAT_SECONDS = 20
+LOCK_WAIT_SECONDS = 0
+
+
 # Matching Settings
 MATCH_MIN_THRESHOLD = 0.3
 MATCH_MED_THRESHOLD = 0.4
+# Compare buildings without an exact address match with similar canonical
+# buildings (see seed.utils.matching.fuzzy_blocking_keys); at most
+# MATCH_FUZZY_MAX_CANDIDATES share a block with a building. Their street
+# names must be at least MATCH_FUZZY_STREET_THRESHOLD similar.
+MATCH_FUZZY = False
+MATCH_FUZZY_MAX_CANDIDATES = 50
+MATCH_FUZZY_STREET_THRESHOLD = 0.8
 
 
 # django-passwords settings: passwords should requre alphnumberic and 8
@@ -5,6 +5,8 @@
 :author
 """
 
+import logging
+
 # django imports
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
@@ -21,6 +23,8 @@ from seed.lib.superperms.orgs.models import Organization
 
 USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', User)
 
+_log = logging.getLogger(__name__)
+
 # Audit Log types
 LOG = 0
 NOTE = 1
@@ -64,6 +68,68 @@ class AuditLogManager(ExpressionManager):
         )
 
 
+class AuditLogBuffer(object):
+    """Collects AuditLogs and inserts them with ``bulk_create``.
+
+    Logging every building of an import or a delete with
+    ``AuditLog.objects.create`` is one INSERT per building; the buffer
+    inserts ``batch_size`` of them at a time instead, defaulting to the
+    AUDIT_LOG_BATCH_SIZE setting. The rows are the same ones ``create``
+    would make.
+
+    Usage:
+        >>> with AuditLogBuffer() as audit_logs:
+        ...     audit_logs.log(user_id=1, content_object=canon, ...)
+
+    Entries still in the buffer are flushed on ``flush`` or when the
+    ``with`` block ends, even with an error: what they record has usually
+    been committed already.
+    """
+
+    def __init__(self, batch_size=None):
+        if batch_size is None:
+            batch_size = getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 1000)
+        self.batch_size = batch_size
+        self.entries = []
+
+    def log(self, content_object=None, **kwargs):
+        """Buffer an AuditLog, taking the same arguments as ``create``.
+
+        :param content_object: model instance the entry is about, or None.
+        """
+        if content_object is not None:
+            kwargs['content_type'] = ContentType.objects.get_for_model(
+                content_object
+            )
+            kwargs['object_id'] = content_object.pk
+        self.entries.append(AuditLog(**kwargs))
+        if len(self.entries) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the buffered entries."""
+        if self.entries:
+            AuditLog.objects.bulk_create(self.entries)
+            self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+            return
+
+        # Don't hide the error we're unwinding from.
+        try:
+            self.flush()
+        except Exception:
+            _log.exception('Could not save %s audit logs', len(self.entries))
+
+
 class AuditLog(TimeStampedModel):
     """An audit log of events and notes.
     Inherits ``created`` and ``modified`` from TimeStampedModel
@@ -21,7 +21,7 @@ from seed.factory import SEEDFactory
 from seed.models import CanonicalBuilding
 from seed.tests.util import FakeRequest
 
-from seed.audit_logs.models import AuditLog, LOG, NOTE
+from seed.audit_logs.models import AuditLog, AuditLogBuffer, LOG, NOTE
 
 
 class AuditLogModelTests(TestCase):
@@ -161,6 +161,54 @@ class AuditLogModelTests(TestCase):
             self.audit_log
         )
 
+    def test_buffer(self):
+        """AuditLogBuffer inserts its entries in batches"""
+        with AuditLogBuffer(batch_size=2) as audit_logs:
+            for i in range(3):
+                audit_logs.log(
+                    user=self.user,
+                    content_object=self.cb,
+                    action='create_building',
+                    action_note='buffered {0}'.format(i),
+                    organization_id=self.org.pk,
+                )
+            # the first two were flushed when the buffer filled up
+            self.assertEqual(len(audit_logs), 1)
+            self.assertEqual(
+                AuditLog.objects.filter(
+                    action_note__startswith='buffered'
+                ).count(),
+                2
+            )
+
+        logs = AuditLog.objects.filter(action_note__startswith='buffered')
+        self.assertEqual(logs.count(), 3)
+        for log in logs:
+            self.assertEqual(log.audit_type, LOG)
+            self.assertEqual(log.content_object, self.cb)
+            self.assertEqual(log.to_dict()['content_type'], 'canonicalbuilding')
+            self.assertIsNotNone(log.created)
+
+    def test_buffer_flushes_on_error(self):
+        """AuditLogBuffer still inserts its entries when the block fails"""
+        with self.assertRaises(ValueError):
+            with AuditLogBuffer() as audit_logs:
+                audit_logs.log(
+                    user=self.user,
+                    content_object=self.cb,
+                    action='create_building',
+                    action_note='buffered before error',
+                    organization_id=self.org.pk,
+                )
+                raise ValueError('matching failed')
+
+        self.assertEqual(
+            AuditLog.objects.filter(
+                action_note='buffered before error'
+            ).count(),
+            1
+        )
+
     def test_get_all_audit_logs_for_an_org(self):
         """gets all audit logs for an org"""
         audit_logs = AuditLog.objects.filter(organization=self.org)
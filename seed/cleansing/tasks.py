@@ -4,25 +4,30 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+import time
+
 from celery import shared_task
 from celery.utils.log import get_task_logger
 from models import Cleansing
 from seed.decorators import get_prog_key
 from seed.utils.cache import set_cache
+from seed.utils.chunks import record_chunk_cost
 from seed.models import BuildingSnapshot
 
 logger = get_task_logger(__name__)
 
 
 @shared_task
-def cleanse_data_chunk(ids, file_pk, increment):
+def cleanse_data_chunk(ids, file_pk, increment, cost_key=None):
     """
 
     :param ids: list of primary key ids to process
     :param file_pk: import file primary key
     :param increment: currently unused, but needed because of the special method that appends this onto the function  # NOQA
+    :param cost_key: (optional) cache key to record the chunk's per-row cost under
     :return: None
     """
+    start = time.time()
 
     # get the db objects based on the ids
     qs = BuildingSnapshot.objects.filter(id__in=ids).iterator()
@@ -30,6 +35,7 @@ def cleanse_data_chunk(ids, file_pk, increment):
     c = Cleansing()
     c.cleanse(qs)
     c.save_to_cache(file_pk)
+    record_chunk_cost(cost_key, len(ids), time.time() - start)
 
 
 @shared_task
@@ -5,17 +5,32 @@
 :author
 """
 import json
+import logging
+import threading
+import time
 
 from functools import wraps
 
+from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse
 
-from seed.utils.cache import make_key, lock_cache, unlock_cache, get_lock
+from seed.utils.cache import (
+    make_key,
+    acquire_lock,
+    get_cache_raw,
+    increment_counter,
+    release_lock,
+    renew_lock,
+)
 
 SEED_CACHE_PREFIX = 'SEED:{0}'
 LOCK_CACHE_PREFIX = SEED_CACHE_PREFIX + ':LOCK'
+LOCK_STATS_CACHE_PREFIX = SEED_CACHE_PREFIX + ':LOCKSTATS'
 PROGRESS_CACHE_PREFIX = SEED_CACHE_PREFIX + ':PROG'
+LOCK_STATS = ('acquired', 'contended', 'wait_ms')
+
+_log = logging.getLogger(__name__)
 
 FORMAT_TYPES = {
     'application/json': lambda response: json.dumps(response, cls=DjangoJSONEncoder),
@@ -43,8 +58,78 @@ def get_prog_key(func_name, import_file_pk):
     )
 
 
+def _get_lock_stats_key(func_name, stat):
+    return make_key(
+        '{0}:{1}'.format(LOCK_STATS_CACHE_PREFIX.format(func_name), stat)
+    )
+
+
+def get_lock_stats(func_name):
+    """Return how often a ``lock_and_track`` task took or waited for its lock.
+
+    :param func_name: str, name of the decorated function.
+    :returns: dict, {'acquired': int, 'contended': int, 'wait_ms': int}.
+        ``contended`` counts calls that found the lock held, whether or not
+        they got it after waiting; ``wait_ms`` is the total time they spent
+        waiting.
+    """
+    return dict(
+        (stat, get_cache_raw(_get_lock_stats_key(func_name, stat), 0))
+        for stat in LOCK_STATS
+    )
+
+
+class LockHeartbeat(threading.Thread):
+    """Keeps renewing a lock until stopped, so long tasks don't outlive it."""
+
+    def __init__(self, lock_key, token, timeout, interval):
+        super(LockHeartbeat, self).__init__()
+        self.daemon = True
+        self.lock_key = lock_key
+        self.token = token
+        self.timeout = timeout
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            if not renew_lock(self.lock_key, self.token, self.timeout):
+                _log.warning('lost lock {0}'.format(self.lock_key))
+                return
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _acquire_lock(func_name, lock_key, timeout):
+    """Take the lock, waiting up to LOCK_WAIT_SECONDS; record stats."""
+    wait = getattr(settings, 'LOCK_WAIT_SECONDS', 0)
+    poll = getattr(settings, 'LOCK_POLL_SECONDS', 0.5)
+    start = time.time()
+    token = acquire_lock(lock_key, timeout)
+    if token is None:
+        increment_counter(_get_lock_stats_key(func_name, 'contended'))
+        while token is None and time.time() - start < wait:
+            time.sleep(poll)
+            token = acquire_lock(lock_key, timeout)
+        increment_counter(
+            _get_lock_stats_key(func_name, 'wait_ms'),
+            int((time.time() - start) * 1000)
+        )
+    if token is not None:
+        increment_counter(_get_lock_stats_key(func_name, 'acquired'))
+
+    return token
+
+
 def lock_and_track(fn, *args, **kwargs):
-    """Decorator to lock tasks to single executor and provide progress url."""
+    """Decorator to lock tasks to single executor and provide progress url.
+
+    The lock is taken with an atomic add and expires after LOCK_TIMEOUT
+    seconds, unless renewed; it is renewed every LOCK_HEARTBEAT_SECONDS
+    while ``fn`` runs.
+    """
     func_name = fn.__name__
 
     @wraps(fn)
@@ -52,18 +137,24 @@ def lock_and_track(fn, *args, **kwargs):
         """Lock and return progress url for updates."""
         lock_key = _get_lock_key(func_name, import_file_pk)
         prog_key = get_prog_key(func_name, import_file_pk)
-        is_locked = get_lock(lock_key)
+        timeout = getattr(settings, 'LOCK_TIMEOUT', 60)
+        token = _acquire_lock(func_name, lock_key, timeout)
         # If we're already processing a given task, don't proceed.
-        if is_locked:
+        if token is None:
+            _log.info('{0} is locked for {1}'.format(func_name, import_file_pk))
             return {'error': 'locked'}
 
-        # Otherwise, set the lock for 1 minute.
-        lock_cache(lock_key)
+        heartbeat = LockHeartbeat(
+            lock_key, token, timeout,
+            getattr(settings, 'LOCK_HEARTBEAT_SECONDS', timeout / 3.0)
+        )
+        heartbeat.start()
         try:
             response = fn(import_file_pk, *args, **kwargs)
         finally:
             # Unset our lock
-            unlock_cache(lock_key)
+            heartbeat.stop()
+            release_lock(lock_key, token)
 
         # If our response is a dict, add our progress URL to it.
         if isinstance(response, dict):
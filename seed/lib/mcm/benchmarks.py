@@ -0,0 +1,85 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+
+Compare row-by-row and column-wise cleaning of a mapped chunk.
+
+Usage:
+    python -m seed.lib.mcm.benchmarks [rows] [repeat]
+"""
+import random
+import sys
+import timeit
+
+from seed.lib.mcm import cleaners, mapper
+
+
+SCHEMA = {'types': {
+    'gross_floor_area': 'float',
+    'site_eui': 'float',
+    'year_ending': 'date',
+}}
+
+MAPPING = {
+    u'Property Name': u'property_name',
+    u'Address': u'address_line_1',
+    u'Gross Floor Area': u'gross_floor_area',
+    u'Site EUI': u'site_eui',
+    u'Year Ending': u'year_ending',
+}
+
+
+class BenchmarkModel(object):
+    pass
+
+
+def make_rows(count, seed=0):
+    """Build ``count`` fake rows that look like a Portfolio Manager export."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        rows.append({
+            u'Property Name': u'Building {0}'.format(i % 250),
+            u'Address': u'{0} Main St.'.format(rng.randint(1, 5000)),
+            u'Gross Floor Area': rng.choice(
+                [u'1,200', u'35,000.5', u'N/A', u'{0}'.format(i)]
+            ),
+            u'Site EUI': rng.choice([u'82.1', u'Not Available', u'']),
+            u'Year Ending': rng.choice([u'12/31/2013', u'12/31/2014']),
+            u'Notes': rng.choice([u'n/a', u'Not Applicable', u'See file']),
+        })
+
+    return rows
+
+
+def main(argv=None):
+    argv = argv or sys.argv[1:]
+    count = int(argv[0]) if argv else 1000
+    repeat = int(argv[1]) if len(argv) > 1 else 3
+    rows = make_rows(count)
+    cleaner = cleaners.Cleaner(SCHEMA)
+
+    def by_row():
+        return [
+            mapper.map_row(row, MAPPING, BenchmarkModel, cleaner=cleaner)
+            for row in rows
+        ]
+
+    def by_column():
+        return mapper.map_rows(rows, MAPPING, BenchmarkModel, cleaner=cleaner)
+
+    if [m.__dict__ for m in by_row()] != [m.__dict__ for m in by_column()]:
+        raise AssertionError('Row and column cleaning disagree.')
+
+    row_time = min(timeit.repeat(by_row, number=1, repeat=repeat))
+    column_time = min(timeit.repeat(by_column, number=1, repeat=repeat))
+    print 'rows:        {0}'.format(count)
+    print 'map_row:     {0:.3f}s'.format(row_time)
+    print 'map_rows:    {0:.3f}s'.format(column_time)
+    print 'speedup:     {0:.1f}x'.format(row_time / column_time)
+
+
+if __name__ == '__main__':
+    main()
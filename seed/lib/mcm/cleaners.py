@@ -17,6 +17,12 @@ BOOL_SYNONYMS = (u'true', u'yes', u'y', u'1')
 PUNCT_REGEX = re.compile('[{0}]'.format(
     re.escape(string.punctuation.replace('.', '').replace('-', '')))
 )
+NONE_SYNONYM_SET = frozenset(NONE_SYNONYMS)
+# ``fuzzy_in_set`` needs a Jaro-Winkler score of at least .96, which two
+# strings can only reach if the shorter one is at least ~70% as long as the
+# longer one. Anything outside these (padded) bounds can't be a synonym.
+NONE_SYNONYM_MIN_LEN = int(min(map(len, NONE_SYNONYMS)) * 0.6)
+NONE_SYNONYM_MAX_LEN = int(max(map(len, NONE_SYNONYMS)) / 0.6) + 1
 
 
 def default_cleaner(value, *args):
@@ -27,6 +33,31 @@ def default_cleaner(value, *args):
     return value
 
 
+def _could_be_none_synonym(length):
+    """Could a string of ``length`` fuzzy match any of ``NONE_SYNONYMS``?"""
+    if length < NONE_SYNONYM_MIN_LEN or length > NONE_SYNONYM_MAX_LEN:
+        return False
+    for synonym in NONE_SYNONYMS:
+        shorter, longer = sorted((length, len(synonym)))
+        if shorter >= longer * 0.6:
+            return True
+    return False
+
+
+def fast_default_cleaner(value, *args):
+    """Same result as ``default_cleaner``, skipping the fuzzy match when an
+    exact match or the string lengths already decide it."""
+    if isinstance(value, unicode):
+        lowered = value.lower()
+        if lowered in NONE_SYNONYM_SET:
+            return None
+        if not _could_be_none_synonym(len(lowered)):
+            return value
+        if fuzzy_in_set(lowered, NONE_SYNONYMS):
+            return None
+    return value
+
+
 def float_cleaner(value, *args):
     """Try to clean value, coerce it into a float.
     Usage:
@@ -104,14 +135,58 @@ class Cleaner(object):
         self.date_columns = filter(
             lambda x: self.schema[x] == u'date', self.schema
         )
+        # Sets for lookups; the lists above stay for callers that use them.
+        self._float_columns = frozenset(self.float_columns)
+        self._date_columns = frozenset(self.date_columns)
+
+    def _type_cleaner(self, column_name):
+        """Return the type-specific cleaner for column_name, if any."""
+        if column_name in self._float_columns:
+            return float_cleaner
+
+        if column_name in self._date_columns:
+            return date_cleaner
 
     def clean_value(self, value, column_name):
         """Clean the value, based on characteristics of its column_name."""
         value = default_cleaner(value)
-        if column_name in self.float_columns:
-            return float_cleaner(value)
+        type_cleaner = self._type_cleaner(column_name)
+        if type_cleaner:
+            return type_cleaner(value)
+
+        return value
 
-        if column_name in self.date_columns:
-            return date_cleaner(value)
+    def clean_column(self, values, column_name):
+        """Clean every value of one column.
+
+        Gives the same results as calling ``clean_value`` on each value, but
+        each distinct value is only cleaned once per call.
+
+        :param values: list of raw values, all from the same column.
+        :param column_name: str, the column name as ``clean_value`` takes it.
+        :rtype: list of cleaned values, in the same order as ``values``.
+
+        """
+        type_cleaner = self._type_cleaner(column_name)
+        seen = {}
+        cleaned = []
+        for value in values:
+            # Key on type too, so that e.g. 1 and 1.0 aren't conflated.
+            key = (type(value), value)
+            try:
+                result = seen[key]
+            except KeyError:
+                result = seen[key] = self._clean_one(value, type_cleaner)
+            except TypeError:
+                # Unhashable value, clean it on its own.
+                result = self._clean_one(value, type_cleaner)
+            cleaned.append(result)
+
+        return cleaned
+
+    def _clean_one(self, value, type_cleaner):
+        value = fast_default_cleaner(value)
+        if type_cleaner:
+            return type_cleaner(value)
 
         return value
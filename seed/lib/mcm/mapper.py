@@ -15,12 +15,15 @@ def build_column_mapping(
     dest_columns,
     previous_mapping=None,
     map_args=None,
-    thresh=None
+    thresh=None,
+    index=None
 ):
     """Build a probabalistic mapping structure for mapping raw to dest.
 
     :param raw_columns: list of str. The column names we're trying to map.
     :param dest_columns: list of str. The columns we're mapping to.
+    :param index: (optional) ``matchers.CandidateIndex`` built from
+        ``dest_columns``, used instead of scoring every dest column.
     :param previous_mapping: callable. Used to return the previous mapping
         for a given field.
 
@@ -51,9 +54,12 @@ def build_column_mapping(
         # blank columns with conf of 100 since a conf of 100 signifies the user
         # has saved that mapping.
         if not result and result is not None and conf != 100:
-            best_match, conf = matchers.best_match(
-                raw, dest_columns, top_n=1
-            )[0]
+            if index is not None:
+                best_match, conf = index.best_match(raw, top_n=1)[0]
+            else:
+                best_match, conf = matchers.best_match(
+                    raw, dest_columns, top_n=1
+                )[0]
             if conf > thresh:
                 result = best_match
             else:
@@ -94,7 +100,20 @@ def _concat_values(concat_columns, column_values, delimiter):
     return delimiter.join(values) or None
 
 
-def apply_column_value(item, value, model, mapping, cleaner, apply_func=None):
+def _cleaner_column_name(item, mapping, cleaner):
+    """Return the column name ``cleaner`` should use for ``item``'s values."""
+    column_name = item
+    if item not in (cleaner.float_columns or cleaner.date_columns):
+        # Try using a reverse mapping for dynamic maps;
+        # default to row name if it's not mapped
+        column_name = mapping.get(item, column_name)
+
+    return column_name
+
+
+def apply_column_value(
+    item, value, model, mapping, cleaner, apply_func=None, is_clean=False
+):
     """Set the column value as the target attr on our model.
 
     :param item: str, the column name as the mapping understands it.
@@ -103,16 +122,14 @@ def apply_column_value(item, value, model, mapping, cleaner, apply_func=None):
     :param mapping: dict, the mapping of row data to attribute data.
     :param cleaner: runnable, something to clean data values.
     :param apply: (optional), function to apply value to our model.
+    :param is_clean: (optional) bool, value has already been cleaned.
     :rtype: model inst
 
     """
-    column_name = item
-    if cleaner:
-        if item not in (cleaner.float_columns or cleaner.date_columns):
-            # Try using a reverse mapping for dynamic maps;
-            # default to row name if it's not mapped
-            column_name = mapping.get(item, column_name)
-
+    if is_clean:
+        cleaned_value = value
+    elif cleaner:
+        column_name = _cleaner_column_name(item, mapping, cleaner)
         cleaned_value = cleaner.clean_value(value, column_name)
     else:
         cleaned_value = default_cleaner(value)
@@ -161,6 +178,77 @@ def map_row(row, mapping, model_class, cleaner=None, concat=None, **kwargs):
     :rtype: model_inst, with mapped data attributes; ready to save.
 
     """
+    return _map_row(
+        row, None, mapping, model_class, cleaner=cleaner, concat=concat,
+        **kwargs
+    )
+
+
+def _clean_columns(rows, mapping, cleaner):
+    """Clean a chunk of rows column by column.
+
+    :rtype: list of dict, the cleaned values of each row. Values of None
+        are left out, as ``map_row`` doesn't set them.
+
+    """
+    columns = {}
+    for index, row in enumerate(rows):
+        for item, value in row.items():
+            if value != None:
+                columns.setdefault(item, ([], []))
+                columns[item][0].append(index)
+                columns[item][1].append(value)
+
+    cleaned_rows = [{} for _ in rows]
+    for item, (indexes, values) in columns.items():
+        column_name = _cleaner_column_name(item, mapping, cleaner)
+        cleaned = cleaner.clean_column(values, column_name)
+        for index, value in zip(indexes, cleaned):
+            cleaned_rows[index][item] = value
+
+    return cleaned_rows
+
+
+def map_rows(rows, mapping, model_class, cleaner=None, concat=None, **kwargs):
+    """Apply mapping to a chunk of rows, cleaning one column at a time.
+
+    Takes the same arguments as ``map_row``, but with a list of rows, and
+    gives the same models as calling ``map_row`` on each of them. With a
+    cleaner, each column's values go through ``Cleaner.clean_column`` once
+    instead of being cleaned cell by cell.
+
+    :param rows: list of dict, parsed row data from csv.
+    :rtype: list of model_inst, in the same order as ``rows``.
+
+    """
+    rows = list(rows)
+    if not cleaner:
+        return [
+            map_row(row, mapping, model_class, concat=concat, **kwargs)
+            for row in rows
+        ]
+
+    if concat:
+        # ``map_row`` adds these on its first row; do it before cleaning so
+        # every row resolves column names against the same mapping.
+        for c in _set_default_concat_config(concat):
+            mapping[c['target']] = c['target']
+
+    cleaned_rows = _clean_columns(rows, mapping, cleaner)
+    return [
+        _map_row(
+            row, cleaned_row, mapping, model_class, cleaner=cleaner,
+            concat=concat, **kwargs
+        )
+        for row, cleaned_row in zip(rows, cleaned_rows)
+    ]
+
+
+def _map_row(
+    row, cleaned_row, mapping, model_class, cleaner=None, concat=None,
+    **kwargs
+):
+    """Map one row, taking already cleaned values from ``cleaned_row``."""
     initial_data = kwargs.get('initial_data', None)
     apply_columns = kwargs.get('apply_columns', [])
     apply_func = kwargs.get('apply_func', None)
@@ -187,9 +275,12 @@ def map_row(row, mapping, model_class, cleaner=None, concat=None, **kwargs):
 
         # Save the value if is is not None, keep empty fields.
         if value != None:
+            is_clean = cleaned_row is not None
+            if is_clean:
+                value = cleaned_row[item]
             model = apply_column_value(
                 item, value, model, mapping, cleaner,
-                apply_func=send_apply_func
+                apply_func=send_apply_func, is_clean=is_clean
             )
 
     if concat and [c['concat_values'] for c in concat]:
@@ -4,8 +4,29 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+from collections import OrderedDict, defaultdict
+import heapq
+
 import jellyfish
 
+# Bound on the number of (value, ontology, threshold) lookups we remember.
+FUZZY_CACHE_SIZE = 10000
+# Number of categories a CandidateIndex scores with Jaro-Winkler per lookup.
+SHORTLIST_SIZE = 50
+
+_fuzzy_cache = OrderedDict()
+_fuzzy_stats = {'hits': 0, 'misses': 0}
+
+
+def _normalize(s):
+    return s.encode('ascii', 'replace').upper()
+
+
+def _trigrams(s):
+    """Return the set of character trigrams of s, padded with spaces."""
+    padded = ' ' + s + ' '
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
 
 def best_match(s, categories, top_n=5):
     """Return the top N best matches from your categories with the best match
@@ -22,8 +43,7 @@ def best_match(s, categories, top_n=5):
     scores = []
     for cat in categories:
         scores.append((cat, jellyfish.jaro_winkler(
-            s.encode('ascii', 'replace').upper(),
-            cat.encode('ascii', 'replace').upper()
+            _normalize(s), _normalize(cat)
         )))
 
     scores = sorted(scores, key=lambda x: x[1])
@@ -34,10 +54,134 @@ def best_match(s, categories, top_n=5):
     return scores
 
 
-def fuzzy_in_set(column_name, ontology, percent_confidence=95):
-    """Return True if column_name is in the ontology."""
+def _fuzzy_in_set(column_name, ontology, percent_confidence):
+    if column_name in ontology:
+        # An exact match always scores 100.
+        return 100 > percent_confidence
+
     match, percent = best_match(
         column_name, ontology, top_n=1
     )[0]
 
     return percent > percent_confidence
+
+
+def fuzzy_in_set(column_name, ontology, percent_confidence=95):
+    """Return True if column_name is in the ontology.
+
+    Results are memoised in a LRU cache of ``FUZZY_CACHE_SIZE`` entries,
+    since the same values get checked against the same small ontologies
+    over and over; see ``fuzzy_cache_info``.
+    """
+    if not isinstance(ontology, tuple):
+        ontology = tuple(ontology)
+    key = (column_name, ontology, percent_confidence)
+    try:
+        result = _fuzzy_cache.pop(key)
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable, don't cache.
+        return _fuzzy_in_set(column_name, ontology, percent_confidence)
+    else:
+        _fuzzy_stats['hits'] += 1
+        # Re-insert as the most recently used entry.
+        _fuzzy_cache[key] = result
+        return result
+
+    _fuzzy_stats['misses'] += 1
+    result = _fuzzy_in_set(column_name, ontology, percent_confidence)
+    _fuzzy_cache[key] = result
+    while len(_fuzzy_cache) > FUZZY_CACHE_SIZE:
+        _fuzzy_cache.popitem(last=False)
+
+    return result
+
+
+def fuzzy_cache_info():
+    """Return hit/miss counters and size of the ``fuzzy_in_set`` cache.
+
+    :returns: dict, {'hits': int, 'misses': int, 'size': int, 'maxsize': int}
+    """
+    return {
+        'hits': _fuzzy_stats['hits'],
+        'misses': _fuzzy_stats['misses'],
+        'size': len(_fuzzy_cache),
+        'maxsize': FUZZY_CACHE_SIZE,
+    }
+
+
+def clear_fuzzy_cache():
+    """Empty the ``fuzzy_in_set`` cache and reset its counters."""
+    _fuzzy_cache.clear()
+    _fuzzy_stats['hits'] = 0
+    _fuzzy_stats['misses'] = 0
+
+
+class CandidateIndex(object):
+    """Prebuilt index for repeated ``best_match`` calls on one category list.
+
+    Categories are indexed by their character trigrams. A lookup only runs
+    Jaro-Winkler against the ``shortlist_size`` categories sharing the most
+    trigrams with the value, or against every category when none share any.
+
+    Usage:
+            >>> index = CandidateIndex(['Michigan', 'Ohio', 'Illinois'])
+            >>> index.best_match('ilinois', 1)
+            [('Illinois', 96)]
+
+    """
+
+    def __init__(self, categories, shortlist_size=SHORTLIST_SIZE):
+        self.categories = list(categories)
+        self.shortlist_size = shortlist_size
+        self._normalized = []
+        self._gram_counts = []
+        self._postings = defaultdict(list)
+        for position, cat in enumerate(self.categories):
+            normalized = _normalize(cat)
+            grams = _trigrams(normalized)
+            self._normalized.append(normalized)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(position)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def shortlist(self, normalized):
+        """Return the positions of the categories worth scoring."""
+        grams = _trigrams(normalized)
+        shared = defaultdict(int)
+        for gram in grams:
+            for position in self._postings.get(gram, ()):
+                shared[position] += 1
+
+        if not shared:
+            return range(len(self.categories))
+
+        # Dice coefficient, so long categories don't win on size alone.
+        def overlap(position):
+            return 2.0 * shared[position] / (
+                len(grams) + self._gram_counts[position]
+            )
+
+        return heapq.nlargest(self.shortlist_size, shared, key=overlap)
+
+    def best_match(self, s, top_n=5):
+        """Same as ``best_match(s, categories, top_n)``, on the shortlist.
+
+        :param s: str value to find best match
+        :param top_n: number of matches to return
+        :returns: list of tuples (guess, percentage)
+        """
+        normalized = _normalize(s)
+        scores = [
+            (jellyfish.jaro_winkler(normalized, self._normalized[p]), p)
+            for p in self.shortlist(normalized)
+        ]
+        # Ties go to the later category, as they do in ``best_match``.
+        return [
+            (self.categories[p], int(score * 100))
+            for score, p in heapq.nlargest(top_n, scores)
+        ]
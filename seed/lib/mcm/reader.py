@@ -10,10 +10,12 @@ out of CSV files. Fuzzy matches, application to data models happens
 elsewhere.
 
 """
+import csv
 import mmap
 import operator
 import sys
 import unicodedata
+from itertools import islice
 
 from unicodecsv import DictReader, Sniffer
 from xlrd import xldate, XLRDError, open_workbook, empty_cell
@@ -45,11 +47,13 @@ class ExcelParser(object):
             # rows.next() will return the first row
     """
 
-    def __init__(self, excel_file, *args, **kwargs):
+    def __init__(self, excel_file, header_row=None, *args, **kwargs):
         self.cache_headers = []
         self.excel_file = excel_file
         self.sheet = self._get_sheet(excel_file)
-        self.header_row = self._get_header_row(self.sheet)
+        if header_row is None:
+            header_row = self._get_header_row(self.sheet)
+        self.header_row = header_row
         self.excelreader = self.XLSDictReader(self.sheet, self.header_row)
 
     def _get_sheet(self, f, sheet_index=0):
@@ -108,12 +112,14 @@ class ExcelParser(object):
 
         return item.value
 
-    def XLSDictReader(self, sheet, header_row=0):
+    def XLSDictReader(self, sheet, header_row=0, start=0, stop=None):
         """returns a generator yeilding a dict per row from the XLS/XLSX file
         https://gist.github.com/mdellavo/639082
 
         :param sheet: xlrd Sheet
         :param header_row: the row index to start with
+        :param start: (optional) int, index of the first data row to yield
+        :param stop: (optional) int, index of the data row to stop before
         :returns: Generator yeilding a row as Dict
         """
 
@@ -134,9 +140,13 @@ class ExcelParser(object):
         # return a generator, using yield here wouldn't run until the first
         # usage causing the try/except in MCMParser _get_reader to return
         # ExcelReader for csv files
+        last_row = sheet.nrows
+        if stop is not None:
+            last_row = min(last_row, header_row + 1 + stop)
+
         return (
             dict(item(i, j) for j in range(sheet.ncols))
-            for i in range(header_row + 1, sheet.nrows)
+            for i in range(header_row + 1 + start, last_row)
         )
 
     def next(self):
@@ -156,6 +166,28 @@ class ExcelParser(object):
         self.excel_file.seek(0)
         self.excelreader = self.XLSDictReader(self.sheet, self.header_row)
 
+    def chunk_positions(self, chunk_size):
+        """Describe the data rows as ``(row index, row count)`` chunks.
+
+        :param chunk_size: int, maximum number of rows per chunk.
+        :returns: list of tuples, each one can be passed to ``read_rows``.
+        """
+        num_rows = max(self.sheet.nrows - self.header_row - 1, 0)
+        return [
+            (start, min(chunk_size, num_rows - start))
+            for start in range(0, num_rows, chunk_size)
+        ]
+
+    def read_rows(self, position, count):
+        """Return an iterator over ``count`` rows starting at ``position``."""
+        return self.XLSDictReader(
+            self.sheet, self.header_row, position, position + count
+        )
+
+    def layout(self):
+        """What ``read_layout_rows`` needs to skip finding the header row."""
+        return {'format': 'excel', 'header_row': self.header_row}
+
     def num_columns(self):
         """gets the number of columns for the file"""
         return self.sheet.ncols
@@ -249,6 +281,50 @@ class CSVParser(object):
         # skip header row
         self.next().next()
 
+    def chunk_positions(self, chunk_size):
+        """Describe the data rows as ``(byte offset, row count)`` chunks.
+
+        Lines are pulled with ``readline`` rather than file iteration so that
+        ``tell()`` is accurate at every row boundary, quoted newlines included.
+
+        :param chunk_size: int, maximum number of rows per chunk.
+        :returns: list of tuples, each one can be passed to ``read_rows``.
+        """
+        self.csvfile.seek(0)
+        rows = csv.reader(iter(self.csvfile.readline, ''))
+        # skip header row
+        rows.next()
+
+        positions = []
+        position, count = self.csvfile.tell(), 0
+        for row in rows:
+            # DictReader skips blank lines, so we don't count them either.
+            if not row:
+                continue
+            count += 1
+            if count == chunk_size:
+                positions.append((position, count))
+                position, count = self.csvfile.tell(), 0
+
+        if count:
+            positions.append((position, count))
+
+        self.seek_to_beginning()
+        return positions
+
+    def read_rows(self, position, count):
+        """Return an iterator over ``count`` rows starting at byte ``position``."""
+        self.csvfile.seek(position)
+        csvreader = DictReader(
+            self.csvfile, fieldnames=self.csvreader.fieldnames, errors='replace'
+        )
+        csvreader.unicode_fieldnames = self.csvreader.unicode_fieldnames
+        return islice(csvreader, count)
+
+    def layout(self):
+        """What ``read_layout_rows`` needs to skip sniffing the file."""
+        return {'format': 'csv', 'headers': self.headers()}
+
     def num_columns(self):
         """gets the number of columns for the file"""
         return len(self.csvreader.unicode_fieldnames)
@@ -330,6 +406,18 @@ class MCMParser(object):
         """calls the reader's seek_to_beginning"""
         return self.reader.seek_to_beginning()
 
+    def chunk_positions(self, chunk_size):
+        """calls the reader's chunk_positions"""
+        return self.reader.chunk_positions(chunk_size)
+
+    def read_rows(self, position, count):
+        """calls the reader's read_rows"""
+        return self.reader.read_rows(position, count)
+
+    def layout(self):
+        """calls the reader's layout"""
+        return self.reader.layout()
+
     def num_columns(self):
         """returns the number of columns of the file"""
         return self.reader.num_columns()
@@ -339,6 +427,28 @@ class MCMParser(object):
         return self.reader.headers()
 
 
+def read_layout_rows(f, layout, position, count):
+    """Read a chunk of rows without parsing the file's layout again.
+
+    For other processes reading chunks of a file one ``MCMParser`` has
+    already looked at: the layout saves sniffing the dialect and looking
+    for the header row once per chunk.
+
+    :param f: open file.
+    :param layout: dict, as returned by ``MCMParser.layout``.
+    :param position: int, as returned by ``MCMParser.chunk_positions``.
+    :param count: int, number of rows to read.
+    :returns: iterator of row dicts, as from ``MCMParser.read_rows``.
+    """
+    if layout['format'] == 'excel':
+        parser = ExcelParser(f, header_row=layout['header_row'])
+        return parser.read_rows(position, count)
+
+    f.seek(position)
+    csvreader = DictReader(f, fieldnames=layout['headers'], errors='replace')
+    return islice(csvreader, count)
+
+
 def main():
     """Just some contrived test code."""
     from seed.lib.mcm.mappings import espm
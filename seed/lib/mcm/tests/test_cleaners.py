@@ -87,3 +87,28 @@ class TestCleaners(TestCase):
 
         self.assertEqual(self.cleaner.date_columns, ['heading2'])
         self.assertEqual(self.cleaner.float_columns, ['heading_data1'])
+
+    def test_clean_column(self):
+        """Column-wise cleaning gives the same values as cell by cell."""
+        values = [
+            u'N/A', u'n/a', u'N/A ', u'Not Availble', u'not applicable',
+            u'0.7', u'0.7', u'12,090', u'', u'wut', u'2/12/2012', 1, 1.0,
+            Decimal('20.00'), datetime.date(2012, 2, 12), u'Whatever',
+            u'some much longer value that is not applicable', 'n/a', [u'x'],
+        ]
+        for column_name in (u'heading1', u'heading2', u'heading_data1'):
+            if column_name == u'heading_data1':
+                # float_cleaner raises on dates and lists.
+                column = values[:-6] + values[-3:-1]
+            else:
+                column = values
+            expected = [
+                self.cleaner.clean_value(value, column_name)
+                for value in column
+            ]
+            cleaned = self.cleaner.clean_column(column, column_name)
+            self.assertEqual(cleaned, expected)
+            self.assertEqual(
+                [type(value) for value in cleaned],
+                [type(value) for value in expected]
+            )
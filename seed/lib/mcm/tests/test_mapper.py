@@ -7,7 +7,7 @@
 import copy
 from unittest import TestCase
 
-from seed.lib.mcm import cleaners, mapper
+from seed.lib.mcm import cleaners, mapper, matchers
 from mcm import mapper
 from mcm.tests.utils import FakeModel
 
@@ -110,6 +110,15 @@ class TestMapper(TestCase):
 
         self.assertDictEqual(dyn_mapping, self.expected)
 
+    def test_build_column_mapping_w_index(self):
+        """Using a CandidateIndex gives the same mapping."""
+        index = matchers.CandidateIndex(self.dest_columns)
+        dyn_mapping = mapper.build_column_mapping(
+            self.raw_columns, self.dest_columns, index=index
+        )
+
+        self.assertDictEqual(dyn_mapping, self.expected)
+
     def test_build_column_mapping_w_callable(self):
         """Callable result at the begining of the list."""
         expected = copy.deepcopy(self.expected)
@@ -247,6 +256,59 @@ class TestMapper(TestCase):
 
         self.assertEqual(modified_model.property_id, 234235423.0)
 
+    def test_map_rows(self):
+        """map_rows gives the same models as map_row on each row."""
+        fake_rows = [
+            {
+                u'Property Id': u'234,235,423',
+                u'heading1': u'value1',
+                u'Not Mapped': u'N/A',
+                u'street number': u'1232',
+                u'street name': u'Fanfare St.',
+            },
+            {
+                u'Property Id': u'234,235,423',
+                u'heading1': u'Not Available',
+                u'Not Mapped': None,
+                u'street number': u'1233',
+                u'street name': u'Fanfare St.',
+            },
+            {
+                u'Property Id': u'wut',
+                u'heading1': None,
+                u'street number': u'1234',
+                u'street name': u'Fanfare St.',
+            },
+        ]
+
+        def get_concat():
+            return [{
+                'target': 'address1',
+                'concat_columns': ['street number', 'street name'],
+            }]
+
+        expected_mapping = copy.deepcopy(self.fake_mapping)
+        expected = [
+            mapper.map_row(
+                row, expected_mapping, FakeModel,
+                cleaner=self.test_cleaner, concat=get_concat()
+            )
+            for row in fake_rows
+        ]
+        test_mapping = copy.deepcopy(self.fake_mapping)
+        models = mapper.map_rows(
+            fake_rows, test_mapping, FakeModel,
+            cleaner=self.test_cleaner, concat=get_concat()
+        )
+
+        self.assertEqual(len(models), len(expected))
+        for model, expected_model in zip(models, expected):
+            self.assertDictEqual(model.__dict__, expected_model.__dict__)
+        self.assertEqual(models[0].property_id, 234235423.0)
+        self.assertEqual(models[2].property_id, None)
+        self.assertEqual(models[1].address1, u'1233 Fanfare St.')
+        self.assertEqual(test_mapping, expected_mapping)
+
     def test_map_row_handle_unmapped_columns(self):
         """No KeyError when we check mappings for our column."""
         test_mapping = copy.deepcopy(self.fake_mapping)
@@ -95,3 +95,61 @@ class TestMatchers(TestCase):
         self.assertEqual(first_match[0], 'illinois')
         self.assertGreater(first_match[1], 90)
         self.assertLess(second_match[1], 90)
+
+    def test_fuzzy_in_set_cache(self):
+        """Repeated lookups are served from the cache."""
+        matchers.clear_fuzzy_cache()
+        self.assertTrue(matchers.fuzzy_in_set('ilinois', US_STATES, 90))
+        self.assertTrue(matchers.fuzzy_in_set('ilinois', US_STATES, 90))
+        self.assertFalse(matchers.fuzzy_in_set('ilinois', US_STATES, 98))
+        self.assertTrue(matchers.fuzzy_in_set('ohio', US_STATES))
+        self.assertFalse(matchers.fuzzy_in_set('ohio', US_STATES, 100))
+
+        info = matchers.fuzzy_cache_info()
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 4)
+        self.assertEqual(info['size'], 4)
+
+        matchers.clear_fuzzy_cache()
+        self.assertEqual(matchers.fuzzy_cache_info()['size'], 0)
+        self.assertEqual(matchers.fuzzy_cache_info()['hits'], 0)
+
+    def test_fuzzy_in_set_cache_is_bounded(self):
+        """The least recently used entries are evicted first."""
+        matchers.clear_fuzzy_cache()
+        old_size = matchers.FUZZY_CACHE_SIZE
+        matchers.FUZZY_CACHE_SIZE = 2
+        try:
+            matchers.fuzzy_in_set('ohio', US_STATES)
+            matchers.fuzzy_in_set('iowa', US_STATES)
+            matchers.fuzzy_in_set('ohio', US_STATES)
+            matchers.fuzzy_in_set('utah', US_STATES)
+            matchers.fuzzy_in_set('ohio', US_STATES)
+            matchers.fuzzy_in_set('iowa', US_STATES)
+        finally:
+            matchers.FUZZY_CACHE_SIZE = old_size
+
+        info = matchers.fuzzy_cache_info()
+        self.assertEqual(info['size'], 2)
+        self.assertEqual(info['hits'], 2)
+        self.assertEqual(info['misses'], 4)
+        matchers.clear_fuzzy_cache()
+
+    def test_candidate_index(self):
+        """The index finds the same best match as a full scan."""
+        index = matchers.CandidateIndex(US_STATES, shortlist_size=5)
+        for state in ['Ilinois', 'new yrok', 'Rhode Islande', 'wyoming']:
+            self.assertEqual(
+                index.best_match(state, top_n=1),
+                matchers.best_match(state, US_STATES, top_n=1)
+            )
+        self.assertEqual(len(index.best_match('Ilinois', top_n=3)), 3)
+
+    def test_candidate_index_without_shared_trigrams(self):
+        """Falls back to scoring every category."""
+        index = matchers.CandidateIndex(US_STATES)
+        self.assertEqual(len(index.shortlist('Q')), len(US_STATES))
+        self.assertEqual(
+            index.best_match('Q', top_n=1),
+            matchers.best_match('Q', US_STATES, top_n=1)
+        )
@@ -90,6 +90,34 @@ class TestMCMParserCSV(TestCase):
         # There's always at least one batch per file.
         self.assertEqual(self.total_callbacks, 1)
 
+    def test_read_rows_by_chunk_position(self):
+        """Reading each chunk descriptor yields the same rows as next()."""
+        expected = list(self.parser.next())
+        positions = self.parser.chunk_positions(2)
+        self.assertEqual([count for _, count in positions], [2, 1])
+
+        rows = []
+        for position, count in positions:
+            rows.extend(self.parser.read_rows(position, count))
+        self.assertEqual(rows, expected)
+
+    def test_read_layout_rows(self):
+        """Chunks read with the parser's layout match read_rows."""
+        positions = self.parser.chunk_positions(2)
+        expected = [
+            list(self.parser.read_rows(position, count))
+            for position, count in positions
+        ]
+        layout = self.parser.layout()
+
+        rows = []
+        for position, count in positions:
+            self.csv_f.seek(0)
+            rows.append(list(reader.read_layout_rows(
+                self.csv_f, layout, position, count
+            )))
+        self.assertEqual(rows, expected)
+
     def test_num_columns(self):
         self.assertEqual(self.parser.num_columns(), 250)
 
@@ -215,6 +243,34 @@ class TestMCMParserXLSX(TestCase):
             'Release Date'
         )
 
+    def test_read_rows_by_chunk_position(self):
+        """Reading each chunk descriptor yields the same rows as next()."""
+        expected = list(self.parser.next())
+        positions = self.parser.chunk_positions(2)
+        self.assertEqual([count for _, count in positions], [2, 1])
+
+        rows = []
+        for position, count in positions:
+            rows.extend(self.parser.read_rows(position, count))
+        self.assertEqual(rows, expected)
+
+    def test_read_layout_rows(self):
+        """Chunks read with the parser's layout match read_rows."""
+        positions = self.parser.chunk_positions(2)
+        expected = [
+            list(self.parser.read_rows(position, count))
+            for position, count in positions
+        ]
+        layout = self.parser.layout()
+
+        rows = []
+        for position, count in positions:
+            self.xlsx_f.seek(0)
+            rows.append(list(reader.read_layout_rows(
+                self.xlsx_f, layout, position, count
+            )))
+        self.assertEqual(rows, expected)
+
     def test_odd_date_format(self):
         """
         Regression test to handle excel date format issues. More info at:
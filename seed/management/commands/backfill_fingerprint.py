@@ -0,0 +1,55 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+"""
+Fill in BuildingSnapshot.fingerprint for snapshots saved before it existed,
+so that duplicate detection sees them. Safe to re-run; only snapshots
+without one are touched.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from seed.lib.mcm.utils import batch
+from seed.models import BuildingSnapshot
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    type='int',
+                    default=500,
+                    help='Number of snapshots to fingerprint per transaction.'),
+        make_option('--org',
+                    type='int',
+                    default=None,
+                    help='Only backfill snapshots of this super organization.'),
+    )
+    help = 'Populates fingerprint for existing building snapshots'
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        snapshots = BuildingSnapshot.objects.filter(fingerprint__isnull=True)
+        if options.get('org'):
+            snapshots = snapshots.filter(super_organization_id=options['org'])
+
+        pks = list(snapshots.values_list('pk', flat=True))
+        total = 0
+        for chunk in batch(pks, options['batch_size']):
+            with transaction.atomic():
+                for snapshot in BuildingSnapshot.objects.filter(pk__in=chunk):
+                    # Update just the one column; save() would bump modified.
+                    BuildingSnapshot.objects.filter(pk=snapshot.pk).update(
+                        fingerprint=snapshot.compute_fingerprint()
+                    )
+
+            total += len(chunk)
+            if verbosity > 1:
+                print 'Fingerprinted %s snapshots' % total
+
+        if verbosity > 0:
+            print 'Done, fingerprinted %s snapshots' % total
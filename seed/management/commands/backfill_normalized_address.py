@@ -0,0 +1,65 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+"""
+Fill in BuildingSnapshot.normalized_address for snapshots saved before it
+existed. Safe to re-run; only snapshots without one are touched.
+"""
+from collections import defaultdict
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from seed.lib.mcm.utils import batch
+from seed.models import BuildingSnapshot
+from seed.utils.address import normalize_address_str
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    type='int',
+                    default=1000,
+                    help='Number of snapshots to normalize per transaction.'),
+        make_option('--org',
+                    type='int',
+                    default=None,
+                    help='Only backfill snapshots of this super organization.'),
+    )
+    help = 'Populates normalized_address for existing building snapshots'
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        snapshots = BuildingSnapshot.objects.filter(
+            normalized_address__isnull=True,
+            address_line_1__isnull=False,
+        ).exclude(address_line_1='')
+        if options.get('org'):
+            snapshots = snapshots.filter(super_organization_id=options['org'])
+
+        rows = snapshots.values_list('pk', 'address_line_1').iterator()
+        total = 0
+        for chunk in batch(rows, options['batch_size']):
+            # One UPDATE per distinct address instead of one per snapshot.
+            by_address = defaultdict(list)
+            for pk, address in chunk:
+                normalized = normalize_address_str(address)
+                if normalized:
+                    by_address[normalized[:255]].append(pk)
+
+            with transaction.atomic():
+                for normalized, pks in by_address.items():
+                    BuildingSnapshot.objects.filter(pk__in=pks).update(
+                        normalized_address=normalized
+                    )
+
+            total += len(chunk)
+            if verbosity > 1:
+                print 'Normalized %s snapshots' % total
+
+        if verbosity > 0:
+            print 'Done, normalized %s snapshots' % total
@@ -0,0 +1,74 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+"""
+Check that every CanonicalBuilding's canonical_snapshot is the tip of its
+tree, and point it there when it isn't. Matching relies on the pointer to
+find tips without walking the tree.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from seed.models import CanonicalBuilding, find_canonical_tip
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run',
+                    action='store_true',
+                    default=False,
+                    help='Only report the canonical buildings that are off.'),
+        make_option('--org',
+                    type='int',
+                    default=None,
+                    help='Only check canonical buildings of this super organization.'),
+    )
+    help = 'Repairs canonical_snapshot pointers that are not at the tip'
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        dry_run = options.get('dry_run')
+        canons = CanonicalBuilding.objects.filter(active=True).select_related(
+            'canonical_snapshot'
+        )
+        if options.get('org'):
+            canons = canons.filter(
+                canonical_snapshot__super_organization_id=options['org']
+            )
+
+        checked = repaired = foreign = 0
+        for canon in canons.iterator():
+            checked += 1
+            tip = find_canonical_tip(canon)
+            if tip is not None and tip.canonical_building_id != canon.pk:
+                # The tip belongs to another building; that needs a human.
+                foreign += 1
+                if verbosity > 0:
+                    print 'Canonical building %s: tip %s belongs to %s' % (
+                        canon.pk, tip.pk, tip.canonical_building_id
+                    )
+                continue
+
+            tip_pk = tip.pk if tip is not None else None
+            if tip_pk == canon.canonical_snapshot_id:
+                continue
+
+            repaired += 1
+            if verbosity > 1:
+                print 'Canonical building %s: %s -> %s' % (
+                    canon.pk, canon.canonical_snapshot_id, tip_pk
+                )
+            if not dry_run:
+                CanonicalBuilding.objects.filter(pk=canon.pk).update(
+                    canonical_snapshot=tip
+                )
+
+        if verbosity > 0:
+            print '%s checked, %s %s, %s pointing at other buildings' % (
+                checked, repaired,
+                'to repair' if dry_run else 'repaired', foreign
+            )
@@ -50,11 +50,14 @@ def get_source_id(source_inst, attr):
     # painstakingly copy whatever the original reference to this field
     # out of the BS and into the BuildingAttributeVariant.
     if isinstance(source_inst, models.BuildingSnapshot):
-        source_inst = getattr(source_inst, '{0}_source'.format(attr))
+        # The source FK can only point at a BuildingSnapshot, so look at its
+        # id rather than fetching the row.
+        source_id = getattr(source_inst, '{0}_source_id'.format(attr), None)
+        source_class = models.BuildingSnapshot if source_id else type(None)
+    else:
+        source_class = source_inst.__class__
 
-    return getattr(
-        models, '{0}_SOURCE'.format(source_inst.__class__.__name__), default
-    )
+    return getattr(models, '{0}_SOURCE'.format(source_class.__name__), default)
 
 
 def merge_extra_data(b1, b2, default=None):
@@ -110,6 +113,40 @@ def merge_building(
     """
     default = default or b1
     match_type = match_type or models.SYSTEM_MATCH
+    changes = merge_building_attrs(
+        snapshot, b1, b2, can_attrs, default, save_variant
+    )
+    snapshot.match_type = match_type
+    snapshot.source_type = models.COMPOSITE_BS
+    canonical_building = models.get_or_create_canonical(b1, b2)
+    snapshot.canonical_building = canonical_building
+    snapshot.confidence = conf
+    snapshot.save()
+
+    canonical_building.canonical_snapshot = snapshot
+    canonical_building.save()
+    b1.children.add(snapshot)
+    b2.children.add(snapshot)
+
+    return snapshot, changes
+
+
+def merge_building_attrs(snapshot, b1, b2, can_attrs, default, on_variant):
+    """Set the merged attributes and extra_data of b1 and b2 on snapshot.
+
+    Nothing is saved here, so that ``merge_building`` and
+    ``models.save_snapshot_matches`` can share it.
+
+    :param snapshot: BuildingSnapshot model inst.
+    :param b1: BuildingSnapshot model inst. Left parent.
+    :param b2: BuildingSnapshot model inst. Right parent.
+    :param can_attrs: dict of dicts, {'attr_name': {'dataset1': 'value'...}}.
+    :param default: which dataset's value to default to.
+    :param on_variant: callable, called as ``on_variant(snapshot, attr,
+        values)`` for attributes that differ, e.g. ``save_variant``.
+    :returns: list of dicts, the changes made to the canonical building.
+
+    """
     changes = []
     for attr in can_attrs:
         # Do we have any differences between these fields?
@@ -123,7 +160,7 @@ def merge_building(
             # If we have more than one value for this field,
             # save each of the field options in the DB,
             # but opt for the default when there is a difference.
-            save_variant(snapshot, attr, can_attrs[attr])
+            on_variant(snapshot, attr, can_attrs[attr])
             attr_source = default
             attr_value = can_attrs[attr][default]
 
@@ -153,19 +190,8 @@ def merge_building(
     snapshot.extra_data, snapshot.extra_data_sources = merge_extra_data(
         b1, b2, default=default
     )
-    snapshot.match_type = match_type
-    snapshot.source_type = models.COMPOSITE_BS
-    canonical_building = models.get_or_create_canonical(b1, b2)
-    snapshot.canonical_building = canonical_building
-    snapshot.confidence = conf
-    snapshot.save()
 
-    canonical_building.canonical_snapshot = snapshot
-    canonical_building.save()
-    b1.children.add(snapshot)
-    b2.children.add(snapshot)
-
-    return snapshot, changes
+    return changes
 
 
 def get_building_attrs(data_set_buildings):
@@ -69,3 +69,10 @@ FIRST_PASS_ASSESSEDBUILDING = (
     ((build_address_q, 'address_line_1'), 'address_line_1'),
     ('address_line_2', 'address_line_2'),
 )
+
+# Mapping between snapshots, for fuzzy matching on import.
+FIRST_PASS_BUILDINGSNAPSHOT = (
+    ('property_name', 'property_name'),
+    ((build_address_q, 'address_line_1'), 'address_line_1'),
+    ('address_line_2', 'address_line_2'),
+)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seed', '0012_auto_20151222_1031'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildingsnapshot',
+            name='normalized_address',
+            field=models.CharField(db_index=True, max_length=255, null=True, editable=False, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seed', '0013_buildingsnapshot_normalized_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildingsnapshot',
+            name='fingerprint',
+            field=models.CharField(db_index=True, max_length=40, null=True, editable=False, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seed', '0014_buildingsnapshot_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='canonicalbuilding',
+            index_together=set([('active', 'canonical_snapshot')]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_importer', '0003_auto_20150819_0811'),
+        ('seed', '0015_canonicalbuilding_index_active_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchingStageStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('stage', models.CharField(max_length=64)),
+                ('seconds', models.FloatField(default=0)),
+                ('queries', models.IntegerField(default=0)),
+                ('rows', models.IntegerField(default=0)),
+                ('calls', models.IntegerField(default=0)),
+                ('import_file', models.ForeignKey(related_name='matching_stats', to='data_importer.ImportFile')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='matchingstagestats',
+            unique_together=set([('import_file', 'stage')]),
+        ),
+    ]
@@ -5,16 +5,23 @@
 :author
 """
 
+import hashlib
 import types
 import json
+from collections import defaultdict
+import logging
 import unicodedata
+import uuid
 
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.contrib.contenttypes import generic
 from django.core import serializers
+from django.core.exceptions import ValidationError
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 from autoslug import AutoSlugField
-from seed.audit_logs.models import AuditLog, LOG
+from seed.audit_logs.models import AuditLog, AuditLogBuffer, LOG
 from seed.landing.models import SEEDUser as User
 from django_extensions.db.models import TimeStampedModel
 from django_pgjson.fields import JsonField
@@ -22,10 +29,14 @@ from seed.data_importer.models import ImportFile, ImportRecord
 from seed.lib.mcm import mapper
 from seed.lib.superperms.orgs.models import Organization as SuperOrganization
 from seed.managers.json import JsonManager
+from seed.utils.address import normalize_address_str
 from seed.utils.time import convert_datestr
 from seed.utils.generic import split_model_fields
+from seed.utils.cache import bump_cache_version
 from django.db.models.fields.related import ManyToManyField
 
+logger = logging.getLogger(__name__)
+
 PROJECT_NAME_MAX_LENGTH = 255
 
 # Represents the data source of a given BuildingSnapshot
@@ -69,6 +80,29 @@ BS_VALUES_LIST = [
     'pm_property_id',
     'custom_id_1',
     'address_line_1',
+    'normalized_address',
+]
+
+# Attributes that don't say anything about a building's data, so are left
+# out when checking whether two snapshots hold the same data.
+SNAPSHOT_IGNORE_FIELDS = [
+    'id',
+    'created',
+    'modified',
+    'match_type',
+    'confidence',
+    'source_type',
+    'canonical_building_id',
+    'import_file_id',
+    '_state',
+    '_import_file_cache',
+    'import_record',
+]
+
+# Fields computed from the others on save.
+SNAPSHOT_DERIVED_FIELDS = [
+    'normalized_address',
+    'fingerprint',
 ]
 
 NATURAL_GAS = 1
@@ -134,7 +168,8 @@ ENERGY_UNITS = (
 def get_ancestors(building):
     """gets all the non-raw, non-composite ancestors of a building
 
-       Recursive function to traverse the tree upward.
+       Traverses the tree upward, through non-raw snapshots only, with one
+       query for the whole lineage.
        source_type {
            2: ASSESSED_BS,
            3: PORTFOLIO_BS,
@@ -145,12 +180,103 @@ def get_ancestors(building):
        :param building: BuildingSnapshot inst.
        :returns: list of BuildingSnapshot inst., ancestors of building
     """
-    ancestors = []
-    parents = building.parents.filter(source_type__in=[2, 3, 4, 6])
-    ancestors.extend(parents.filter(source_type__in=[2, 3, 6]))
-    for p in parents:
-        ancestors.extend(get_ancestors(p))
-    return ancestors
+    adjacency, nodes = get_snapshot_tree(
+        building.pk, 'parents', source_types=[2, 3, 4, 6]
+    )
+
+    def _ancestors(pk):
+        parents = [nodes[parent_pk] for parent_pk in adjacency.get(pk, [])]
+        ancestors = [p for p in parents if p.source_type in [2, 3, 6]]
+        for p in parents:
+            ancestors.extend(_ancestors(p.pk))
+        return ancestors
+
+    return _ancestors(building.pk)
+
+
+def _get_tree_edges(snapshot_pk, attr, source_types=None):
+    """Return every edge reachable from a snapshot along ``attr``.
+
+    Uses a recursive CTE over the children M2M table, so the whole lineage
+    comes back in one query however deep it is.
+
+    :param snapshot_pk: int, PK of the BuildingSnapshot to start from.
+    :param attr: str, 'children' or 'parents', the direction to traverse.
+    :param source_types: (optional) list of source types; only traverse
+        to snapshots of these types.
+    :returns: list of (node_pk, neighbour_pk); each node's neighbours come
+        in BuildingSnapshot's default ordering, newest modified first, as
+        from ``attr.all()``.
+    """
+    through = BuildingSnapshot.children.through
+    parent_column = through._meta.get_field('from_buildingsnapshot').column
+    child_column = through._meta.get_field('to_buildingsnapshot').column
+    if attr == 'children':
+        node_column, neighbour_column = parent_column, child_column
+    elif attr == 'parents':
+        node_column, neighbour_column = child_column, parent_column
+    else:
+        raise ValueError('Unknown tree attribute: {0}'.format(attr))
+
+    # Join the neighbours' snapshots to sort them like Meta.ordering does.
+    type_params = []
+    type_filter = ''
+    if source_types is not None:
+        type_params = list(source_types)
+        type_filter = 'AND s.source_type IN ({0})'.format(
+            ', '.join(['%s'] * len(source_types))
+        )
+    snapshot_join = 'JOIN {snapshots} s ON s.id = t.{neighbour} {filter}'.format(
+        snapshots=BuildingSnapshot._meta.db_table,
+        neighbour=neighbour_column,
+        filter=type_filter,
+    )
+
+    sql = """
+        WITH RECURSIVE tree(id, node, neighbour, modified, created) AS (
+            SELECT t.id, t.{node}, t.{neighbour}, s.modified, s.created
+            FROM {through} t {snapshot_join}
+            WHERE t.{node} = %s
+          UNION
+            SELECT t.id, t.{node}, t.{neighbour}, s.modified, s.created
+            FROM {through} t {snapshot_join}
+            JOIN tree ON t.{node} = tree.neighbour
+        )
+        SELECT node, neighbour FROM tree
+        ORDER BY modified DESC, created DESC, id
+    """.format(
+        through=through._meta.db_table,
+        node=node_column,
+        neighbour=neighbour_column,
+        snapshot_join=snapshot_join,
+    )
+    cursor = connection.cursor()
+    # The anchor's join params come before its WHERE param.
+    cursor.execute(sql, type_params + [snapshot_pk] + type_params)
+    return cursor.fetchall()
+
+
+def get_snapshot_tree(snapshot_pk, attr, source_types=None):
+    """Load the lineage of a snapshot along ``attr``.
+
+    :param snapshot_pk: int, PK of the BuildingSnapshot to start from.
+    :param attr: str, 'children' or 'parents'.
+    :param source_types: (optional) list of source types to traverse.
+    :returns: tuple of (adjacency, nodes). adjacency is a dict of
+        node PK -> list of neighbour PKs, in the order ``attr.all()``
+        returns them; nodes is a dict of PK -> BuildingSnapshot inst.
+    """
+    adjacency = defaultdict(list)
+    for node_pk, neighbour_pk in _get_tree_edges(
+            snapshot_pk, attr, source_types=source_types):
+        adjacency[node_pk].append(neighbour_pk)
+
+    neighbour_pks = set(
+        pk for neighbours in adjacency.values() for pk in neighbours
+    )
+    nodes = BuildingSnapshot.objects.in_bulk(neighbour_pks) if neighbour_pks else {}
+
+    return dict(adjacency), nodes
 
 
 def find_unmatched_buildings(import_file):
@@ -173,6 +299,28 @@ def find_unmatched_buildings(import_file):
     )
 
 
+def get_canonical_snapshots(org):
+    """Get the canonical snapshots of an organization's active buildings.
+
+    Looked up by the snapshots' ``super_organization`` and the canonical
+    buildings' ``active`` flag, both indexed.
+
+    :param org: Organization inst. or PK, or a list of them.
+    :rtype: QuerySet of BuildingSnapshot.
+
+    """
+    if isinstance(org, (list, tuple, set, frozenset)):
+        org_filter = {
+            'super_organization_id__in': [getattr(o, 'pk', o) for o in org]
+        }
+    else:
+        org_filter = {'super_organization_id': getattr(org, 'pk', org)}
+    return BuildingSnapshot.objects.filter(
+        pk__in=CanonicalBuilding.objects.values('canonical_snapshot_id'),
+        **org_filter
+    )
+
+
 def find_canonical_building_values(org):
     """Get all canonical building snapshots' id info for an organization.
 
@@ -184,12 +332,86 @@ def find_canonical_building_values(org):
     NB: This does not return a queryset!
 
     """
-    users = org.users.all()
-    return BuildingSnapshot.objects.filter(
-        pk__in=CanonicalBuilding.objects.filter(
-            canonical_snapshot__import_file__import_record__owner__in=users
-        ).values_list('canonical_snapshot_id')
-    ).distinct().values_list(*BS_VALUES_LIST)
+    return get_canonical_snapshots(org).values_list(*BS_VALUES_LIST)
+
+
+class ServerSideRows(object):
+    """Rows of a query, fetched ``batch_size`` at a time by a named cursor.
+
+    Named cursors only live as long as their transaction, so one is opened
+    on entering the ``with`` block and ended explicitly on leaving it (or
+    on ``close``), whether or not every row was read. Don't write to the
+    database inside the block: the writes would share that transaction.
+
+    Usage:
+        >>> with ServerSideRows(queryset, batch_size=2000) as rows:
+        ...     for row in rows:
+        ...         index.add(row)
+
+    """
+
+    def __init__(self, queryset, batch_size=2000):
+        self.sql, self.params = queryset.query.sql_with_params()
+        self.batch_size = batch_size
+        self.cursor = None
+        self._atomic = None
+
+    def __enter__(self):
+        self._atomic = transaction.atomic()
+        self._atomic.__enter__()
+        try:
+            connection.ensure_connection()
+            self.cursor = connection.connection.cursor(
+                name='server_side_rows_{0}'.format(uuid.uuid4().hex)
+            )
+            self.cursor.itersize = self.batch_size
+            self.cursor.execute(self.sql, self.params)
+        except Exception as e:
+            self.close(type(e), e, None)
+            raise
+        return self
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def close(self, exc_type=None, exc_value=None, traceback=None):
+        """Close the cursor and end its transaction."""
+        if self._atomic is None:
+            return
+        try:
+            if self.cursor is not None:
+                self.cursor.close()
+        finally:
+            atomic, self._atomic, self.cursor = self._atomic, None, None
+            atomic.__exit__(exc_type, exc_value, traceback)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(exc_type, exc_value, traceback)
+
+
+def iter_canonical_building_values(org, batch_size=2000, fields=None):
+    """Stream ``find_canonical_building_values`` from a server-side cursor.
+
+    Only ``batch_size`` rows are held in memory at a time, rather than
+    every canonical building of the organization.
+
+    Usage:
+        >>> with iter_canonical_building_values(org) as rows:
+        ...     for values in rows:
+        ...         index.add(values)
+
+    :param org: Organization inst. or PK.
+    :param batch_size: int, rows fetched from the database at a time.
+    :param fields: (optional) list of field names to fetch instead of
+        BS_VALUES_LIST.
+    :rtype: ServerSideRows of tuples, field values specified in
+        BS_VALUES_LIST.
+
+    """
+    return ServerSideRows(
+        get_canonical_snapshots(org).values_list(*(fields or BS_VALUES_LIST)),
+        batch_size=batch_size,
+    )
 
 
 def obj_to_dict(obj):
@@ -245,6 +467,100 @@ def set_initial_sources(snapshot):
     return snapshot
 
 
+def reserve_pks(model_class, count):
+    """Pull ``count`` ids from a model's primary key sequence in one query.
+
+    ``bulk_create`` does not hand back primary keys on this version of
+    Django, so callers that need to reference new rows (e.g. self-referencing
+    ``*_source`` FKs) reserve them up front and assign them explicitly.
+
+    :param model_class: class, a model with a serial ``id`` primary key.
+    :param count: int, number of ids to reserve.
+    :rtype: list of int.
+
+    """
+    if count < 1:
+        return []
+
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+        "FROM generate_series(1, %s)",
+        [model_class._meta.db_table, count]
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def bulk_update_column(model_class, column, values, batch_size=1000):
+    """Set a column to a different value per row, one UPDATE per batch.
+
+    Runs ``UPDATE ... FROM (VALUES ...)``, in place of a
+    ``filter(pk=pk).update(...)`` per row.
+
+    :param model_class: class, the model whose table to update.
+    :param column: str, the column name, e.g. 'canonical_building_id'.
+    :param values: dict, {pk: new value}; values must not be None.
+    :param batch_size: int, rows per UPDATE.
+
+    """
+    table = connection.ops.quote_name(model_class._meta.db_table)
+    column = connection.ops.quote_name(column)
+    items = sorted(values.items())
+    cursor = connection.cursor()
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        cursor.execute(
+            'UPDATE {table} SET {column} = v.value '
+            'FROM (VALUES {rows}) AS v(id, value) '
+            'WHERE {table}.id = v.id'.format(
+                table=table,
+                column=column,
+                rows=', '.join(['(%s, %s)'] * len(chunk)),
+            ),
+            [param for item in chunk for param in item]
+        )
+
+
+def bulk_create_raw_snapshots(rows, import_file, source_type):
+    """Stage raw rows as BuildingSnapshots with a single INSERT.
+
+    Equivalent to creating a snapshot per row and calling
+    ``set_initial_sources`` on it, but the primary keys are reserved ahead of
+    time so the self-referencing sources are set before the insert rather
+    than with a second save per row.
+
+    :param rows: list of dict, parsed row data; stored as ``extra_data``.
+    :param import_file: ImportFile inst.
+    :param source_type: int, e.g. ASSESSED_RAW or PORTFOLIO_RAW.
+    :rtype: list of BuildingSnapshot inst.
+
+    """
+    super_org = import_file.import_record.super_organization
+    single, plural = get_sourced_attributes(BuildingSnapshot())
+    snapshots = []
+    for pk, row in zip(reserve_pks(BuildingSnapshot, len(rows)), rows):
+        raw_bs = BuildingSnapshot(
+            pk=pk,
+            import_file=import_file,
+            extra_data=row,
+            source_type=source_type,
+            super_organization=super_org,
+        )
+        # Same result as ``set_initial_sources``, without the per-row
+        # model introspection.
+        for attr in single:
+            setattr(raw_bs, '{0}_source_id'.format(attr), pk)
+        for attr in plural:
+            setattr(raw_bs, '{0}_sources'.format(attr), {
+                k: pk for k in getattr(raw_bs, attr, {})
+            })
+        snapshots.append(raw_bs)
+
+    BuildingSnapshot.objects.bulk_create(snapshots)
+
+    return snapshots
+
+
 def get_or_create_canonical(b1, b2=None):
     """Gets most trusted Canonical Building.
 
@@ -264,11 +580,13 @@ def get_or_create_canonical(b1, b2=None):
     return canon
 
 
-def initialize_canonical_building(snapshot, user_pk):
+def initialize_canonical_building(snapshot, user_pk, audit_logs=None):
     """Called to create a Canonicalbuilding from a single snapshot.
 
     :param snapshot: BuildingSnapshot inst.
     :param user_pk: The user id of the user initiating the CanonicalBuilding
+    :param audit_logs: (optional) AuditLogBuffer to add the log entry to,
+        instead of inserting it right away.
 
     """
     canon = get_or_create_canonical(snapshot)
@@ -277,14 +595,66 @@ def initialize_canonical_building(snapshot, user_pk):
     canon.canonical_snapshot = snapshot
     canon.save()
     # log the new building
-    AuditLog.objects.create(
+    entry = dict(
         user_id=user_pk,
-        organization=snapshot.super_organization,
+        organization_id=snapshot.super_organization_id,
         action='create_building',
         action_note='Created building',
         content_object=canon,
         audit_type=LOG,
     )
+    if audit_logs is None:
+        AuditLog.objects.create(**entry)
+    else:
+        audit_logs.log(**entry)
+
+
+def bulk_initialize_canonical_buildings(snapshot_pks, user_pk, audit_logs=None):
+    """Create a CanonicalBuilding for each snapshot, with bulk queries.
+
+    Does what ``initialize_canonical_building`` does for each snapshot,
+    with one INSERT for the CanonicalBuildings, one UPDATE (per thousand)
+    linking the snapshots to them, and the AuditLog rows inserted together.
+
+    :param snapshot_pks: list of BuildingSnapshot PKs without a
+        CanonicalBuilding.
+    :param user_pk: The user id of the user initiating the CanonicalBuildings
+    :param audit_logs: (optional) AuditLogBuffer to add the log entries to;
+        by default they're inserted before returning.
+    :returns: dict, {snapshot PK: CanonicalBuilding PK}
+
+    """
+    rows = list(BuildingSnapshot.objects.filter(
+        pk__in=snapshot_pks
+    ).order_by('pk').values_list('pk', 'super_organization_id'))
+    canon_pks = reserve_pks(CanonicalBuilding, len(rows))
+    canons = [
+        CanonicalBuilding(pk=canon_pk, canonical_snapshot_id=snapshot_pk)
+        for canon_pk, (snapshot_pk, _) in zip(canon_pks, rows)
+    ]
+
+    buffered = audit_logs is not None
+    if not buffered:
+        audit_logs = AuditLogBuffer()
+    with transaction.atomic():
+        CanonicalBuilding.objects.bulk_create(canons)
+        bulk_update_column(BuildingSnapshot, 'canonical_building_id', {
+            canon.canonical_snapshot_id: canon.pk for canon in canons
+        })
+        # log the new buildings
+        for canon, (_, organization_id) in zip(canons, rows):
+            audit_logs.log(
+                user_id=user_pk,
+                organization_id=organization_id,
+                action='create_building',
+                action_note='Created building',
+                content_object=canon,
+                audit_type=LOG,
+            )
+        if not buffered:
+            audit_logs.flush()
+
+    return {canon.canonical_snapshot_id: canon.pk for canon in canons}
 
 
 def clean_canonicals(b1, b2, new_snapshot):
@@ -303,6 +673,73 @@ def clean_canonicals(b1, b2, new_snapshot):
             canon.save()
 
 
+def get_tips(snapshots):
+    """Return the tip (leaf) of each snapshot's tree.
+
+    A lineage's tip is kept in its CanonicalBuilding's
+    ``canonical_snapshot``, so for snapshots of an active canonical
+    building this is one query for the lot. The pointer is only trusted
+    when it's consistent: a leaf, belonging to that same canonical
+    building. Otherwise, we fall back to walking the tree; see
+    ``repair_canonical_tips`` to fix the pointers.
+
+    :param snapshots: iterable of BuildingSnapshot insts.
+    :returns: dict, snapshot PK -> BuildingSnapshot inst.
+    """
+    snapshots = list(snapshots)
+    canon_ids = set(
+        s.canonical_building_id for s in snapshots if s.canonical_building_id
+    )
+    tips_by_canon = {}
+    if canon_ids:
+        canons = CanonicalBuilding.objects.filter(
+            pk__in=canon_ids,
+            canonical_snapshot__canonical_building=models.F('pk'),
+            canonical_snapshot__children__isnull=True,
+        ).select_related('canonical_snapshot')
+        for canon in canons:
+            tips_by_canon[canon.pk] = canon.canonical_snapshot
+
+    # Snapshots without children are their own tips; find those at once.
+    unknown_pks = [
+        s.pk for s in snapshots if s.canonical_building_id not in tips_by_canon
+    ]
+    has_children = set()
+    if unknown_pks:
+        has_children = set(BuildingSnapshot.children.through.objects.filter(
+            from_buildingsnapshot_id__in=unknown_pks
+        ).values_list('from_buildingsnapshot_id', flat=True))
+
+    tips = {}
+    for snapshot in snapshots:
+        tip = tips_by_canon.get(snapshot.canonical_building_id)
+        if tip is None:
+            tip = snapshot.tip if snapshot.pk in has_children else snapshot
+        tips[snapshot.pk] = tip
+
+    return tips
+
+
+def get_tip(snapshot):
+    """Return the tip of a snapshot's tree; see ``get_tips``."""
+    return get_tips([snapshot])[snapshot.pk]
+
+
+def find_canonical_tip(canon):
+    """Walk the tree to find the snapshot canon's pointer should be at.
+
+    :param canon: CanonicalBuilding inst.
+    :returns: BuildingSnapshot inst., or None if canon has no snapshots.
+    """
+    snapshot = canon.canonical_snapshot
+    if snapshot is None:
+        snapshot = canon.buildingsnapshot_set.order_by('pk').first()
+    if snapshot is None:
+        return None
+
+    return snapshot.tip
+
+
 def save_snapshot_match(
         b1_pk,
         b2_pk,
@@ -339,8 +776,9 @@ def save_snapshot_match(
     b2 = BuildingSnapshot.objects.get(pk=b2_pk)
 
     # we don't want to match in the middle of the tree, so get the tip
-    b1 = b1.tip
-    b2 = b2.tip
+    tips = get_tips([b1, b2])
+    b1 = tips[b1.pk]
+    b2 = tips[b2.pk]
 
     default_building = b1 if default_pk == b1_pk else b2
 
@@ -369,6 +807,228 @@ def save_snapshot_match(
     return new_snapshot, changes
 
 
+def _split_match_rounds(matches, tips):
+    """Split matches into the ones we can save together, and the rest.
+
+    Two matches on the same tree have to be saved one after the other,
+    since the second merges into the child of the first. A match waits
+    whenever a match before it on either of its trees is waiting too, so
+    merges happen in the order given.
+
+    :param matches: list of (index, b1_pk, b2_pk, confidence, match_type,
+        default_pk).
+    :param tips: dict, snapshot PK -> tip BuildingSnapshot inst.
+    :returns: tuple of lists, (matches to save now, matches to save later).
+    """
+    now, later = [], []
+    busy = set()
+    for match in matches:
+        tree_pks = set([tips[match[1]].pk, tips[match[2]].pk])
+        if tree_pks & busy:
+            later.append(match)
+        else:
+            now.append(match)
+        busy.update(tree_pks)
+
+    return now, later
+
+
+def _save_match_round(matches, tips, user):
+    """Save independent matches with bulk queries.
+
+    :param matches: list of (index, b1_pk, b2_pk, confidence, match_type,
+        default_pk), none of which share a tree.
+    :param tips: dict, snapshot PK -> tip BuildingSnapshot inst.
+    :param user: User inst. or None, last_modified_by for the snapshots.
+    :returns: dict, index -> (new BuildingSnapshot inst., changes).
+    """
+    from seed.mappings import mapper as seed_mapper
+
+    canons = CanonicalBuilding.objects.in_bulk(set(
+        tip.canonical_building_id for tip in tips.values()
+        if tip.canonical_building_id
+    ))
+    new_pks = reserve_pks(BuildingSnapshot, len(matches))
+    variants = []
+
+    def collect_variant(snapshot, attr, values):
+        variants.append((snapshot, attr, values))
+
+    results = {}
+    new_snapshots = []
+    deactivate_pks = set()
+    children = []
+    for (index, b1_pk, b2_pk, confidence, match_type, default_pk), pk in zip(
+            matches, new_pks):
+        b1 = tips[b1_pk]
+        b2 = tips[b2_pk]
+        default_building = b1 if default_pk == b1_pk else b2
+
+        new_snapshot = BuildingSnapshot(pk=pk)
+        changes = seed_mapper.merge_building_attrs(
+            new_snapshot,
+            b1,
+            b2,
+            seed_mapper.get_building_attrs([b1, b2]),
+            default_building,
+            collect_variant,
+        )
+        new_snapshot.match_type = match_type or SYSTEM_MATCH
+        new_snapshot.source_type = COMPOSITE_BS
+        # get_or_create_canonical, from the canonical buildings we loaded.
+        canon = (
+            canons.get(b1.canonical_building_id) or
+            canons.get(b2.canonical_building_id)
+        )
+        if canon is None:
+            canon = CanonicalBuilding.objects.create()
+            canons[canon.pk] = canon
+        new_snapshot.canonical_building = canon
+        new_snapshot.confidence = confidence
+        new_snapshot.last_modified_by = user
+        new_snapshot.super_organization_id = b2.super_organization_id
+        new_snapshot.truncate_fields()
+        new_snapshot.update_normalized_address()
+        new_snapshot.update_fingerprint()
+        new_snapshots.append(new_snapshot)
+
+        # clean_canonicals
+        for parent in (b1, b2):
+            parent_canon_id = parent.canonical_building_id
+            if parent_canon_id and parent_canon_id != canon.pk:
+                deactivate_pks.add(parent_canon_id)
+
+        canon.canonical_snapshot = new_snapshot
+        children.extend([(b1.pk, pk), (b2.pk, pk)])
+        results[index] = (new_snapshot, changes)
+
+    BuildingSnapshot.objects.bulk_create(new_snapshots)
+
+    for canon_pk in deactivate_pks:
+        canons[canon_pk].active = False
+    CanonicalBuilding.objects.filter(pk__in=deactivate_pks).update(active=False)
+    bulk_update_column(CanonicalBuilding, 'canonical_snapshot_id', {
+        new_snapshot.canonical_building_id: new_snapshot.pk
+        for new_snapshot in new_snapshots
+    })
+
+    # Parents and children; a building merged with its own tree links once.
+    through = BuildingSnapshot.children.through
+    through.objects.bulk_create([
+        through(from_buildingsnapshot_id=parent_pk, to_buildingsnapshot_id=pk)
+        for parent_pk, pk in sorted(set(children))
+    ])
+
+    # Both parents' meters carry over to the child.
+    meter_through = Meter.building_snapshot.through
+    meter_pks = defaultdict(set)
+    for snapshot_pk, meter_pk in meter_through.objects.filter(
+        buildingsnapshot_id__in=[parent_pk for parent_pk, _ in children]
+    ).values_list('buildingsnapshot_id', 'meter_id'):
+        meter_pks[snapshot_pk].add(meter_pk)
+    child_meters = set()
+    for parent_pk, pk in children:
+        for meter_pk in meter_pks[parent_pk]:
+            child_meters.add((pk, meter_pk))
+    meter_through.objects.bulk_create([
+        meter_through(buildingsnapshot_id=pk, meter_id=meter_pk)
+        for pk, meter_pk in sorted(child_meters)
+    ])
+
+    _bulk_save_variants(variants)
+
+    return results
+
+
+def _bulk_save_variants(variants):
+    """``mapper.save_variant`` for many new snapshots at once.
+
+    As there, an AttributeOption is created for each value not seen before
+    and attached to the variant that brought it; existing ones are left be.
+
+    :param variants: list of (snapshot, attr, attribute_values).
+    """
+    from seed.mappings import mapper as seed_mapper
+
+    if not variants:
+        return
+
+    variant_pks = reserve_pks(BuildingAttributeVariant, len(variants))
+    BuildingAttributeVariant.objects.bulk_create([
+        BuildingAttributeVariant(
+            pk=pk, field_name=attr, building_snapshot_id=snapshot.pk
+        )
+        for (snapshot, attr, _), pk in zip(variants, variant_pks)
+    ])
+
+    wanted = []
+    for (snapshot, attr, attribute_values), variant_pk in zip(
+            variants, variant_pks):
+        for data_set in attribute_values:
+            if attribute_values[data_set] is None:
+                continue
+            key = (
+                force_text(attribute_values[data_set]),
+                seed_mapper.get_source_id(data_set, attr),
+            )
+            wanted.append((key, variant_pk))
+
+    existing = set(AttributeOption.objects.filter(
+        value__in=set(key[0] for key, _ in wanted),
+        value_source__in=set(key[1] for key, _ in wanted),
+    ).values_list('value', 'value_source'))
+    options = []
+    for key, variant_pk in wanted:
+        if key in existing:
+            continue
+        existing.add(key)
+        options.append(AttributeOption(
+            value=key[0], value_source=key[1], building_variant_id=variant_pk
+        ))
+    AttributeOption.objects.bulk_create(options)
+
+
+def save_snapshot_matches(matches, user=None):
+    """Save many matches between snapshots; a batch ``save_snapshot_match``.
+
+    Matches that don't share a tree are saved together, each query
+    covering all of them: one INSERT for the new snapshots, one for their
+    parent links, and so on. Matches on the same tree are saved in rounds,
+    in the order given, each merging into the tip the one before left.
+
+    :param matches: list of (b1_pk, b2_pk, confidence, match_type) or
+        (b1_pk, b2_pk, confidence, match_type, default_pk) tuples, as the
+        arguments of ``save_snapshot_match``.
+    :param user: (optional) User inst, last_modified_by for the snapshots.
+    :returns: list with a (BuildingSnapshot inst, changes) tuple per match,
+        in order; None for matches of a snapshot with itself.
+    """
+    results = [None] * len(matches)
+    pending = []
+    for index, match in enumerate(matches):
+        b1_pk, b2_pk, confidence, match_type = match[:4]
+        default_pk = match[4] if len(match) > 4 else None
+        # No point in linking the same building together.
+        if b1_pk == b2_pk:
+            continue
+        pending.append((
+            index, b1_pk, b2_pk, confidence, match_type, default_pk or b1_pk
+        ))
+
+    while pending:
+        pks = set()
+        for match in pending:
+            pks.update(match[1:3])
+        buildings = BuildingSnapshot.objects.in_bulk(pks)
+        tips = get_tips(buildings.values())
+        now, pending = _split_match_rounds(pending, tips)
+        with transaction.atomic():
+            for index, result in _save_match_round(now, tips, user).items():
+                results[index] = result
+
+    return results
+
+
 def unmatch_snapshot_tree(building_pk):
     """May or may not obviate ``unmatch_snapshot``. Experimental.
 
@@ -617,6 +1277,76 @@ def get_column_mapping(column_raw, organization, attr_name='column_mapped'):
     return column_names, 100
 
 
+def get_column_mapping_resolver(
+    column_raws, organization, attr_name='column_mapped'
+):
+    """Bulk version of ``get_column_mapping`` for a known set of raw columns.
+
+    Loads the organization's mappings for all of ``column_raws`` up front,
+    in two queries, instead of two or more queries per raw column.
+
+    :param column_raws: list of str, the raw column names we'll look up.
+    :param organization: Organization inst.
+    :param attr_name: str, name of attribute on ColumnMapping to pull out.
+    :returns: callable with the signature and results of
+        ``get_column_mapping``, to pass as MCM's ``previous_mapping``. Raw
+        columns that weren't preloaded are looked up with
+        ``get_column_mapping``.
+
+    """
+    org_id = getattr(organization, 'pk', organization)
+    column_raws = set(column_raws)
+    matched = ColumnMapping.objects.filter(
+        super_organization=organization,
+        column_raw__organization=organization,
+        column_raw__column_name__in=column_raws,
+    ).values('pk')
+
+    # Every raw column of the matched mappings, to tell direct mappings
+    # apart and to find which mappings each of our raw columns belongs to.
+    raw_counts = defaultdict(int)
+    mapping_ids = defaultdict(list)
+    raw_rows = ColumnMapping.column_raw.through.objects.filter(
+        columnmapping__in=matched
+    ).values_list(
+        'columnmapping_id', 'column__organization_id', 'column__column_name'
+    )
+    for mapping_id, column_org_id, column_name in raw_rows:
+        raw_counts[mapping_id] += 1
+        if column_org_id == org_id and column_name in column_raws:
+            mapping_ids[column_name].append(mapping_id)
+
+    column_names = defaultdict(list)
+    mapped_rows = getattr(ColumnMapping, attr_name).through.objects.filter(
+        columnmapping__in=raw_counts.keys()
+    ).order_by('pk').values_list('columnmapping_id', 'column__column_name')
+    for mapping_id, column_name in mapped_rows:
+        column_names[mapping_id].append(column_name)
+
+    def resolve(column_raw, *args):
+        if isinstance(column_raw, list) or column_raw not in column_raws:
+            return get_column_mapping(column_raw, organization, attr_name)
+
+        found = mapping_ids.get(column_raw)
+        if not found:
+            return None
+        if len(found) > 1:
+            # Same as ColumnMapping.objects.get in ``get_column_mapping``.
+            raise ColumnMapping.MultipleObjectsReturned(
+                'More than one ColumnMapping for {0}'.format(column_raw)
+            )
+
+        mapping_id = found[0]
+        names = list(column_names[mapping_id])
+        if raw_counts[mapping_id] == 1 and len(names) == 1:
+            # A direct mapping.
+            names = names[0]
+
+        return names, 100
+
+    return resolve
+
+
 def get_column_mappings(organization):
     """Returns dict of all the column mappings for an Org's given source type
 
@@ -656,24 +1386,60 @@ def get_column_mappings(organization):
     return mapping, concat_confs
 
 
-def save_column_names(bs, mapping=None):
+def save_column_names(bs, mapping=None, keys=None):
     """Save unique column names for extra_data in this organization.
 
     Basically this is a record of all the extra_data keys we've ever seen
     for a particular organization.
 
     :param bs: BuildingSnapshot instance.
+    :param keys: (optional) iterable of str, the column names to save for
+        ``bs``'s organization. Defaults to the keys of ``bs.extra_data``.
     """
     from seed.utils import mapping as mapping_utils
 
-    for key in bs.extra_data:
-        # Ascertain if our key is ``extra_data`` or not.
-        is_extra_data = key not in mapping_utils.get_mappable_columns()
-        Column.objects.get_or_create(
-            organization=bs.super_organization,
-            column_name=key[:511],
-            is_extra_data=is_extra_data
-        )
+    if keys is None:
+        keys = bs.extra_data
+
+    mappable_columns = set(mapping_utils.get_mappable_columns())
+    # (column_name, is_extra_data) pairs, as Column is unique on them.
+    wanted = set(
+        (key[:511], key not in mappable_columns) for key in keys
+    )
+    if not wanted:
+        return
+
+    organization = bs.super_organization
+    existing = set(Column.objects.filter(
+        organization=organization,
+        column_name__in=[name for name, _ in wanted],
+    ).values_list('column_name', 'is_extra_data'))
+    missing = wanted - existing
+    if not missing:
+        return
+
+    try:
+        with transaction.atomic():
+            Column.objects.bulk_create([
+                Column(
+                    organization=organization,
+                    column_name=name,
+                    is_extra_data=is_extra_data
+                ) for name, is_extra_data in missing
+            ])
+    except IntegrityError:
+        # Another import saved some of these in the meantime.
+        for name, is_extra_data in missing:
+            Column.objects.get_or_create(
+                organization=organization,
+                column_name=name,
+                is_extra_data=is_extra_data
+            )
+    else:
+        # bulk_create doesn't send post_save.
+        bump_cache_version(column_index_version_key(
+            getattr(organization, 'pk', None)
+        ))
 
 
 class Project(TimeStampedModel):
@@ -1061,6 +1827,10 @@ class CanonicalBuilding(models.Model):
     objects = CanonicalManager()
     raw_objects = models.Manager()
 
+    class Meta:
+        # find an org's canonical snapshots from the index alone.
+        index_together = [('active', 'canonical_snapshot')]
+
     labels = ManyToManyField(StatusLabel)
 
     def __unicode__(self):
@@ -1205,6 +1975,15 @@ class BuildingSnapshot(TimeStampedModel):
     address_line_1_source = models.ForeignKey(
         'BuildingSnapshot', related_name='+', null=True, blank=True
     )
+    # address_line_1 as normalized for matching; see update_normalized_address.
+    normalized_address = models.CharField(
+        max_length=255, null=True, blank=True, db_index=True, editable=False
+    )
+    # sha1 of the snapshot's data, for spotting duplicates; see
+    # update_fingerprint.
+    fingerprint = models.CharField(
+        max_length=40, null=True, blank=True, db_index=True, editable=False
+    )
 
     address_line_2 = models.CharField(
         max_length=255, null=True, blank=True, db_index=True
@@ -1359,6 +2138,72 @@ class BuildingSnapshot(TimeStampedModel):
     objects = JsonManager()
 
     def save(self, *args, **kwargs):
+        self.truncate_fields()
+        self.update_normalized_address()
+        self.update_fingerprint()
+        super(BuildingSnapshot, self).save(*args, **kwargs)
+
+    def update_normalized_address(self):
+        """Set ``normalized_address`` from ``address_line_1``.
+
+        ``save`` does this for us; call it directly before ``bulk_create``.
+        An address that can't be normalized is left as None, rather than
+        keeping the snapshot from being saved.
+        """
+        try:
+            normalized = normalize_address_str(self.address_line_1)
+        except Exception:
+            logger.warning(
+                'Could not normalize address %r', self.address_line_1,
+                exc_info=True
+            )
+            normalized = None
+        self.normalized_address = normalized[:255] if normalized else None
+
+    def compute_fingerprint(self):
+        """Return a sha1 hex digest of the snapshot's data.
+
+        Covers the mapped fields and extra_data, leaving out the same
+        attributes ``seed.tasks.is_same_snapshot`` ignores, so that two
+        snapshots ``is_same_snapshot`` considers equal have the same
+        fingerprint. Values are converted as the database would, so the
+        fingerprint of a freshly mapped snapshot matches the saved one.
+        """
+        parts = []
+        for field in self._meta.concrete_fields:
+            name = field.attname
+            if (name in SNAPSHOT_IGNORE_FIELDS or
+                    name in SNAPSHOT_DERIVED_FIELDS or '_source' in name):
+                continue
+
+            value = getattr(self, name)
+            if isinstance(field, JsonField):
+                # postgres < 9.3 support
+                while isinstance(value, unicode):
+                    value = json.loads(value)
+                value = json.dumps(value, sort_keys=True, default=unicode)
+            elif value is not None:
+                try:
+                    value = field.to_python(value)
+                except ValidationError:
+                    pass
+                value = force_text(value)
+            parts.append(u'{0}={1}'.format(name, value))
+
+        return hashlib.sha1(u'\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def update_fingerprint(self):
+        """Set ``fingerprint`` from the snapshot's data.
+
+        ``save`` does this for us; call it directly before ``bulk_create``.
+        """
+        self.fingerprint = self.compute_fingerprint()
+
+    def truncate_fields(self):
+        """Cut string fields down to their column lengths.
+
+        ``save`` does this for us; call it directly before ``bulk_create``.
+        """
         if self.tax_lot_id and isinstance(self.tax_lot_id, types.StringTypes):
             self.tax_lot_id = self.tax_lot_id[:128]
         if self.pm_property_id and isinstance(
@@ -1412,8 +2257,6 @@ class BuildingSnapshot(TimeStampedModel):
         if self.building_certification and isinstance(self.building_certification, types.StringTypes):  # NOQA
             self.building_certification = self.building_certification[:255]
 
-        super(BuildingSnapshot, self).save(*args, **kwargs)
-
     def clean(self, *args, **kwargs):
         super(BuildingSnapshot, self).clean(*args, **kwargs)
 
@@ -1490,12 +2333,34 @@ class BuildingSnapshot(TimeStampedModel):
     @property
     def co_parent(self):
         """returns the first co-parent as a BuildingSnapshot inst"""
-        if not self.has_children:
-            return
-        first_child = self.children.all()[0]
-        for parent in first_child.parents.all():
-            if parent.pk != self.pk:
-                return parent
+        # The other parent of our first child, in one query. "First" as in
+        # Meta.ordering, the same as children.all()[0].
+        through = BuildingSnapshot.children.through
+        parent_column = through._meta.get_field('from_buildingsnapshot').column
+        child_column = through._meta.get_field('to_buildingsnapshot').column
+        where = """
+            {snapshots}.id = (
+                SELECT p.{parent} FROM {through} p
+                JOIN {snapshots} ps ON ps.id = p.{parent}
+                WHERE p.{child} = (
+                    SELECT c.{child} FROM {through} c
+                    JOIN {snapshots} cs ON cs.id = c.{child}
+                    WHERE c.{parent} = %s
+                    ORDER BY cs.modified DESC, cs.created DESC, c.id LIMIT 1
+                ) AND p.{parent} <> %s
+                ORDER BY ps.modified DESC, ps.created DESC, p.id LIMIT 1
+            )
+        """.format(
+            snapshots=BuildingSnapshot._meta.db_table,
+            through=through._meta.db_table,
+            parent=parent_column,
+            child=child_column,
+        )
+        co_parents = BuildingSnapshot.objects.extra(
+            where=[where], params=[self.pk, self.pk]
+        )
+        for parent in co_parents:
+            return parent
 
     @property
     def co_parents(self):
@@ -1507,19 +2372,25 @@ class BuildingSnapshot(TimeStampedModel):
     def recurse_tree(self, attr):
         """Recurse M2M relationship tree, extending list as we go.
 
+        The whole tree is loaded with ``get_snapshot_tree`` up front, then
+        walked in memory.
+
         :param attr: str, name of attribute we wish to traverse.
             .e.g. 'children', or 'parents'
 
         """
-        nodes = []
-        node_type = getattr(self, attr)
-        # N.B. We're expecting a Django M2M attribute here.
-        for node in node_type.all():
-            nodes.extend(node.recurse_tree(attr))
+        adjacency, nodes = get_snapshot_tree(self.pk, attr)
 
-        nodes.extend(node_type.all())
+        def _recurse(pk):
+            result = []
+            neighbours = adjacency.get(pk, [])
+            for neighbour_pk in neighbours:
+                result.extend(_recurse(neighbour_pk))
 
-        return nodes
+            result.extend(nodes[neighbour_pk] for neighbour_pk in neighbours)
+            return result
+
+        return _recurse(self.pk)
 
     @property
     def child_tree(self):
@@ -1601,3 +2472,102 @@ class TimeSeries(models.Model):
     meter = models.ForeignKey(
         Meter, related_name='timeseries_data', null=True, blank=True
     )
+
+
+class MatchingStageStats(models.Model):
+    """Time spent in one stage of matching an ImportFile.
+
+    Matching runs over several tasks; each adds to the counters of the
+    stages it runs, see ``record_matching_stage``.
+    """
+    import_file = models.ForeignKey(ImportFile, related_name='matching_stats')
+    stage = models.CharField(max_length=64)
+    seconds = models.FloatField(default=0)
+    queries = models.IntegerField(default=0)
+    rows = models.IntegerField(default=0)
+    calls = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['pk']
+        unique_together = ('import_file', 'stage')
+
+    def to_dict(self):
+        return {
+            'stage': self.stage,
+            'seconds': self.seconds,
+            'queries': self.queries,
+            'rows': self.rows,
+            'calls': self.calls,
+        }
+
+
+def record_matching_stage(import_file_pk, stage, seconds, queries=0, rows=0):
+    """Add a run of a matching stage to an ImportFile's MatchingStageStats.
+
+    :param import_file_pk: int, PK of the ImportFile being matched.
+    :param stage: str, e.g. 'id_matching' or 'merges'.
+    :param seconds: float, wall time of the run.
+    :param queries: int, database queries made.
+    :param rows: int, rows (buildings, log entries, ...) handled.
+
+    """
+    stats = MatchingStageStats.objects.filter(
+        import_file_id=import_file_pk, stage=stage
+    )
+    counters = {
+        'seconds': models.F('seconds') + seconds,
+        'queries': models.F('queries') + queries,
+        'rows': models.F('rows') + rows,
+        'calls': models.F('calls') + 1,
+    }
+    if stats.update(**counters):
+        return
+
+    try:
+        with transaction.atomic():
+            MatchingStageStats.objects.create(
+                import_file_id=import_file_pk,
+                stage=stage,
+                seconds=seconds,
+                queries=queries,
+                rows=rows,
+                calls=1,
+            )
+    except IntegrityError:
+        # Another shard created it first.
+        stats.update(**counters)
+
+
+def column_index_version_key(org_id):
+    """Cache key of the version counter for an org's column mapping index.
+
+    ``org_id`` of None is the version shared by every org, bumped when
+    Columns that don't belong to a single org change.
+    """
+    return 'column_mapping_index_version:{0}'.format(org_id)
+
+
+def invalidate_column_index(sender, instance, **kwargs):
+    """Make cached column mapping indexes stale when columns change."""
+    if isinstance(instance, ColumnMapping):
+        org_id = instance.super_organization_id
+    elif kwargs.get('signal') is m2m_changed:
+        # Reverse m2m change from a Column; the mappings' orgs are unknown.
+        org_id = None
+    else:
+        org_id = instance.organization_id
+    # m2m_changed fires before and after; only count the change once.
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_cache_version(column_index_version_key(org_id))
+
+
+post_save.connect(invalidate_column_index, sender=Column)
+post_delete.connect(invalidate_column_index, sender=Column)
+post_save.connect(invalidate_column_index, sender=ColumnMapping)
+post_delete.connect(invalidate_column_index, sender=ColumnMapping)
+m2m_changed.connect(
+    invalidate_column_index, sender=ColumnMapping.column_raw.through
+)
+m2m_changed.connect(
+    invalidate_column_index, sender=ColumnMapping.column_mapped.through
+)
@@ -7,11 +7,17 @@
 from __future__ import absolute_import
 import calendar
 import datetime
+import hashlib
+import json
+import math
 import time
 import re
 import string
 import traceback
 import operator
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
 from _csv import Error
 from django.core.mail import send_mail
 from django.conf import settings
@@ -21,19 +27,19 @@ from django.template import loader
 from django.db.models import Q
 from django.db.models.loading import get_model
 from django.core.urlresolvers import reverse_lazy
+from django.contrib.contenttypes.models import ContentType
 from celery import chord
 from celery import shared_task
 from celery.utils.log import get_task_logger
+from fuzzywuzzy import fuzz
 from seed.decorators import get_prog_key
-import usaddress
-from seed import search
-from seed.audit_logs.models import AuditLog
+from seed import reconcile, search
+from seed.audit_logs.models import AuditLog, AuditLogBuffer
 from seed.landing.models import SEEDUser as User
-from seed.lib.mcm import cleaners, mapper, reader
+from seed.lib.mcm import cleaners, mapper, matchers, reader
 from seed.lib.mcm.data.ESPM import espm as espm_schema
 from seed.lib.mcm.data.SEED import seed as seed_schema
 from seed.lib.mcm.utils import batch
-from streetaddress import StreetAddressFormatter
 from seed.data_importer.models import (
     ImportFile, ImportRecord, STATUS_READY_TO_MERGE, ROW_DELIMITER
 )
@@ -46,15 +52,22 @@ from seed.models import (
     PORTFOLIO_BS,
     GREEN_BUTTON_BS,
     BS_VALUES_LIST,
+    SNAPSHOT_DERIVED_FIELDS,
+    SNAPSHOT_IGNORE_FIELDS,
     Column,
     get_column_mappings,
     find_unmatched_buildings,
-    find_canonical_building_values,
+    get_canonical_snapshots,
+    iter_canonical_building_values,
+    MatchingStageStats,
+    record_matching_stage,
     SYSTEM_MATCH,
     POSSIBLE_MATCH,
-    initialize_canonical_building,
+    bulk_initialize_canonical_buildings,
     set_initial_sources,
+    bulk_create_raw_snapshots,
     save_snapshot_match,
+    save_snapshot_matches,
     save_column_names,
     CanonicalBuilding,
     Compliance,
@@ -64,9 +77,27 @@ from seed.models import (
 )
 from seed.decorators import lock_and_track
 from seed.utils import time as time_utils
+from seed.utils.address import normalize_address_str as _normalize_address_str
 from seed.utils.buildings import get_source_type, get_search_query
-from seed.utils.cache import set_cache, increment_cache, get_cache
+from seed.utils.cache import (
+    set_cache, increment_cache, get_cache, get_cache_raw, set_cache_raw
+)
+from seed.utils.chunks import (
+    get_chunk_size,
+    get_cost_key,
+    merge_chunk_positions,
+    record_chunk_cost,
+)
 from seed.utils.mapping import get_mappable_columns
+from seed.utils.stages import StageTimer
+from seed.utils.matching import (
+    AddressIndex,
+    BlockIndex,
+    FUZZY_BLOCK_FIELDS,
+    IdIndex,
+    fuzzy_blocking_keys,
+    split_street_address,
+)
 from seed.lib.superperms.orgs.models import Organization
 from seed.lib.exporter import Exporter
 from seed.cleansing.models import Cleansing
@@ -412,6 +443,11 @@ def _build_cleaner(org):
     :param org: superperms.orgs.Organization instance.
     :returns: dict of dicts. {'types': {'col_name': 'type'},}
     """
+    return cleaners.Cleaner(_get_cleaner_types(org))
+
+
+def _get_cleaner_types(org):
+    """Return the ontology ``_build_cleaner`` hands to its Cleaner."""
     units = {'types': {}}
     for column in Column.objects.filter(
             mapped_mappings__super_organization=org
@@ -428,7 +464,46 @@ def _build_cleaner(org):
     # column types.
     units['types'].update(seed_schema.schema['types'])
 
-    return cleaners.Cleaner(units)
+    return units
+
+
+# Bump when the layout of the mapping plan changes.
+MAPPING_PLAN_VERSION = 1
+
+
+def _build_mapping_plan(org):
+    """Gather everything ``map_row_chunk`` needs to map an org's data.
+
+    :param org: superperms.orgs.Organization instance.
+    :returns: dict, JSON serializable, with the column mapping, concat
+        configs, cleaner ontology, mappable columns and the mapped columns
+        that need ``apply_data_func``.
+    """
+    mapping, concats = get_column_mappings(org)
+    mappable_columns = sorted(get_mappable_columns())
+
+    # For those column mapping which are not db columns, we
+    # need to let MCM know that we apply our mapping function to those.
+    apply_columns = sorted(
+        item for item in mapping if mapping[item] not in mappable_columns
+    )
+
+    return {
+        'version': MAPPING_PLAN_VERSION,
+        'mapping': mapping,
+        'concats': concats,
+        'cleaner_types': _get_cleaner_types(org),
+        'mappable_columns': mappable_columns,
+        'apply_columns': apply_columns,
+    }
+
+
+def _cache_mapping_plan(plan):
+    """Store the plan under a hash of its contents and return the key."""
+    digest = hashlib.sha1(json.dumps(plan, sort_keys=True)).hexdigest()
+    plan_key = 'mapping_plan:{0}:{1}'.format(plan['version'], digest)
+    set_cache_raw(plan_key, plan)
+    return plan_key
 
 
 def apply_extra_data(model, key, value):
@@ -475,61 +550,71 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, increment, *args, **kwarg
     :param cleaner: (optional), the cleaner class you want to send
     to mapper.map_row. (e.g. turn numbers into floats.).
     :param raw_ids: (optional kwarg), the list of ids in chunk order.
+    :param plan_key: (optional kwarg), cache key of the mapping plan built
+        by ``_map_data``. The plan is rebuilt if it's missing.
 
     """
-
+    plan_key = kwargs.pop('plan_key', None)
+    cost_key = kwargs.pop('cost_key', None)
+    start = time.time()
     import_file = ImportFile.objects.get(pk=file_pk)
     save_type = PORTFOLIO_BS
     if source_type == ASSESSED_RAW:
         save_type = ASSESSED_BS
 
-    concats = []
-
-    org = Organization.objects.get(
-        pk=import_file.import_record.super_organization.pk
-    )
-
-    mapping, concats = get_column_mappings(org)
-    map_cleaner = _build_cleaner(org)
-
-    # For those column mapping which are not db columns, we
-    # need to let MCM know that we apply our mapping function to those.
-    apply_columns = []
-
-    mappable_columns = get_mappable_columns()
-    for item in mapping:
-        if mapping[item] not in mappable_columns:
-            apply_columns.append(item)
+    plan = get_cache_raw(plan_key) if plan_key else None
+    if plan is None or plan.get('version') != MAPPING_PLAN_VERSION:
+        org = Organization.objects.get(
+            pk=import_file.import_record.super_organization.pk
+        )
+        plan = _build_mapping_plan(org)
 
-    apply_func = apply_data_func(mappable_columns)
+    mapping = plan['mapping']
+    concats = plan['concats']
+    map_cleaner = cleaners.Cleaner(plan['cleaner_types'])
+    apply_columns = plan['apply_columns']
+    apply_func = apply_data_func(set(plan['mappable_columns']))
 
     data = BuildingSnapshot.objects.filter(id__in=ids).only('extra_data').iterator()
-    for row in data:
-        # get the data from the database
-        model = mapper.map_row(
-            row.extra_data,
-            mapping,
-            BuildingSnapshot,
-            cleaner=map_cleaner,
-            concat=concats,
-            apply_columns=apply_columns,
-            apply_func=apply_func,
-            *args,
-            **kwargs
-        )
-
+    # Map the whole chunk at once so that values are cleaned column by column.
+    models = mapper.map_rows(
+        [row.extra_data for row in data],
+        mapping,
+        BuildingSnapshot,
+        cleaner=map_cleaner,
+        concat=concats,
+        apply_columns=apply_columns,
+        apply_func=apply_func,
+        *args,
+        **kwargs
+    )
+    super_org = import_file.import_record.super_organization
+    extra_data_keys = set()
+    for model in models:
         if model.tax_lot_id:
             model.tax_lot_id = _normalize_tax_lot_id(str(model.tax_lot_id))
 
         model.import_file = import_file
         model.source_type = save_type
         model.clean()
-        model.super_organization = import_file.import_record.super_organization
-        model.save()
-    if model:
-        # Make sure that we've saved all of the extra_data column names
-        save_column_names(model, mapping=mapping)
-
+        model.super_organization = super_org
+        model.truncate_fields()
+        model.update_normalized_address()
+        model.update_fingerprint()
+        extra_data_keys.update(model.extra_data)
+
+    # One INSERT for the chunk instead of a save per row.
+    BuildingSnapshot.objects.bulk_create(models)
+    if models:
+        # Make sure that we've saved all of the extra_data column names,
+        # from every row of the chunk.
+        save_column_names(models[-1], mapping=mapping, keys=extra_data_keys)
+
+    logger.info(
+        'fuzzy_in_set cache: %(hits)s hits, %(misses)s misses, '
+        '%(size)s/%(maxsize)s entries', matchers.fuzzy_cache_info()
+    )
+    record_chunk_cost(cost_key, len(ids), time.time() - start)
     increment_cache(prog_key, increment)
 
 
@@ -572,15 +657,26 @@ def _map_data(file_pk, *args, **kwargs):
     }
     source_type = source_type_dict.get(import_file.source_type, ASSESSED_RAW)
 
-    qs = BuildingSnapshot.objects.filter(
+    ids = list(BuildingSnapshot.objects.filter(
         import_file=import_file,
         source_type=source_type,
-    ).only('id').iterator()
+    ).values_list('id', flat=True))
+
+    # Work out the mapping once; every chunk reads it from the cache.
+    plan_key = _cache_mapping_plan(
+        _build_mapping_plan(import_file.import_record.super_organization)
+    )
 
+    cost_key = get_cost_key(
+        'map', import_file.import_record.super_organization_id, source_type
+    )
+    chunk_size = get_chunk_size(len(ids), import_file.num_columns, cost_key)
     tasks = []
-    for chunk in batch(qs, 100):
-        ids = [obj.id for obj in chunk]
-        tasks.append(map_row_chunk.s(ids, file_pk, source_type, prog_key))
+    for chunk in batch(ids, chunk_size):
+        tasks.append(map_row_chunk.s(
+            chunk, file_pk, source_type, prog_key, plan_key=plan_key,
+            cost_key=cost_key
+        ))
 
     # need to rework how the progress keys are implemented here, but at least
     # the method gets called above for cleansing
@@ -619,19 +715,24 @@ def _cleanse_data(file_pk):
     # After the mapping stage occurs, the data end up in the BuildingSnapshot
     # table under the *_BS value.
     source_type = source_type_dict.get(import_file.source_type, ASSESSED_BS)
-    qs = BuildingSnapshot.objects.filter(
+    ids = list(BuildingSnapshot.objects.filter(
         import_file=import_file,
         source_type=source_type,
-    ).only('id').iterator()
+    ).values_list('id', flat=True))
 
     # initialize the cache for the cleansing results using the cleansing static method
     Cleansing.initialize_cache(file_pk)
 
     prog_key = get_prog_key('cleanse_data', file_pk)
+    cost_key = get_cost_key(
+        'cleanse', import_file.import_record.super_organization_id,
+        source_type
+    )
+    chunk_size = get_chunk_size(len(ids), import_file.num_columns, cost_key)
     tasks = []
-    for chunk in batch(qs, 100):
-        ids = [obj.id for obj in chunk]
-        tasks.append(cleanse_data_chunk.s(ids, file_pk))  # note that increment will be added to end
+    for chunk in batch(ids, chunk_size):
+        # note that increment will be added to end
+        tasks.append(cleanse_data_chunk.s(chunk, file_pk, cost_key=cost_key))
 
     # need to rework how the progress keys are implemented here, but at least
     # the method gets called above for cleansing
@@ -656,13 +757,16 @@ def map_data(file_pk, *args, **kwargs):
     _map_data.delay(file_pk)
 
 
-@shared_task
-def _save_raw_data_chunk(chunk, file_pk, prog_key, increment, *args, **kwargs):
-    """Save the raw data to the database."""
-    import_file = ImportFile.objects.get(pk=file_pk)
+def _save_raw_rows(rows, import_file):
+    """Save parsed rows as raw BuildingSnapshots for ``import_file``."""
     # Save our "column headers" and sample rows for F/E.
     source_type = get_source_type(import_file)
-    for c in chunk:
+    if getattr(settings, 'RAW_SAVE_BULK_INSERT', True):
+        # One INSERT for the whole chunk; sources are set before the insert.
+        bulk_create_raw_snapshots(rows, import_file, source_type)
+        return
+
+    for c in rows:
         raw_bs = BuildingSnapshot()
         raw_bs.import_file = import_file
         raw_bs.extra_data = c
@@ -677,12 +781,58 @@ def _save_raw_data_chunk(chunk, file_pk, prog_key, increment, *args, **kwargs):
         set_initial_sources(raw_bs)
         raw_bs.save()
 
+
+@shared_task
+def _save_raw_data_chunk(chunk, file_pk, prog_key, increment, *args, **kwargs):
+    """Save the raw data to the database."""
+    start = time.time()
+    import_file = ImportFile.objects.get(pk=file_pk)
+    _save_raw_rows(chunk, import_file)
+    record_chunk_cost(kwargs.get('cost_key'), len(chunk), time.time() - start)
+
     # Indicate progress
     increment_cache(prog_key, increment)
     logger.debug('Returning from _save_raw_data_chunk')
     return True
 
 
+@shared_task
+def _save_raw_data_range(file_pk, layout, position, count, prog_key,
+                         increment, *args, **kwargs):
+    """Read one chunk of rows straight from the file and save it.
+
+    Used when RAW_SAVE_STREAMING is on, so that only the chunk descriptor
+    travels through the broker instead of the rows themselves.
+
+    :param file_pk: int, the PK for an ImportFile obj.
+    :param layout: dict, the file's layout, from ``MCMParser.layout``.
+    :param position: int, where the chunk starts; a byte offset for CSV
+        files or a row index for Excel files. See
+        ``MCMParser.chunk_positions``.
+    :param count: int, number of rows in the chunk.
+    :param prog_key: string, key of the progress key
+    :param increment: double, value by which to increment progress key
+
+    """
+    start = time.time()
+    import_file = ImportFile.objects.get(pk=file_pk)
+    # Read the upload where it is, rather than copying all of it to a
+    # temporary file (``local_file``) for every chunk. Universal newlines,
+    # as when the chunk positions were found.
+    mode = 'rb' if layout['format'] == 'excel' else 'rU'
+    storage = import_file.file.storage
+    with storage.open(import_file.file.name, mode) as f:
+        # The file object itself: Django's File always iterates from the
+        # start of the file.
+        rows = list(reader.read_layout_rows(f.file, layout, position, count))
+    _save_raw_rows(rows, import_file)
+    record_chunk_cost(kwargs.get('cost_key'), count, time.time() - start)
+
+    increment_cache(prog_key, increment)
+    logger.debug('Returning from _save_raw_data_range')
+    return True
+
+
 @shared_task
 def finish_raw_save(file_pk):
     """
@@ -814,16 +964,47 @@ def _save_raw_data(file_pk, *args, **kwargs):
 
         parser = reader.MCMParser(import_file.local_file)
         cache_first_rows(import_file, parser)
-        rows = parser.next()
         import_file.num_rows = 0
         import_file.num_columns = parser.num_columns()
 
-        # Why are we setting the num_rows to the number of chunks?
+        cost_key = get_cost_key(
+            'save_raw', import_file.import_record.super_organization_id,
+            import_file.source_type
+        )
         tasks = []
-        for chunk in batch(rows, 100):
-            import_file.num_rows += len(chunk)
-            logger.debug('Appending task')
-            tasks.append(_save_raw_data_chunk.s(chunk, file_pk, prog_key))
+        if getattr(settings, 'RAW_SAVE_STREAMING', False):
+            # Workers read their own slice of the file; we only send them
+            # where it starts and how many rows it has. Find the positions
+            # in small chunks first, since we don't know the row count yet.
+            positions = parser.chunk_positions(
+                getattr(settings, 'IMPORT_CHUNK_MIN_SIZE', 25)
+            )
+            chunk_size = get_chunk_size(
+                sum(count for _, count in positions),
+                import_file.num_columns,
+                cost_key
+            )
+            # Sent along so workers don't sniff the file again.
+            layout = parser.layout()
+            for position, count in merge_chunk_positions(
+                    positions, chunk_size):
+                import_file.num_rows += count
+                tasks.append(_save_raw_data_range.s(
+                    file_pk, layout, position, count, prog_key,
+                    cost_key=cost_key
+                ))
+        else:
+            rows = list(parser.next())
+            chunk_size = get_chunk_size(
+                len(rows), import_file.num_columns, cost_key
+            )
+            # Why are we setting the num_rows to the number of chunks?
+            for chunk in batch(rows, chunk_size):
+                import_file.num_rows += len(chunk)
+                logger.debug('Appending task')
+                tasks.append(_save_raw_data_chunk.s(
+                    chunk, file_pk, prog_key, cost_key=cost_key
+                ))
 
         logger.debug('Appended all tasks')
         import_file.save()
@@ -894,31 +1075,40 @@ def handle_results(results, b_idx, can_rev_idx, unmatched_list, user_pk):
 
     :param results: list of tuples. [('match', 0.99999),...]
     :param b_idx: int, the index of the current building in the unmatched_list.
-    :param can_rev_idx: dict, reverse index from match -> canonical PK.
+    :param can_rev_idx: dict or AddressIndex, reverse index from
+        match -> canonical PK.
     :param user_pk: user ID, used for AuditLog logging
     :unmatched_list: list of dicts, the result of a values_list query for
         unmatched BSes.
 
     """
     match_string, confidence = results[0]  # We always care about closest match
+    can_snap_pk = can_rev_idx[match_string]
+    building_pk = unmatched_list[b_idx][0]  # First element is PK
+
+    _save_system_match(can_snap_pk, building_pk, confidence, user_pk)
+
+
+def _get_system_match_type(confidence):
+    """SYSTEM_MATCH, or POSSIBLE_MATCH below MATCH_MED_THRESHOLD."""
     match_type = SYSTEM_MATCH
     # If we passed the minimum threshold, we're here, but we need to
     # distinguish probable matches from good matches.
     if confidence < getattr(settings, 'MATCH_MED_THRESHOLD', 0.7):
         match_type = POSSIBLE_MATCH
+    return match_type
 
-    can_snap_pk = can_rev_idx[match_string]
-    building_pk = unmatched_list[b_idx][0]  # First element is PK
 
-    bs, changes = save_snapshot_match(
-        can_snap_pk,
-        building_pk,
-        confidence=confidence,
-        match_type=match_type,
-        default_pk=building_pk,
-    )
-    canon = bs.canonical_building
-    action_note = 'System matched building.'
+def _log_system_match(bs, changes, user_pk, action_note, audit_logs=None):
+    """Record a system match, and the fields it changed, in the AuditLog.
+
+    :param bs: BuildingSnapshot inst., the snapshot the match created.
+    :param changes: list of dicts, as returned by ``save_snapshot_match``.
+    :param user_pk: user ID, used for AuditLog logging
+    :param action_note: str, e.g. 'System matched building.'
+    :param audit_logs: (optional) AuditLogBuffer to add the entry to,
+        instead of inserting it right away.
+    """
     if changes:
         action_note += "  Fields changed in cannonical building:\n"
         for change in changes:
@@ -930,13 +1120,36 @@ def handle_results(results, b_idx, can_rev_idx, unmatched_list, user_pk):
 
             action_note += "{value}\n".format(value=change["to"])
         action_note = action_note[:-1]
-    AuditLog.objects.create(
+    entry = dict(
         user_id=user_pk,
-        content_object=canon,
+        content_object=bs.canonical_building,
         action_note=action_note,
         action='save_system_match',
-        organization=bs.super_organization,
+        organization_id=bs.super_organization_id,
     )
+    if audit_logs is None:
+        AuditLog.objects.create(**entry)
+    else:
+        audit_logs.log(**entry)
+
+
+def _save_system_match(can_snap_pk, building_pk, confidence, user_pk):
+    """Merge a building into a canonical snapshot and log the system match.
+
+    :param can_snap_pk: int, PK of the canonical snapshot matched.
+    :param building_pk: int, PK of the unmatched snapshot.
+    :param confidence: float, how good the match is; below
+        MATCH_MED_THRESHOLD it's saved as a possible match.
+    :param user_pk: user ID, used for AuditLog logging
+    """
+    bs, changes = save_snapshot_match(
+        can_snap_pk,
+        building_pk,
+        confidence=confidence,
+        match_type=_get_system_match_type(confidence),
+        default_pk=building_pk,
+    )
+    _log_system_match(bs, changes, user_pk, 'System matched building.')
 
 
 @shared_task
@@ -952,6 +1165,12 @@ def match_buildings(file_pk, user_pk):
             'message': 'matching already complete',
             'progress_key': prog_key
         }
+    if _matching_in_progress(import_file):
+        return {
+            'status': 'warning',
+            'message': 'matching already in progress',
+            'progress_key': prog_key
+        }
 
     if not import_file.mapping_done:
         # Re-add to the queue, hopefully our mapping will be done by then.
@@ -973,15 +1192,6 @@ def match_buildings(file_pk, user_pk):
     }
 
 
-def get_canonical_snapshots(org_id):
-    """Return all of the BuildingSnapshots that are canonical for an org."""
-    snapshots = BuildingSnapshot.objects.filter(
-        canonicalbuilding__active=True, super_organization_id=org_id
-    )
-
-    return snapshots
-
-
 def get_canonical_id_matches(org_id, pm_id, tax_id, custom_id):
     """Returns canonical snapshots that match at least one id."""
     params = []
@@ -1010,18 +1220,39 @@ def get_canonical_id_matches(org_id, pm_id, tax_id, custom_id):
     return canonical_matches
 
 
+def get_canonical_id_index(unmatched_buildings):
+    """Index every canonical snapshot sharing an ID with unmatched_buildings.
+
+    One query for the whole import, instead of a
+    ``get_canonical_id_matches`` query per building.
+
+    :param unmatched_buildings: iterable of BuildingSnapshot insts.
+    :rtype: IdIndex
+    """
+    index = IdIndex()
+    org_ids = set()
+    ids = set()
+    for unmatched in unmatched_buildings:
+        org_ids.add(unmatched.super_organization_id)
+        ids.update(index.ids(unmatched))
+
+    if not ids:
+        return index
+
+    id_params = [
+        Q(**{'{0}__in'.format(field): ids}) for field in index.id_fields
+    ]
+    can_snapshots = get_canonical_snapshots(org_ids).filter(
+        reduce(operator.or_, id_params)
+    )
+    for can_snap in can_snapshots:
+        index.add(can_snap)
+
+    return index
+
+
 def is_same_snapshot(s1, s2):
-    fields_to_ignore = ["id",
-                        "created",
-                        "modified",
-                        "match_type",
-                        "confidence",
-                        "source_type",
-                        "canonical_building_id",
-                        "import_file_id",
-                        "_state",
-                        "_import_file_cache",
-                        "import_record"]
+    fields_to_ignore = SNAPSHOT_IGNORE_FIELDS + SNAPSHOT_DERIVED_FIELDS
 
     for k, v in s1.__dict__.items():
         # ignore anything that starts with an underscore
@@ -1038,6 +1269,61 @@ def is_same_snapshot(s1, s2):
     return True
 
 
+def is_duplicate_snapshot(s1, s2):
+    """Like ``is_same_snapshot``, but compares fingerprints when both have one."""
+    if s1.fingerprint and s2.fingerprint:
+        return s1.fingerprint == s2.fingerprint
+    return is_same_snapshot(s1, s2)
+
+
+def get_fingerprint_index(unmatched_buildings):
+    """Map the fingerprints of unmatched_buildings to the snapshots having them.
+
+    One query for the whole import. A building whose fingerprint no other
+    snapshot has can't be a duplicate, so ``handle_id_matches`` needn't
+    look for one.
+
+    Snapshots saved before fingerprints existed have none until
+    ``backfill_fingerprint`` is run, and the index can't vouch for them;
+    while the orgs have any, None is returned so every tree is searched.
+
+    :param unmatched_buildings: iterable of BuildingSnapshot insts.
+    :rtype: dict, fingerprint -> set of BuildingSnapshot PKs, or None.
+    """
+    org_ids = set()
+    fingerprints = set()
+    for unmatched in unmatched_buildings:
+        org_ids.add(unmatched.super_organization_id)
+        if unmatched.fingerprint:
+            fingerprints.add(unmatched.fingerprint)
+
+    # Raw snapshots are never fingerprinted, nor part of a match tree.
+    if BuildingSnapshot.objects.filter(
+        super_organization_id__in=org_ids, fingerprint__isnull=True
+    ).exclude(
+        source_type__in=(ASSESSED_RAW, PORTFOLIO_RAW, GREEN_BUTTON_RAW)
+    ).exists():
+        return None
+
+    index = defaultdict(set)
+    if not fingerprints:
+        return index
+
+    for pk, fingerprint in BuildingSnapshot.objects.filter(
+        fingerprint__in=fingerprints, super_organization_id__in=org_ids
+    ).values_list('pk', 'fingerprint'):
+        index[fingerprint].add(pk)
+
+    return index
+
+
+def _may_be_duplicate(snapshot, fingerprint_index):
+    """False when fingerprint_index shows snapshot's data is unique."""
+    if fingerprint_index is None or not snapshot.fingerprint:
+        return True
+    return bool(fingerprint_index.get(snapshot.fingerprint, set()) - {snapshot.pk})
+
+
 class DuplicateDataError(RuntimeError):
 
     def __init__(self, id):
@@ -1045,15 +1331,33 @@ class DuplicateDataError(RuntimeError):
         self.id = id
 
 
-def handle_id_matches(unmatched_bs, import_file, user_pk):
-    """"Deals with exact matches in the IDs of buildings."""
-    id_matches = get_canonical_id_matches(
-        unmatched_bs.super_organization_id,
-        unmatched_bs.pm_property_id,
-        unmatched_bs.tax_lot_id,
-        unmatched_bs.custom_id_1
-    )
-    if not id_matches.exists():
+def handle_id_matches(
+    unmatched_bs, import_file, user_pk, id_index=None, fingerprint_index=None,
+    audit_logs=None
+):
+    """"Deals with exact matches in the IDs of buildings.
+
+    :param unmatched_bs: BuildingSnapshot inst. to match.
+    :param import_file: ImportFile inst. unmatched_bs comes from.
+    :param user_pk: user ID, used for AuditLog logging
+    :param id_index: (optional) IdIndex of canonical snapshots, from
+        ``get_canonical_id_index``; it is kept up to date with the merges
+        made here. Without it, the canonical snapshots are queried.
+    :param fingerprint_index: (optional) dict, from
+        ``get_fingerprint_index``; skips the search through the candidates'
+        parent trees when no other snapshot has unmatched_bs's data.
+    :param audit_logs: (optional) AuditLogBuffer for the match entries.
+    """
+    if id_index is not None:
+        id_matches = id_index.candidates(unmatched_bs)
+    else:
+        id_matches = list(get_canonical_id_matches(
+            unmatched_bs.super_organization_id,
+            unmatched_bs.pm_property_id,
+            unmatched_bs.tax_lot_id,
+            unmatched_bs.custom_id_1
+        ))
+    if not id_matches:
         return
 
     # Check to see if there are any duplicates here
@@ -1063,55 +1367,76 @@ def handle_id_matches(unmatched_bs, import_file, user_pk):
         # unmatched_bs and check it on the other side like
         # unmatched_bs.duplicate_of_pk = snapshot.pk
         # return unmatched_bs
-        if is_same_snapshot(unmatched_bs, can_snap):
+        if is_duplicate_snapshot(unmatched_bs, can_snap):
             raise DuplicateDataError(can_snap.pk)
 
+        if not _may_be_duplicate(unmatched_bs, fingerprint_index):
+            continue
+
         # iterate through all of the parent records and see if there is a duplicate there
         for snapshot in can_snap.parent_tree:
-            if is_same_snapshot(unmatched_bs, snapshot):
+            if is_duplicate_snapshot(unmatched_bs, snapshot):
                 raise DuplicateDataError(snapshot.pk)
 
     # merge save as system match with high confidence.
-    for can_snap in id_matches:
-        # Merge all matches together; updating "unmatched" pointer
-        # as we go.
-        unmatched_bs, changes = save_snapshot_match(
+    # Merge all matches together; each merges into the child of the last.
+    results = save_snapshot_matches([
+        (
             can_snap.pk,
             unmatched_bs.pk,
-            confidence=0.9,  # TODO(gavin) represent conf better.
-            match_type=SYSTEM_MATCH,
-            user=import_file.import_record.owner,
-            default_pk=unmatched_bs.pk
+            0.9,  # TODO(gavin) represent conf better.
+            SYSTEM_MATCH,
+            unmatched_bs.pk,
         )
-        canon = unmatched_bs.canonical_building
-        canon.canonical_snapshot = unmatched_bs
-        canon.save()
-        action_note = 'System matched building ID.'
-        if changes:
-            action_note += "  Fields changed in cannonical building:\n"
-            for change in changes:
-                action_note += "\t{field}:\t".format(
-                    field=change["field"].replace("_", " ").replace("-", "").capitalize())
-                if "from" in change:
-                    action_note += "From:\t{prev}\tTo:\t".format(prev=change["from"])
-
-                action_note += "{value}\n".format(value=change["to"])
-            action_note = action_note[:-1]
-        AuditLog.objects.create(
-            user_id=user_pk,
-            content_object=canon,
-            action_note=action_note,
-            action='save_system_match',
-            organization=unmatched_bs.super_organization,
+        for can_snap in id_matches
+    ], user=import_file.import_record.owner)
+    for bs, changes in results:
+        _log_system_match(
+            bs, changes, user_pk, 'System matched building ID.', audit_logs
         )
+    unmatched_bs = results[-1][0]
+
+    if id_index is not None:
+        # The merged snapshots aren't canonical anymore; their child is.
+        id_index.replace(id_matches, unmatched_bs)
 
     # Returns the most recent child of all merging.
     return unmatched_bs
 
 
+@contextmanager
+def _matching_stage(file_pk, stage):
+    """Time a stage of matching, adding it to the ImportFile's stats.
+
+    :param file_pk: int, the PK for an ImportFile obj.
+    :param stage: str, name of the stage, e.g. 'id_matching'.
+    :yields: StageTimer; set its ``rows`` to the number of rows handled.
+    """
+    with StageTimer() as timer:
+        yield timer
+    record_matching_stage(
+        file_pk, stage, timer.seconds, queries=timer.queries, rows=timer.rows
+    )
+
+
+def _matching_in_progress(import_file):
+    """True while the match shards of an ImportFile are still running.
+
+    ``_match_buildings`` sets ``matching_completion`` to 0 when it hands
+    off to the shards, and ``_finish_matching`` sets it to 100 along with
+    ``matching_done``; in between, the file must not be matched or
+    remapped. If a shard fails, ``_fail_matching`` sets it back to None.
+    """
+    return (
+        not import_file.matching_done and
+        import_file.matching_completion is not None
+    )
+
+
 def _finish_matching(import_file, progress_key):
     import_file.matching_done = True
     import_file.mapping_completion = 100
+    import_file.matching_completion = 100
     import_file.save()
     result = {
         'status': 'success',
@@ -1121,122 +1446,45 @@ def _finish_matching(import_file, progress_key):
     set_cache(progress_key, result['status'], result)
 
 
-def _normalize_address_direction(direction):
-    direction = direction.lower().replace('.', '')
-    direction_map = {
-        'east': 'e',
-        'west': 'w',
-        'north': 'n',
-        'south': 's',
-        'northeast': 'ne',
-        'northwest': 'nw',
-        'southeast': 'se',
-        'southwest': 'sw'
-    }
-    if direction in direction_map:
-        return direction_map[direction]
-    return direction
-
-
-POST_TYPE_MAP = {
-    'avenue': 'ave',
-}
-
-
-def _normalize_address_post_type(post_type):
-    value = post_type.lower().replace('.', '')
-    return POST_TYPE_MAP.get(value, value)
-
-
-ADDRESS_NUMBER_RE = re.compile((
-    r''
-    r'(?P<start>[0-9]+)'  # The left part of the range
-    r'\s?'  # Optional whitespace before the separator
-    r'[\\/-]?'  # Optional Separator
-    r'\s?'  # Optional whitespace after the separator
-    r'(?<=[\s\\/-])'  # Enforce match of at least one separator char.
-    r'(?P<end>[0-9]+)'  # THe right part of the range
-))
-
+def _fail_matching(import_file, progress_key):
+    """Let a file whose match shards failed be matched again.
 
-def _normalize_address_number(address_number):
+    The merges the other shards made are kept; the buildings left
+    unmatched are picked up by the next run.
     """
-    Given the numeric portion of an address, normalize it.
-    - strip leading zeros from numbers.
-    - remove whitespace from ranges.
-    - convert ranges to use dash as separator.
-    - expand any numbers that appear to have had their leading digits
-      truncated.
-    """
-    match = ADDRESS_NUMBER_RE.match(address_number)
-    if match:
-        # This address number is a range, so normalize it.
-        components = match.groupdict()
-        range_start = components['start'].lstrip("0")
-        range_end = components['end'].lstrip("0")
-        if len(range_end) < len(range_start):
-            # The end range value is omitting a common prefix.  Add it back.
-            prefix_length = len(range_start) - len(range_end)
-            range_end = range_start[:prefix_length] + range_end
-        return '-'.join([range_start, range_end])
-
-    # some addresses have leading zeros, strip them here
-    return address_number.lstrip("0")
-
-
-def _normalize_address_str(address_val):
-    """
-    Normalize the address to conform to short abbreviations.
-
-    If an invalid address_val is provided, None is returned.
-
-    If a valid address is provided, a normalized version is returned.
-    """
-
-    # if this string is empty the regular expression in the sa wont
-    # like it, and fail, so leave returning nothing
-    if not address_val:
-        return None
-
-    # now parse the address into number, street name and street type
-    try:
-        addr = usaddress.tag(str(address_val))[0]
-    except usaddress.RepeatedLabelError:
-        # usaddress can't parse this at all
-        normalized_address = str(address_val)
-    else:
-        # Address can be parsed, so let's format it.
-        normalized_address = ''
-
-        if 'AddressNumber' in addr and addr['AddressNumber'] is not None:
-            normalized_address = _normalize_address_number(addr['AddressNumber'])
-
-        if 'StreetNamePreDirectional' in addr and addr['StreetNamePreDirectional'] is not None:
-            normalized_address = normalized_address + ' ' + _normalize_address_direction(
-                    addr['StreetNamePreDirectional'])  # NOQA
-
-        if 'StreetName' in addr and addr['StreetName'] is not None:
-            normalized_address = normalized_address + ' ' + addr['StreetName']
-
-        if 'StreetNamePostType' in addr and addr['StreetNamePostType'] is not None:
-            # remove any periods from abbreviations
-            normalized_address = normalized_address + ' ' + _normalize_address_post_type(
-                    addr['StreetNamePostType'])  # NOQA
+    import_file.mapping_completion = 100
+    import_file.matching_completion = None
+    import_file.save()
+    result = {
+        'status': 'error',
+        'message': 'matching failed',
+        'progress_key': progress_key
+    }
+    set_cache(progress_key, result['status'], result)
 
-        if 'StreetNamePostDirectional' in addr and addr['StreetNamePostDirectional'] is not None:
-            normalized_address = normalized_address + ' ' + _normalize_address_direction(
-                    addr['StreetNamePostDirectional'])  # NOQA
 
-        formatter = StreetAddressFormatter()
-        normalized_address = formatter.abbrev_street_avenue_etc(normalized_address)
+def _get_normalized_address(values):
+    """Normalized address of a BS_VALUES_LIST row.
 
-    return normalized_address.lower().strip()
+    Uses the stored ``normalized_address``, falling back to normalizing
+    ``address_line_1`` for snapshots saved before it existed.
+    """
+    return values[5] or _normalize_address_str(values[4])
 
 
 def _find_matches(un_m_address, canonical_buildings_addresses):
+    """Return an exact match tuple per canonical building at un_m_address.
+
+    :param un_m_address: str, normalized address of the unmatched building.
+    :param canonical_buildings_addresses: AddressIndex of the canonical
+        buildings, or a list of their normalized addresses (scanned in full).
+    """
     match_list = []
     if not un_m_address:
         return match_list
+    if isinstance(canonical_buildings_addresses, AddressIndex):
+        pks = canonical_buildings_addresses.pks(un_m_address)
+        return [(un_m_address, 1) for _ in pks]
     for cb in canonical_buildings_addresses:
         if cb is None:
             continue
@@ -1252,26 +1500,51 @@ def _match_buildings(file_pk, user_pk):
     #     assert True
     import_file = ImportFile.objects.get(pk=file_pk)
     prog_key = get_prog_key('match_buildings', file_pk)
+    # Queued twice, or the shards of an earlier run are still going.
+    if import_file.matching_done or _matching_in_progress(import_file):
+        return
     org = Organization.objects.filter(users=import_file.import_record.owner)[0]
     unmatched_buildings = find_unmatched_buildings(import_file)
+    # Stats from an earlier run of the matching would skew the numbers.
+    MatchingStageStats.objects.filter(import_file=import_file).delete()
 
     duplicates = []
 
     newly_matched_building_pks = []
 
+    # Fetch the canonical snapshots for every ID in the import at once, and
+    # which of the buildings have data some other snapshot already has.
+    with _matching_stage(file_pk, 'id_lookup') as stage:
+        id_index = get_canonical_id_index(unmatched_buildings)
+        stage.rows = len(id_index)
+    with _matching_stage(file_pk, 'duplicate_detection') as stage:
+        fingerprint_index = get_fingerprint_index(unmatched_buildings)
+        stage.rows = len(fingerprint_index or ())
+
     # Filter out matches based on ID.
     # if the match is a duplicate of other existing data add it to a list
     # and indicate which existing record it is a duplicate of
-    for unmatched in unmatched_buildings:
-        try:
-            match = handle_id_matches(unmatched, import_file, user_pk)
-        except DuplicateDataError as e:
-            duplicates.append(unmatched.pk)
-            unmatched.duplicate_id = e.id
-            unmatched.save()
-            continue
-        if match:
-            newly_matched_building_pks.extend([match.pk, unmatched.pk])
+    # Flushed even if matching fails part way, as the merges made so far
+    # are already committed.
+    with AuditLogBuffer() as audit_logs:
+        with _matching_stage(file_pk, 'id_matching') as stage:
+            for unmatched in unmatched_buildings:
+                stage.rows += 1
+                try:
+                    match = handle_id_matches(
+                        unmatched, import_file, user_pk, id_index=id_index,
+                        fingerprint_index=fingerprint_index, audit_logs=audit_logs
+                    )
+                except DuplicateDataError as e:
+                    duplicates.append(unmatched.pk)
+                    unmatched.duplicate_id = e.id
+                    unmatched.save()
+                    continue
+                if match:
+                    newly_matched_building_pks.extend([match.pk, unmatched.pk])
+        with _matching_stage(file_pk, 'audit_logging') as stage:
+            stage.rows = len(audit_logs)
+            audit_logs.flush()
 
     # Remove any buildings we just did exact ID matches with.
     unmatched_buildings = unmatched_buildings.exclude(
@@ -1295,86 +1568,104 @@ def _match_buildings(file_pk, user_pk):
         # with same address_1 but different city
     #     unmatched_normalized_addresses=[]
 
-    unmatched_normalized_addresses = [
-        _normalize_address_str(unmatched[4]) for unmatched in unmatched_buildings
-    ]
+    # Index the canonical buildings by normalized address once, so each
+    # unmatched building is a hash lookup rather than a scan of them all.
+    with _matching_stage(file_pk, 'canonical_index') as stage:
+        can_rev_idx = AddressIndex()
+        num_canonical = 0
+        with iter_canonical_building_values(org) as rows:
+            for values in rows:
+                can_rev_idx.add(_get_normalized_address(values), values[0])
+                num_canonical += 1
+        stage.rows = num_canonical
+
+    # With no canonical buildings for this organization, all unmatched
+    # buildings will become canonicalized; no need to look at them.
+    # Canonical buildings without an address aren't in the index but can
+    # still be matched, e.g. by fuzzy matching, so count them all.
+    if not num_canonical:
+        with _matching_stage(file_pk, 'canonicalization') as stage:
+            building_pks = [values[0] for values in unmatched_buildings]
+            _canonicalize_buildings(building_pks, user_pk)
+            stage.rows = len(building_pks)
+        _finish_matching(import_file, prog_key)
+        return
+
+    with _matching_stage(file_pk, 'address_normalization') as stage:
+        unmatched_normalized_addresses = [
+            _get_normalized_address(unmatched)
+            for unmatched in unmatched_buildings
+        ]
+        stage.rows = len(unmatched_normalized_addresses)
     # Here we want all the values not related to the BS id for doing comps.
     # dont do this now
     #     unmatched_ngrams = [
     #         _stringify(list(values)[1:]) for values in unmatched_buildings
     #     ]
 
-    canonical_buildings = find_canonical_building_values(org)
-    if not canonical_buildings:
-        # There are no canonical_buildings for this organization, all unmatched
-        # buildings will then become canonicalized.
-        hydrated_unmatched_buildings = BuildingSnapshot.objects.filter(
-            pk__in=[item[0] for item in unmatched_buildings]
+    # Decide here what happens to each building: merge into the canonical
+    # snapshot at its address, or start a new canonical building (None).
+    exact_matches = []
+    with _matching_stage(file_pk, 'candidate_lookup') as stage:
+        for unmatched, un_m_address in zip(
+                unmatched_buildings, unmatched_normalized_addresses):
+            results = _find_matches(un_m_address, can_rev_idx)
+            can_snap_pk = can_rev_idx[results[0][0]] if results else None
+            exact_matches.append((
+                unmatched[0], un_m_address or unmatched[1] or unmatched[0],
+                can_snap_pk
+            ))
+        stage.rows = len(exact_matches)
+
+    # Optionally, look for near misses among the ones left.
+    fuzzy_matches = {}
+    if getattr(settings, 'MATCH_FUZZY', False):
+        with _matching_stage(file_pk, 'fuzzy_matching') as stage:
+            fuzzy_pks = [
+                pk for pk, _, match_pk in exact_matches if match_pk is None
+            ]
+            fuzzy_matches = _find_fuzzy_matches(org, fuzzy_pks)
+            stage.rows = len(fuzzy_pks)
+
+    assignments = []
+    for building_pk, address_key, can_snap_pk in exact_matches:
+        confidence, match_type = 1, SYSTEM_MATCH
+        if can_snap_pk is None:
+            can_snap_pk, confidence, match_type = fuzzy_matches.get(
+                building_pk, (None, None, None)
+            )
+        # Shard by the canonical snapshot merged into, if any.
+        shard_key = address_key if can_snap_pk is None else can_snap_pk
+        assignments.append(
+            (shard_key, building_pk, can_snap_pk, confidence, match_type)
         )
-        num_unmatched = len(unmatched_normalized_addresses) or 1
-        increment = 1.0 / num_unmatched * 100
-        for (i, unmatched) in enumerate(hydrated_unmatched_buildings):
-            initialize_canonical_building(unmatched, user_pk)
-            if i % 100 == 0:
-                increment_cache(prog_key, increment * 100)
-
-        _finish_matching(import_file, prog_key)
-        return
 
-    # This allows us to retrieve the PK for a given NGram after a match.
-    can_rev_idx = {
-        _normalize_address_str(value[4]): value[0] for value in canonical_buildings
-    }
-    # (SD) This loads up an ngram object with all the canonical buildings. The
-    # values are the lists of identifying data for each building
-    #
-    # (SD) the stringify is given all but the first item in the values list and
-    # it concatenates each item with a space in the middle
-
-    # we no longer need to
-    #     n = ngram.NGram(
-    #         [_stringify(values[1:]) for values in canonical_buildings]
-    #     )
-    # here we are going to normalize the addresses to match on address_1 field,
-    # this is not ideal because you could match on two locations with same
-    # address_1 but different city
-    canonical_buildings_addresses = [
-        _normalize_address_str(values[4]) for values in canonical_buildings
-    ]
-    # For progress tracking
-    # sd we now use the address
-    #    num_unmatched = len(unmatched_ngrams) or 1
-    num_unmatched = len(unmatched_normalized_addresses) or 1
-    # this code below seemed to be unclear when I was debugging so I added the brackets
-    increment = (1.0 / num_unmatched) * 100
-
-    # PKs when we have a match.
+    # Keep other runs off this file until finish_matching; the lock is
+    # released when we return, before the shards are done.
     import_file.mapping_completion = 0
+    import_file.matching_completion = 0
     import_file.save()
-    # this section spencer changed to make the exact match
-    for i, un_m_address in enumerate(unmatched_normalized_addresses):
-        # If we have an address, try to match it
-        if un_m_address is not None:
-            results = _find_matches(un_m_address, canonical_buildings_addresses)
-        else:
-            results = []
-
-        if results:
-            handle_results(
-                results, i, can_rev_idx, unmatched_buildings, user_pk
-            )
-        else:
-            hydrated_building = BuildingSnapshot.objects.get(
-                pk=unmatched_buildings[i][0]
-            )
-            initialize_canonical_building(hydrated_building, user_pk)
 
-        if i % 100 == 0:
-            increment_cache(prog_key, increment * 100)
-            import_file.mapping_completion += int(increment * 100)
-            import_file.save()
+    # The merges and AuditLog rows are the slow part, so run them in
+    # parallel shards. Buildings matching the same canonical building
+    # always land in the same shard.
+    cost_key = get_cost_key('match', org.pk, import_file.source_type)
+    tasks = []
+    for shard in _shard_assignments(
+            assignments, get_chunk_size(len(assignments), cost_key=cost_key)):
+        tasks.append(match_buildings_shard.s(
+            shard, file_pk, user_pk, prog_key, cost_key=cost_key
+        ))
 
-    _finish_matching(import_file, prog_key)
+    tasks = add_cache_increment_parameter(tasks)
+    callback = finish_matching.si(file_pk)
+    callback.link_error(fail_matching.si(file_pk))
+    try:
+        chord(tasks, interval=15)(callback)
+    except Exception:
+        # The chord couldn't be sent, or (when eager) a shard failed.
+        _fail_matching(import_file, prog_key)
+        raise
 
     return {
         'status': 'success',
@@ -1383,6 +1674,191 @@ def _match_buildings(file_pk, user_pk):
     }
 
 
+def _find_fuzzy_matches(org, building_pks):
+    """Find the most similar canonical snapshot for each building.
+
+    Each building is scored with ``reconcile.calculate_confidence``
+    against the canonical snapshots sharing one of its blocks (see
+    ``fuzzy_blocking_keys``), so the work grows with the size of the
+    blocks rather than with the organization.
+
+    Buildings in a street number block share that number whatever their
+    street, so the street names are compared on their own: candidates
+    whose street name is less similar than MATCH_FUZZY_STREET_THRESHOLD
+    are skipped. Matches without two street names to compare, e.g. found
+    by tax lot, are only ever possible matches.
+
+    :param org: Organization inst.
+    :param building_pks: list of PKs of the buildings to match.
+    :returns: dict, {building PK: (canonical snapshot PK, confidence,
+        match type)} for the buildings whose best match reaches
+        MATCH_MIN_THRESHOLD.
+    """
+    if not building_pks:
+        return {}
+
+    index = BlockIndex(
+        fuzzy_blocking_keys,
+        max_block_size=getattr(settings, 'MATCH_FUZZY_MAX_CANDIDATES', 50)
+    )
+    fields = ('pk',) + FUZZY_BLOCK_FIELDS
+    with iter_canonical_building_values(org, fields=fields) as rows:
+        for row in rows:
+            index.add(dict(zip(fields[1:], row[1:])), row[0])
+    if not index:
+        return {}
+
+    def street_name(snapshot):
+        return split_street_address({
+            field: getattr(snapshot, field) for field in FUZZY_BLOCK_FIELDS
+        })[1]
+
+    buildings = BuildingSnapshot.objects.in_bulk(building_pks)
+    candidates = {}
+    for building_pk, building in buildings.items():
+        candidates[building_pk] = index.candidates({
+            field: getattr(building, field) for field in FUZZY_BLOCK_FIELDS
+        })
+    candidate_snapshots = BuildingSnapshot.objects.in_bulk(
+        set(pk for pks in candidates.values() for pk in pks)
+    )
+
+    min_confidence = getattr(settings, 'MATCH_MIN_THRESHOLD', 0.3)
+    min_street = getattr(settings, 'MATCH_FUZZY_STREET_THRESHOLD', 0.8)
+    matches = {}
+    for building_pk, pks in candidates.items():
+        building = buildings[building_pk]
+        street = street_name(building)
+        best_confidence, best = 0.0, None
+        for pk in pks:
+            candidate = candidate_snapshots[pk]
+            candidate_street = street_name(candidate)
+            same_street = bool(street and candidate_street)
+            if same_street and fuzz.ratio(
+                    street, candidate_street) / 100.0 < min_street:
+                # Same number, another street.
+                continue
+            confidence = reconcile.calculate_confidence(building, candidate)
+            if confidence > best_confidence:
+                best_confidence, best = confidence, (pk, same_street)
+
+        if best is not None and best_confidence >= min_confidence:
+            pk, same_street = best
+            match_type = POSSIBLE_MATCH
+            if same_street:
+                match_type = _get_system_match_type(best_confidence)
+            matches[building_pk] = (pk, best_confidence, match_type)
+
+    return matches
+
+
+def _canonicalize_buildings(building_pks, user_pk, chunk_size=5000):
+    """Make each building its own CanonicalBuilding, in bulk.
+
+    :param building_pks: iterable of BuildingSnapshot PKs.
+    :param user_pk: user ID, used for AuditLog logging
+    :param chunk_size: int, buildings per transaction.
+    """
+    with AuditLogBuffer() as audit_logs:
+        for pks in batch(building_pks, chunk_size):
+            bulk_initialize_canonical_buildings(
+                pks, user_pk, audit_logs=audit_logs
+            )
+
+
+def _shard_assignments(assignments, chunk_size):
+    """Split match assignments into shards by their blocking key.
+
+    Every assignment with the same key goes to the same shard, in the
+    order given, so that no two shards touch the same canonical building.
+
+    :param assignments: list of
+        (shard_key, building_pk, can_snap_pk, confidence, match_type).
+    :param chunk_size: int, the number of buildings we want per shard.
+    :rtype: list of lists of
+        (building_pk, can_snap_pk, confidence, match_type)
+    """
+    num_shards = int(math.ceil(len(assignments) / float(chunk_size))) or 1
+    shards = [[] for _ in range(num_shards)]
+    for shard_key, building_pk, can_snap_pk, confidence, match_type in (
+            assignments):
+        # crc32 rather than hash() so shards don't depend on the process.
+        shard = zlib.crc32(unicode(shard_key).encode('utf-8')) % num_shards
+        shards[shard].append(
+            (building_pk, can_snap_pk, confidence, match_type)
+        )
+
+    return [assigned for assigned in shards if assigned]
+
+
+@shared_task
+def match_buildings_shard(
+    assignments, file_pk, user_pk, prog_key, increment, cost_key=None
+):
+    """Save the system matches for one shard of an import.
+
+    :param assignments: list of
+        (building_pk, can_snap_pk, confidence, match_type); can_snap_pk is
+        the canonical snapshot to merge into, or None for a new building.
+    :param file_pk: int, the PK for an ImportFile obj.
+    :param user_pk: user ID, used for AuditLog logging
+    :param prog_key: str, the progress key for the matching.
+    :param increment: float, progress this shard accounts for.
+    :param cost_key: (optional) str, where to record how long we took.
+    """
+    start = time.time()
+    new_pks = [
+        pk for pk, can_snap_pk, _, _ in assignments if can_snap_pk is None
+    ]
+    # Flushed even if the shard fails part way, as the merges made so far
+    # are already committed.
+    with AuditLogBuffer() as audit_logs:
+        with _matching_stage(file_pk, 'canonicalization') as stage:
+            bulk_initialize_canonical_buildings(
+                new_pks, user_pk, audit_logs=audit_logs
+            )
+            stage.rows = len(new_pks)
+
+        # Address matches; all merged with bulk queries.
+        with _matching_stage(file_pk, 'merges') as stage:
+            results = save_snapshot_matches([
+                (
+                    can_snap_pk,
+                    building_pk,
+                    confidence,
+                    match_type,
+                    building_pk,
+                )
+                for building_pk, can_snap_pk, confidence, match_type
+                in assignments
+                if can_snap_pk is not None
+            ])
+            stage.rows = len(results)
+
+        with _matching_stage(file_pk, 'audit_logging') as stage:
+            for bs, changes in results:
+                _log_system_match(
+                    bs, changes, user_pk, 'System matched building.', audit_logs
+                )
+            stage.rows = len(audit_logs)
+            audit_logs.flush()
+
+    record_chunk_cost(cost_key, len(assignments), time.time() - start)
+    increment_cache(prog_key, increment)
+
+
+@shared_task
+def finish_matching(file_pk):
+    import_file = ImportFile.objects.get(pk=file_pk)
+    _finish_matching(import_file, get_prog_key('match_buildings', file_pk))
+
+
+@shared_task
+def fail_matching(file_pk):
+    import_file = ImportFile.objects.get(pk=file_pk)
+    _fail_matching(import_file, get_prog_key('match_buildings', file_pk))
+
+
 @shared_task
 @lock_and_track
 def _remap_data(import_file_pk):
@@ -1394,6 +1870,9 @@ def _remap_data(import_file_pk):
     """
     # Reset mapping progress cache as well.
     import_file = ImportFile.objects.get(pk=import_file_pk)
+    # Matching may have started since remap_data checked.
+    if import_file.matching_done or _matching_in_progress(import_file):
+        return
     # Delete buildings already mapped for this file.
     BuildingSnapshot.objects.filter(
         import_file=import_file,
@@ -1415,7 +1894,7 @@ def remap_data(import_file_pk):
     import_file = ImportFile.objects.get(pk=import_file_pk)
     # Check to ensure that the building has not already been merged.
     mapping_cache_key = get_prog_key('map_data', import_file.pk)
-    if import_file.matching_done or import_file.matching_completion:
+    if import_file.matching_done or _matching_in_progress(import_file):
         result = {
             'status': 'warning',
             'progress': 100,
@@ -1547,12 +2026,20 @@ def log_deleted_buildings(ids, user_pk, chunk_size=300):
     AuditLog logs a delete entry for the canonical building or each
     BuildingSnapshot in ``ids``
     """
-    for del_ids in batch(ids, chunk_size):
-        for b in BuildingSnapshot.objects.filter(pk__in=del_ids):
-            AuditLog.objects.create(
-                user_id=user_pk,
-                content_object=b.canonical_building,
-                organization=b.super_organization,
-                action='delete_building',
-                action_note='Deleted building.'
+    content_type = ContentType.objects.get_for_model(CanonicalBuilding)
+    with AuditLogBuffer() as audit_logs:
+        for del_ids in batch(ids, chunk_size):
+            rows = BuildingSnapshot.objects.filter(pk__in=del_ids).values_list(
+                'canonical_building_id', 'super_organization_id'
             )
+            for canonical_building_id, organization_id in rows:
+                audit_logs.log(
+                    user_id=user_pk,
+                    content_type=(
+                        content_type if canonical_building_id else None
+                    ),
+                    object_id=canonical_building_id,
+                    organization_id=organization_id,
+                    action='delete_building',
+                    action_note='Deleted building.'
+                )
@@ -4,10 +4,15 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+import time
+
 from django.test import TestCase
 
 from seed import decorators
-from seed.utils.cache import make_key, get_cache, get_lock, increment_cache, clear_cache
+from seed.utils.cache import (
+    make_key, get_cache, get_cache_raw, get_lock, increment_cache, clear_cache,
+    set_cache, acquire_lock, release_lock
+)
 
 class TestException(Exception):
     pass
@@ -51,6 +56,27 @@ class TestDecorators(TestCase):
         expected = 100.0
         self.assertEqual(float(get_cache(test_key)['progress']), expected)
 
+    def test_increment_cache_after_set_cache(self):
+        """set_cache replaces progress; increments then add to it."""
+        test_key = make_key('increment_set_test')
+        increment_cache(test_key, 40.0)
+        set_cache(test_key, 'parsing', 10.0)
+        self.assertEqual(float(get_cache(test_key)['progress']), 10.0)
+
+        # Thirds add up to a whole, despite being rounded to units.
+        for i in range(3):
+            increment_cache(test_key, 10.0 / 3)
+        self.assertEqual(float(get_cache(test_key)['progress']), 20.0)
+
+        set_cache(test_key, 'success', 100.0)
+        self.assertEqual(get_cache(test_key)['status'], 'success')
+
+    def test_get_cache_does_not_write(self):
+        """Reading progress doesn't store the default."""
+        test_key = make_key('read_only_test')
+        self.assertEqual(float(get_cache(test_key, 0.0)['progress']), 0.0)
+        self.assertEqual(get_cache_raw(test_key), None)
+
     ## Tests for decorators themselves.
 
     def test_locking(self):
@@ -79,6 +105,41 @@ class TestDecorators(TestCase):
         # Even though execution failed part way through a call, we unlock.
         self.assertEqual(int(get_lock(key)), self.unlocked)
 
+    def test_locking_contention(self):
+        """A second caller doesn't get a lock someone else holds."""
+        key = decorators._get_lock_key('fake_func', self.pk)
+
+        @decorators.lock_and_track
+        def fake_func(import_file_pk):
+            return {'status': 'success'}
+
+        token = acquire_lock(key)
+        with self.settings(LOCK_WAIT_SECONDS=0):
+            self.assertEqual(fake_func(self.pk), {'error': 'locked'})
+        # Releasing with the wrong token leaves the lock alone.
+        release_lock(key, 'not the owner')
+        self.assertEqual(int(get_lock(key)), self.locked)
+        release_lock(key, token)
+
+        self.assertEqual(fake_func(self.pk)['status'], 'success')
+        stats = decorators.get_lock_stats('fake_func')
+        self.assertEqual(stats['acquired'], 1)
+        self.assertEqual(stats['contended'], 1)
+
+    def test_lock_heartbeat(self):
+        """The lock is renewed while the task runs past its timeout."""
+        key = decorators._get_lock_key('slow_func', self.pk)
+
+        @decorators.lock_and_track
+        def slow_func(import_file_pk):
+            time.sleep(2.5)
+            self.assertEqual(int(get_lock(key)), self.locked)
+
+        with self.settings(LOCK_TIMEOUT=1, LOCK_HEARTBEAT_SECONDS=0.2):
+            slow_func(self.pk)
+
+        self.assertEqual(int(get_lock(key)), self.unlocked)
+
     def test_progress(self):
         """When a task finishes, it increments the progress counter properly."""
         increment = expected = 25.0
@@ -5,7 +5,18 @@
 :author
 """
 from django.test import TestCase
-from seed.tasks import _normalize_address_str
+from seed.models import POSSIBLE_MATCH, SYSTEM_MATCH
+from seed.tasks import (
+    _find_matches, _normalize_address_str, _shard_assignments
+)
+from seed.utils import address
+from seed.utils.matching import (
+    AddressIndex,
+    BlockIndex,
+    IdIndex,
+    fuzzy_blocking_keys,
+    split_street_address,
+)
 
 
 def make_method(message, expected):
@@ -42,6 +53,7 @@ class NormalizeStreetAddressTests(TestCase):
         ('missing number', 'Test St.', 'test st'),
         ('missing street', '123', '123'),
         ('integer address', 123, '123'),
+        ('non ascii', u'123 Caf\xe9 St.', u'123 caf\xe9 st'),
         ('strip leading zeros', '0000123', '123'),
         ('street 1', 'STREET', 'st'),
         ('street 2', 'Street', 'st'),
@@ -72,3 +84,226 @@ class NormalizeStreetAddressTests(TestCase):
         # Ranges which leave off common prefix.
         ('end of range leaves off common prefix', '300-22 S Green St', '300-322 s green st'),
     ]
+
+
+class NormalizeAddressCacheTests(TestCase):
+
+    def setUp(self):
+        address.clear_normalize_cache()
+
+    def tearDown(self):
+        address.clear_normalize_cache()
+
+    def test_cache(self):
+        self.assertEqual(
+            address.normalize_address_str('123 Test St.'), '123 test st'
+        )
+        self.assertEqual(
+            address.normalize_address_str('123 Test St.'), '123 test st'
+        )
+        self.assertEqual(address.normalize_address_str(None), None)
+
+        info = address.normalize_cache_info()
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['size'], 1)
+
+    def test_cache_size(self):
+        maxsize = address.NORMALIZE_CACHE_SIZE
+        address.NORMALIZE_CACHE_SIZE = 2
+        try:
+            for value in ['1 A St', '2 B St', '3 C St']:
+                address.normalize_address_str(value)
+        finally:
+            address.NORMALIZE_CACHE_SIZE = maxsize
+
+        self.assertEqual(address.normalize_cache_info()['size'], 2)
+        # The oldest entry was evicted.
+        address.normalize_address_str('1 A St')
+        self.assertEqual(address.normalize_cache_info()['misses'], 4)
+
+
+class AddressIndexTests(TestCase):
+
+    def test_lookup(self):
+        index = AddressIndex()
+        index.add('123 test st', 1)
+        index.add('123 test st', 2)
+        index.add('9 main st', 3)
+        index.add(None, 4)
+
+        self.assertEqual(len(index), 2)
+        self.assertTrue('123 test st' in index)
+        self.assertFalse(None in index)
+        self.assertFalse('1 nowhere' in index)
+        self.assertEqual(index.pks('123 test st'), [1, 2])
+        # Last one wins, as with the dict this replaced.
+        self.assertEqual(index['123 test st'], 2)
+        self.assertEqual(index.get('1 nowhere'), None)
+        self.assertRaises(KeyError, lambda: index['1 nowhere'])
+
+    def test_candidates(self):
+        index = AddressIndex(blocking_keys=lambda a: [a.split(' ')[0]])
+        index.add('123 test st', 1)
+        index.add('123 test ave', 2)
+        index.add('9 main st', 3)
+
+        self.assertEqual(
+            index.candidates('123 tset st'), ['123 test ave', '123 test st']
+        )
+        self.assertEqual(index.candidates('10 main st'), [])
+        self.assertEqual(AddressIndex().candidates('123 test st'), [])
+
+    def test_find_matches(self):
+        index = AddressIndex()
+        index.add('123 test st', 1)
+        index.add('123 test st', 2)
+
+        self.assertEqual(
+            _find_matches('123 test st', index),
+            _find_matches('123 test st', ['123 test st', None, '123 test st'])
+        )
+        self.assertEqual(_find_matches('9 main st', index), [])
+
+
+class ShardAssignmentsTests(TestCase):
+
+    def test_same_key_same_shard(self):
+        assignments = [
+            (10, 1, 10, 1, SYSTEM_MATCH),
+            ('9 main st', 2, None, None, None),
+            (10, 3, 10, 0.5, POSSIBLE_MATCH),
+            ('1 other rd', 4, None, None, None),
+            (10, 5, 10, 1, SYSTEM_MATCH),
+        ]
+        shards = _shard_assignments(assignments, 2)
+
+        self.assertTrue(1 <= len(shards) <= 3)
+        self.assertEqual(
+            sorted(a[0] for shard in shards for a in shard),
+            [1, 2, 3, 4, 5]
+        )
+        shard = [s for s in shards if (1, 10, 1, SYSTEM_MATCH) in s][0]
+        # Kept together, in their original order.
+        self.assertEqual(
+            [a for a in shard if a[0] in (1, 3, 5)],
+            [
+                (1, 10, 1, SYSTEM_MATCH),
+                (3, 10, 0.5, POSSIBLE_MATCH),
+                (5, 10, 1, SYSTEM_MATCH),
+            ]
+        )
+
+    def test_one_shard(self):
+        assignments = [
+            ('a', 1, None, None, None), (7, 2, 7, 1, SYSTEM_MATCH)
+        ]
+        self.assertEqual(
+            _shard_assignments(assignments, 100),
+            [[(1, None, None, None), (2, 7, 1, SYSTEM_MATCH)]]
+        )
+
+
+class BlockIndexTests(TestCase):
+
+    def test_fuzzy_blocking_keys(self):
+        self.assertEqual(
+            fuzzy_blocking_keys({
+                'normalized_address': '555 nw databaseer ln',
+                'address_line_1': '555 NorthWest Databaseer Lane.',
+                'postal_code': '94103-1234',
+                'tax_lot_id': '435/422',
+            }),
+            [('street', '555', '94103'), ('tax_lot', '435')]
+        )
+        self.assertEqual(
+            fuzzy_blocking_keys({'address_line_1': 'Main St'}), []
+        )
+
+    def test_split_street_address(self):
+        self.assertEqual(
+            split_street_address({
+                'normalized_address': '555 nw databaseer ln',
+                'address_line_1': '555 NorthWest Databaseer Lane.',
+            }),
+            ('555', 'nw databaseer ln')
+        )
+        self.assertEqual(
+            split_street_address({'address_line_1': ' 12 Elm St'}),
+            ('12', 'elm st')
+        )
+        self.assertEqual(
+            split_street_address({'address_line_1': 'Main St'}),
+            (None, 'main st')
+        )
+        self.assertEqual(split_street_address({}), (None, ''))
+
+    def test_candidates(self):
+        index = BlockIndex(fuzzy_blocking_keys)
+        index.add({'address_line_1': '12 Main St', 'postal_code': '8999'}, 1)
+        index.add({'address_line_1': '12 Mian St', 'postal_code': '8999'}, 2)
+        index.add({'address_line_1': '12 Main St', 'postal_code': '1000'}, 3)
+        index.add({'tax_lot_id': '435-1'}, 4)
+
+        self.assertEqual(
+            index.candidates({
+                'address_line_1': '12 Main Street',
+                'postal_code': '8999',
+                'tax_lot_id': '435/2',
+            }),
+            [1, 2, 4]
+        )
+        self.assertEqual(index.candidates({'address_line_1': '9 Main'}), [])
+
+    def test_max_block_size(self):
+        index = BlockIndex(fuzzy_blocking_keys, max_block_size=1)
+        index.add({'address_line_1': '12 Main St'}, 1)
+        index.add({'address_line_1': '12 Elm St'}, 2)
+        index.add({'tax_lot_id': '435/1'}, 3)
+
+        # The street number block is too big to be useful.
+        self.assertEqual(
+            index.candidates({
+                'address_line_1': '12 Main St', 'tax_lot_id': '435/9'
+            }),
+            [3]
+        )
+
+
+class FakeSnapshot(object):
+
+    def __init__(self, pk, org=1, **ids):
+        self.pk = pk
+        self.super_organization_id = org
+        for field in ('pm_property_id', 'tax_lot_id', 'custom_id_1'):
+            setattr(self, field, ids.get(field))
+
+
+class IdIndexTests(TestCase):
+
+    def test_candidates(self):
+        can1 = FakeSnapshot(1, pm_property_id='100')
+        can2 = FakeSnapshot(2, tax_lot_id='200', custom_id_1='100')
+        other_org = FakeSnapshot(3, org=2, pm_property_id='100')
+        index = IdIndex([can2, can1, other_org])
+
+        # IDs match across fields, within the same org.
+        unmatched = FakeSnapshot(4, custom_id_1='100')
+        self.assertEqual(index.candidates(unmatched), [can1, can2])
+        unmatched = FakeSnapshot(5, pm_property_id='200')
+        self.assertEqual(index.candidates(unmatched), [can2])
+        self.assertEqual(index.candidates(FakeSnapshot(6)), [])
+
+    def test_replace(self):
+        can1 = FakeSnapshot(1, pm_property_id='100')
+        index = IdIndex([can1])
+        child = FakeSnapshot(7, pm_property_id='100', tax_lot_id='300')
+        index.replace([can1], child)
+
+        self.assertEqual(len(index), 1)
+        self.assertEqual(
+            index.candidates(FakeSnapshot(8, pm_property_id='100')), [child]
+        )
+        self.assertEqual(
+            index.candidates(FakeSnapshot(9, custom_id_1='300')), [child]
+        )
@@ -6,7 +6,9 @@
 """
 from datetime import datetime
 
+from django.db import connection
 from django.test import TestCase
+from mock import patch
 from seed.lib.superperms.orgs.models import Organization, OrganizationUser
 from seed.data_importer.models import ImportFile, ImportRecord
 from seed.landing.models import SEEDUser as User
@@ -110,6 +112,113 @@ class TestBuildingSnapshot(TestCase):
             bs_model.generation_date, expected_value
         )
 
+    def test_normalized_address(self):
+        """Saving a snapshot stores its normalized address."""
+        self.assertEqual(self.bs1.normalized_address, '555 database ln')
+
+        self.bs1.address_line_1 = ''
+        self.bs1.save()
+        self.assertEqual(self.bs1.normalized_address, None)
+
+        self.bs1.address_line_1 = u'123 Caf\xe9 St'
+        self.bs1.save()
+        self.assertEqual(self.bs1.normalized_address, u'123 caf\xe9 st')
+
+        # An address we can't normalize doesn't keep the snapshot from saving.
+        with patch(
+            'seed.models.normalize_address_str', side_effect=ValueError
+        ):
+            self.bs1.address_line_1 = '1 Broken Rd'
+            self.bs1.save()
+        self.assertEqual(self.bs1.normalized_address, None)
+        self.assertEqual(
+            seed_models.BuildingSnapshot.objects.get(
+                pk=self.bs1.pk
+            ).address_line_1,
+            '1 Broken Rd'
+        )
+
+    def test_fingerprint(self):
+        """Snapshots with the same data have the same fingerprint."""
+        self._add_additional_fake_buildings()
+        bs3 = seed_models.BuildingSnapshot.objects.get(pk=self.bs3.pk)
+        bs4 = seed_models.BuildingSnapshot.objects.get(pk=self.bs4.pk)
+        bs5 = seed_models.BuildingSnapshot.objects.get(pk=self.bs5.pk)
+
+        self.assertEqual(len(bs4.fingerprint), 40)
+        self.assertEqual(bs4.fingerprint, bs5.fingerprint)
+        self.assertNotEqual(bs3.fingerprint, bs4.fingerprint)
+        # The saved value is what we'd compute from the loaded snapshot.
+        self.assertEqual(bs4.fingerprint, bs4.compute_fingerprint())
+
+        bs5.extra_data = {'a': 1}
+        self.assertNotEqual(bs5.compute_fingerprint(), bs4.fingerprint)
+
+    def test_canonical_snapshots(self):
+        """Only the org's active canonical snapshots are found."""
+        self._add_additional_fake_buildings()
+        other_org = Organization.objects.create()
+        for snapshot in (self.bs1, self.bs2, self.bs3):
+            snapshot.super_organization = self.fake_org
+            snapshot.save()
+        self.bs4.super_organization = other_org
+        self.bs4.save()
+        other_canon = util.make_fake_snapshot(
+            self.import_file1, self.bs2_data,
+            bs_type=seed_models.COMPOSITE_BS, is_canon=True, org=other_org
+        )
+        canon = self.bs2.canonical_building
+        canon.active = False
+        canon.save()
+
+        self.assertEqual(
+            list(seed_models.get_canonical_snapshots(self.fake_org)),
+            [self.bs1]
+        )
+        both_orgs = seed_models.get_canonical_snapshots(
+            [self.fake_org, other_org.pk]
+        )
+        self.assertIn(self.bs1, both_orgs)
+        self.assertIn(other_canon, both_orgs)
+        self.assertEqual(
+            set(both_orgs),
+            set(seed_models.get_canonical_snapshots(self.fake_org)) |
+            set(seed_models.get_canonical_snapshots(other_org))
+        )
+        with seed_models.iter_canonical_building_values(
+                self.fake_org.pk, batch_size=1) as rows:
+            values = list(rows)
+        self.assertEqual(values, list(
+            seed_models.find_canonical_building_values(self.fake_org)
+        ))
+        self.assertEqual(values[0][0], self.bs1.pk)
+        self.assertEqual(len(values[0]), len(seed_models.BS_VALUES_LIST))
+
+    def test_server_side_rows_closed_early(self):
+        """Leaving the block before the last row still ends its transaction."""
+        self._add_additional_fake_buildings()
+        for snapshot in (self.bs1, self.bs2, self.bs3):
+            snapshot.super_organization = self.fake_org
+            snapshot.save()
+
+        depth = len(connection.savepoint_ids)
+        with seed_models.iter_canonical_building_values(
+                self.fake_org, batch_size=1) as rows:
+            self.assertEqual(len(connection.savepoint_ids), depth + 1)
+            next(iter(rows))
+        self.assertEqual(len(connection.savepoint_ids), depth)
+        self.assertEqual(rows.cursor, None)
+
+        # Writes after the block aren't tied to the cursor's transaction.
+        self.bs1.property_name = 'After the cursor'
+        self.bs1.save()
+        self.assertEqual(
+            seed_models.BuildingSnapshot.objects.get(
+                pk=self.bs1.pk
+            ).property_name,
+            'After the cursor'
+        )
+
     def test_source_attributions(self):
         """Test that we can point back to an attribute's source.
 
@@ -161,6 +270,30 @@ class TestBuildingSnapshot(TestCase):
         self.assertEqual(bs2.tip, bs3)
         self.assertEqual(bs3.tip, bs3)
 
+    def test_get_tip_from_canonical_building(self):
+        """get_tip reads the canonical pointer, unless it's stale."""
+        bs1 = seed_models.BuildingSnapshot.objects.create()
+        bs2 = seed_models.BuildingSnapshot.objects.create()
+        bs3 = seed_models.BuildingSnapshot.objects.create()
+        bs1.children.add(bs2)
+        bs2.children.add(bs3)
+
+        canon = seed_models.CanonicalBuilding.objects.create(
+            canonical_snapshot=bs3
+        )
+        for bs in (bs1, bs2, bs3):
+            bs.canonical_building = canon
+            bs.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(seed_models.get_tip(bs1), bs3)
+
+        # Pointing at the middle of the tree, so we walk it instead.
+        canon.canonical_snapshot = bs2
+        canon.save()
+        self.assertEqual(seed_models.get_tip(bs1), bs3)
+        self.assertEqual(seed_models.find_canonical_tip(canon), bs3)
+
     def test_remove_child(self):
         """Test behavior for removing a child."""
         bs1 = seed_models.BuildingSnapshot.objects.create()
@@ -214,6 +347,91 @@ class TestBuildingSnapshot(TestCase):
             (u'custom_id_1', 100)
         )
 
+    def test_get_column_mapping_resolver(self):
+        """Bulk resolver agrees with get_column_mapping, in two queries."""
+        org1 = Organization.objects.create()
+        org2 = Organization.objects.create()
+
+        raw_column = seed_models.Column.objects.create(
+            column_name=u'Some Weird City ID',
+            organization=org2
+        )
+        mapped_column = seed_models.Column.objects.create(
+            column_name=u'custom_id_1',
+            organization=org2
+        )
+        column_mapping1 = seed_models.ColumnMapping.objects.create(
+            super_organization=org2,
+        )
+        column_mapping1.column_raw.add(raw_column)
+        column_mapping1.column_mapped.add(mapped_column)
+
+        concat_raw = [
+            seed_models.Column.objects.create(
+                column_name=name, organization=org2
+            ) for name in (u'Street Number', u'Street Name')
+        ]
+        concat_mapping = seed_models.ColumnMapping.objects.create(
+            super_organization=org2,
+        )
+        concat_mapping.column_raw.add(*concat_raw)
+        concat_mapping.column_mapped.add(seed_models.Column.objects.create(
+            column_name=u'address_line_1', organization=org2
+        ))
+
+        raw_columns = [
+            u'Some Weird City ID', u'Street Number', u'Street Name', u'random'
+        ]
+        # Doesn't give us a mapping from another org.
+        resolver = seed_models.get_column_mapping_resolver(raw_columns, org1)
+        self.assertEqual(resolver(u'Some Weird City ID', org1), None)
+
+        with self.assertNumQueries(2):
+            resolver = seed_models.get_column_mapping_resolver(
+                raw_columns, org2
+            )
+        with self.assertNumQueries(0):
+            results = [resolver(raw, org2) for raw in raw_columns]
+
+        self.assertEqual(results, [
+            seed_models.get_column_mapping(raw, org2, 'column_mapped')
+            for raw in raw_columns
+        ])
+        self.assertEqual(results[0], (u'custom_id_1', 100))
+        self.assertEqual(results[1], ([u'address_line_1'], 100))
+        self.assertEqual(results[3], None)
+
+    def test_save_column_names(self):
+        """Only missing columns are inserted, flagged as extra_data or not."""
+        org = Organization.objects.create()
+        seed_models.Column.objects.create(
+            column_name=u'Existing Note', organization=org, is_extra_data=True
+        )
+        bs = seed_models.BuildingSnapshot(
+            super_organization=org,
+            extra_data={
+                u'Existing Note': u'a',
+                u'New Note': u'b',
+                u'property_name': u'c',
+            }
+        )
+
+        seed_models.save_column_names(bs)
+
+        columns = seed_models.Column.objects.filter(organization=org)
+        self.assertEqual(sorted(columns.values_list(
+            'column_name', 'is_extra_data'
+        )), [
+            (u'Existing Note', True),
+            (u'New Note', True),
+            (u'property_name', False),
+        ])
+
+        # Everything exists now, so all it takes is one lookup.
+        with self.assertNumQueries(1):
+            seed_models.save_column_names(bs)
+        self.assertEqual(columns.count(), 3)
+
     def test_get_column_mappings(self):
         """We produce appropriate data structure for mapping"""
         expected = dict(sorted([
@@ -291,6 +509,48 @@ class TestBuildingSnapshot(TestCase):
         refreshed_bs2_canon = refreshed_bs2.canonical_building
         self.assertFalse(refreshed_bs2_canon.active)
 
+    def test_save_snapshot_matches(self):
+        """Batch matching gives the same trees as matching one by one."""
+        self._add_additional_fake_buildings()
+        canon1 = self.bs1.canonical_building
+        canon2 = self.bs2.canonical_building
+
+        results = seed_models.save_snapshot_matches([
+            (self.bs1.pk, self.bs3.pk, 0.9, seed_models.SYSTEM_MATCH),
+            (self.bs2.pk, self.bs4.pk, 0.9, seed_models.SYSTEM_MATCH),
+            # Same tree as the first; merges into its child.
+            (self.bs1.pk, self.bs5.pk, 0.8, seed_models.POSSIBLE_MATCH),
+            (self.bs1.pk, self.bs1.pk, 1, seed_models.SYSTEM_MATCH),
+        ], user=self.fake_user)
+
+        self.assertEqual(results[3], None)
+        child1, child2, child3 = [
+            seed_models.BuildingSnapshot.objects.get(pk=result[0].pk)
+            for result in results[:3]
+        ]
+        self.assertEqual(
+            sorted(p.pk for p in child1.parents.all()),
+            [self.bs1.pk, self.bs3.pk]
+        )
+        self.assertEqual(
+            sorted(p.pk for p in child3.parents.all()),
+            [child1.pk, self.bs5.pk]
+        )
+        self.assertEqual(child3.confidence, 0.8)
+        self.assertEqual(child3.match_type, seed_models.POSSIBLE_MATCH)
+        self.assertEqual(child3.source_type, seed_models.COMPOSITE_BS)
+        self.assertEqual(child3.last_modified_by, self.fake_user)
+        self.assertEqual(child1.property_name, self.bs1.property_name)
+
+        # The meter moves down to the child.
+        self.assertEqual([m.pk for m in child2.meters.all()], [self.meter.pk])
+
+        canon1 = seed_models.CanonicalBuilding.objects.get(pk=canon1.pk)
+        canon2 = seed_models.CanonicalBuilding.objects.get(pk=canon2.pk)
+        self.assertEqual(canon1.canonical_snapshot, child3)
+        self.assertEqual(canon2.canonical_snapshot, child2)
+        self.assertEqual(seed_models.get_tip(self.bs3), child3)
+
     def test_save_snapshot_match_default_to_first_building(self):
         """Test good case for saving a snapshot match with the first building as default."""
         self._check_save_snapshot_match_with_default(self.bs1.pk)
@@ -486,6 +746,63 @@ class TestBuildingSnapshot(TestCase):
         # Root parent case
         self.assertEqual(self.bs1.parent_tree, [])
 
+    def test_co_parent_and_ancestors(self):
+        """Lineage lookups follow the whole tree."""
+        self._add_additional_fake_buildings()
+        raw = seed_models.BuildingSnapshot.objects.create(
+            source_type=seed_models.ASSESSED_RAW
+        )
+        raw.children.add(self.bs1)
+        self.bs1.children.add(self.bs3)
+        self.bs2.children.add(self.bs3)
+        self.bs3.children.add(self.bs5)
+        self.bs4.children.add(self.bs5)
+
+        def recurse_tree(snapshot, attr):
+            """The per-snapshot walk get_snapshot_tree replaced."""
+            nodes = []
+            for node in getattr(snapshot, attr).all():
+                nodes.extend(recurse_tree(node, attr))
+            nodes.extend(getattr(snapshot, attr).all())
+            return nodes
+
+        self.assertEqual(self.bs1.co_parent, self.bs2)
+        self.assertEqual(self.bs2.co_parent, self.bs1)
+        self.assertEqual(self.bs4.co_parent, self.bs3)
+        self.assertEqual(self.bs5.co_parent, None)
+
+        # Composite snapshots are walked through, but not returned, and
+        # raw ones are left out. Newest modified first, not M2M order.
+        self.assertEqual(
+            seed_models.get_ancestors(self.bs5), [self.bs2, self.bs1]
+        )
+        self.assertEqual(
+            self.bs5.parent_tree,
+            [raw, self.bs2, self.bs1, self.bs4, self.bs3]
+        )
+        self.assertEqual(
+            self.bs5.parent_tree, recurse_tree(self.bs5, 'parents')
+        )
+        self.assertEqual(
+            raw.child_tree, list(reversed(recurse_tree(raw, 'children')))
+        )
+        self.assertEqual(raw.tip, self.bs5)
+
+        # Follows the snapshots' modified time.
+        self.bs1.save()
+        self.assertEqual(self.bs2.co_parent, self.bs1)
+        self.assertEqual(self.bs3.co_parent, self.bs4)
+        self.assertEqual(
+            seed_models.get_ancestors(self.bs5), [self.bs1, self.bs2]
+        )
+        self.assertEqual(
+            self.bs5.parent_tree,
+            [raw, self.bs1, self.bs2, self.bs4, self.bs3]
+        )
+        self.assertEqual(
+            self.bs5.parent_tree, recurse_tree(self.bs5, 'parents')
+        )
+
     def test_unmatch_snapshot_tree_last_match(self):
         """
         Tests the simplest case of unmatching a building where the child
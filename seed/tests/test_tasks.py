@@ -6,15 +6,20 @@
 """
 from os import path
 import logging
+import tempfile
 
 from dateutil import parser
 
 from mock import patch
+from django.conf import settings
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.core.files import File
 from seed.audit_logs.models import AuditLog
 from seed.data_importer.models import ImportFile, ImportRecord
 from seed.landing.models import SEEDUser as User
+from seed.lib.mcm import reader
 from seed.lib.superperms.orgs.models import Organization, OrganizationUser
 from seed.models import (
     ASSESSED_RAW,
@@ -27,6 +32,7 @@ from seed.models import (
     CanonicalBuilding,
     Column,
     ColumnMapping,
+    MatchingStageStats,
     Unit,
     get_ancestors,
 )
@@ -89,6 +95,25 @@ class TestCleaner(TestCase):
             '123,456'
         )
 
+    def test_mapping_plan(self):
+        """The mapping plan is cached under a hash of its contents."""
+        plan = tasks._build_mapping_plan(self.org)
+        self.assertEqual(plan['mapping'], {u'raw_col': u'mapped_col'})
+        self.assertEqual(plan['apply_columns'], [u'raw_col'])
+        self.assertEqual(
+            plan['cleaner_types'], tasks._get_cleaner_types(self.org)
+        )
+
+        plan_key = tasks._cache_mapping_plan(plan)
+        self.assertEqual(tasks.get_cache_raw(plan_key), plan)
+        self.assertEqual(
+            tasks._cache_mapping_plan(tasks._build_mapping_plan(self.org)),
+            plan_key
+        )
+
+        plan['mapping'][u'other_col'] = u'gross_floor_area'
+        self.assertNotEqual(tasks._cache_mapping_plan(plan), plan_key)
+
 
 class TestTasks(TestCase):
     """Tests for dealing with SEED related tasks."""
@@ -252,6 +277,44 @@ class TestTasks(TestCase):
             sorted([d.column_name for d in data_columns]), ['Double Tester']
         )
 
+    def test_map_data_saves_column_names_from_every_row(self):
+        """extra_data keys found only in earlier rows are saved too."""
+        fake_import_file = ImportFile.objects.create(
+            import_record=self.import_record,
+            raw_save_done=True
+        )
+        for extra_key in (u'First Note', u'Second Note'):
+            fake_row = dict(self.fake_row)
+            fake_row[extra_key] = u'A note'
+            BuildingSnapshot.objects.create(
+                import_file=fake_import_file,
+                extra_data=fake_row,
+                source_type=ASSESSED_RAW
+            )
+
+        util.make_fake_mappings(self.fake_mappings, self.fake_org)
+
+        tasks.map_data(fake_import_file.pk)
+
+        mapped_bs = BuildingSnapshot.objects.filter(
+            import_file=fake_import_file,
+            source_type=ASSESSED_BS,
+        )
+        self.assertEqual(mapped_bs.count(), 2)
+        self.assertEqual(
+            set(bs.property_name for bs in mapped_bs),
+            set([self.fake_row['Name']])
+        )
+
+        data_columns = Column.objects.filter(
+            organization=self.fake_org,
+            is_extra_data=True
+        )
+        self.assertListEqual(
+            sorted([d.column_name for d in data_columns]),
+            ['Double Tester', 'First Note', 'Second Note']
+        )
+
     def test_mapping_w_concat(self):
         """When we have a json encoded list as a column mapping, we concat."""
         fake_import_file = ImportFile.objects.create(
@@ -467,6 +530,38 @@ class TestTasks(TestCase):
 
         self.assertRaises(tasks.DuplicateDataError, tasks.handle_id_matches, new_snapshot, duplicate_import_file, self.fake_user.pk)
 
+        id_index = tasks.get_canonical_id_index([new_snapshot])
+        self.assertEqual(len(id_index), 1)
+        self.assertRaises(
+            tasks.DuplicateDataError, tasks.handle_id_matches, new_snapshot,
+            duplicate_import_file, self.fake_user.pk, id_index=id_index
+        )
+
+    def test_fingerprint_index_needs_backfill(self):
+        """Snapshots without a fingerprint turn off the duplicate shortcut."""
+        old_snapshot = util.make_fake_snapshot(
+            self.import_file, {'address_line_1': '1 Old St'}, ASSESSED_BS,
+            is_canon=True, org=self.fake_org
+        )
+        new_snapshot = util.make_fake_snapshot(
+            self.import_file, {'address_line_1': '2 New St'}, PORTFOLIO_BS,
+            org=self.fake_org
+        )
+        self.assertEqual(
+            dict(tasks.get_fingerprint_index([new_snapshot])),
+            {new_snapshot.fingerprint: set([new_snapshot.pk])}
+        )
+
+        # As if saved before the fingerprint column was added.
+        BuildingSnapshot.objects.filter(pk=old_snapshot.pk).update(
+            fingerprint=None
+        )
+        fingerprint_index = tasks.get_fingerprint_index([new_snapshot])
+        self.assertEqual(fingerprint_index, None)
+        self.assertTrue(
+            tasks._may_be_duplicate(new_snapshot, fingerprint_index)
+        )
+
 
 
     def test_match_no_matches(self):
@@ -551,6 +646,123 @@ class TestTasks(TestCase):
         refreshed_snapshot = BuildingSnapshot.objects.get(pk=snapshot.pk)
         self.assertNotEqual(refreshed_snapshot.canonical_building, None)
         self.assertEqual(BuildingSnapshot.objects.all().count(), 1)
+        canon = refreshed_snapshot.canonical_building
+        self.assertEqual(canon.canonical_snapshot, refreshed_snapshot)
+        self.assertTrue(canon.active)
+        self.assertEqual(
+            list(canon.audit_logs.values_list('action', 'organization_id')),
+            [('create_building', self.fake_org.pk)]
+        )
+
+    def test_match_canonical_buildings_without_address(self):
+        """Canonicals with no address still get the unmatched compared."""
+        canon_snapshot = util.make_fake_snapshot(
+            self.import_file,
+            {'tax_lot_id': '435/422', 'property_name': 'Greenfield Complex'},
+            ASSESSED_BS, is_canon=True, org=self.fake_org
+        )
+        new_import_file = ImportFile.objects.create(
+            import_record=self.import_record,
+            mapping_done=True
+        )
+        new_snapshot = util.make_fake_snapshot(
+            new_import_file,
+            {'tax_lot_id': '1231', 'address_line_1': '44444 Hmmm Ave.'},
+            PORTFOLIO_BS, org=self.fake_org
+        )
+
+        tasks.match_buildings(new_import_file.pk, self.fake_user.pk)
+
+        stats = MatchingStageStats.objects.filter(import_file=new_import_file)
+        self.assertEqual(stats.get(stage='canonical_index').rows, 1)
+        # Not the shortcut for organizations without canonical buildings.
+        self.assertTrue(stats.filter(stage='candidate_lookup').exists())
+
+        latest_snapshot = BuildingSnapshot.objects.get(pk=new_snapshot.pk)
+        self.assertNotEqual(latest_snapshot.canonical_building, None)
+        self.assertNotEqual(
+            latest_snapshot.canonical_building.pk,
+            canon_snapshot.canonical_building.pk
+        )
+
+    def test_match_while_shards_running(self):
+        """A file whose match shards are still running isn't matched again."""
+        snapshot = util.make_fake_snapshot(
+            self.import_file, {'address_line_1': '555 Database LN.'},
+            ASSESSED_BS, org=self.fake_org
+        )
+        self.import_file.mapping_done = True
+        # As left by _match_buildings until finish_matching runs.
+        self.import_file.matching_completion = 0
+        self.import_file.save()
+
+        result = tasks.match_buildings(self.import_file.pk, self.fake_user.pk)
+        self.assertEqual(result['message'], 'matching already in progress')
+
+        tasks._match_buildings(self.import_file.pk, self.fake_user.pk)
+        refreshed_snapshot = BuildingSnapshot.objects.get(pk=snapshot.pk)
+        self.assertEqual(refreshed_snapshot.canonical_building, None)
+
+        tasks.finish_matching(self.import_file.pk)
+        import_file = ImportFile.objects.get(pk=self.import_file.pk)
+        self.assertTrue(import_file.matching_done)
+        self.assertEqual(import_file.matching_completion, 100)
+
+    def test_remap_while_shards_running(self):
+        """A file whose match shards are still running isn't remapped."""
+        snapshot = util.make_fake_snapshot(
+            self.import_file, {'address_line_1': '555 Database LN.'},
+            ASSESSED_BS, org=self.fake_org
+        )
+        self.import_file.mapping_done = True
+        # As left by _match_buildings until finish_matching runs.
+        self.import_file.matching_completion = 0
+        self.import_file.save()
+
+        result = tasks.remap_data(self.import_file.pk)
+        self.assertEqual(result['message'], 'Mapped buildings already merged')
+
+        tasks._remap_data(self.import_file.pk)
+        self.assertTrue(
+            BuildingSnapshot.objects.filter(pk=snapshot.pk).exists()
+        )
+
+    def test_match_after_shard_fails(self):
+        """A file can be matched again after one of its shards failed."""
+        snapshot = util.make_fake_snapshot(
+            self.import_file, {'address_line_1': '555 Database LN.'},
+            ASSESSED_BS, org=self.fake_org
+        )
+        # So the matching goes through the shards.
+        util.make_fake_snapshot(
+            None, {'address_line_1': '1 Other St.'}, ASSESSED_BS,
+            is_canon=True, org=self.fake_org
+        )
+        self.import_file.mapping_done = True
+        self.import_file.save()
+
+        with patch.object(
+                tasks, 'bulk_initialize_canonical_buildings',
+                side_effect=ValueError('shard failed')):
+            with self.assertRaises(ValueError):
+                tasks.match_buildings(self.import_file.pk, self.fake_user.pk)
+
+        import_file = ImportFile.objects.get(pk=self.import_file.pk)
+        self.assertFalse(import_file.matching_done)
+        self.assertEqual(import_file.matching_completion, None)
+
+        # The error callback run by the chord does the same.
+        import_file.matching_completion = 0
+        import_file.save()
+        tasks.fail_matching(import_file.pk)
+        import_file = ImportFile.objects.get(pk=self.import_file.pk)
+        self.assertEqual(import_file.matching_completion, None)
+
+        tasks.match_buildings(self.import_file.pk, self.fake_user.pk)
+        import_file = ImportFile.objects.get(pk=self.import_file.pk)
+        self.assertTrue(import_file.matching_done)
+        refreshed_snapshot = BuildingSnapshot.objects.get(pk=snapshot.pk)
+        self.assertNotEqual(refreshed_snapshot.canonical_building, None)
 
     def test_no_unmatched_buildings(self):
         """Make sure we shortcut out if there isn't unmatched data."""
@@ -622,6 +834,116 @@ class TestTasks(TestCase):
             1
         )
 
+    def test_match_fuzzy(self):
+        """Near-miss addresses are matched only when fuzzy matching is on."""
+        bs1_data = {
+           'pm_property_id': 123,
+           'tax_lot_id': '435/422',
+           'property_name': 'Greenfield Complex',
+           'address_line_1': '555 NorthWest Databaseer Lane.',
+           'city': 'Gotham City',
+           'postal_code': 8999,
+        }
+        bs2_data = {
+           'pm_property_id': 777,
+           'tax_lot_id': '999/1',
+           'property_name': 'Greenfield Complex',
+           'address_line_1': '555 Northwest Databaser Ln.',
+           'city': 'Gotham City',
+           'postal_code': 8999,
+        }
+        canon_snapshot = util.make_fake_snapshot(
+            self.import_file, bs1_data, ASSESSED_BS, is_canon=True,
+            org=self.fake_org
+        )
+        new_import_file = ImportFile.objects.create(
+            import_record=self.import_record,
+            mapping_done=True
+        )
+        new_snapshot = util.make_fake_snapshot(
+            new_import_file, bs2_data, PORTFOLIO_BS, org=self.fake_org
+        )
+
+        with self.settings(MATCH_FUZZY=True):
+            tasks.match_buildings(new_import_file.pk, self.fake_user.pk)
+
+        child = BuildingSnapshot.objects.get(
+            canonical_building=canon_snapshot.canonical_building,
+            match_type=SYSTEM_MATCH,
+        )
+        self.assertEqual(
+            sorted(child.parents.values_list('pk', flat=True)),
+            [canon_snapshot.pk, new_snapshot.pk]
+        )
+        self.assertGreaterEqual(child.confidence, settings.MATCH_MED_THRESHOLD)
+
+        # Each stage of the matching is timed.
+        stats = MatchingStageStats.objects.filter(import_file=new_import_file)
+        self.assertEqual(
+            list(stats.values_list('stage', flat=True)),
+            [
+                'id_lookup', 'duplicate_detection', 'id_matching',
+                'audit_logging', 'canonical_index', 'address_normalization',
+                'candidate_lookup', 'fuzzy_matching', 'canonicalization',
+                'merges',
+            ]
+        )
+        merges = stats.get(stage='merges')
+        self.assertEqual(merges.rows, 1)
+        self.assertEqual(merges.calls, 1)
+        self.assertGreater(merges.queries, 0)
+        # Both the ID matching and the shard wrote their logs.
+        self.assertEqual(stats.get(stage='audit_logging').calls, 2)
+
+    def test_match_fuzzy_other_street(self):
+        """Sharing a street number isn't enough for a fuzzy system match."""
+        other_street = util.make_fake_snapshot(
+            self.import_file,
+            {'address_line_1': '12 Main St', 'postal_code': 8999},
+            ASSESSED_BS, is_canon=True, org=self.fake_org
+        )
+        same_tax_lot = util.make_fake_snapshot(
+            self.import_file,
+            {'tax_lot_id': '435/422', 'property_name': 'Greenfield Complex'},
+            ASSESSED_BS, is_canon=True, org=self.fake_org
+        )
+        new_import_file = ImportFile.objects.create(
+            import_record=self.import_record,
+            mapping_done=True
+        )
+        elm_st = util.make_fake_snapshot(
+            new_import_file,
+            {'address_line_1': '12 Elm St', 'postal_code': 8999},
+            PORTFOLIO_BS, org=self.fake_org
+        )
+        greenfield = util.make_fake_snapshot(
+            new_import_file,
+            {
+                'tax_lot_id': '435/9',
+                'property_name': 'Greenfield Complex',
+                'address_line_1': '700 Oak Ave',
+            },
+            PORTFOLIO_BS, org=self.fake_org
+        )
+
+        with self.settings(MATCH_FUZZY=True):
+            tasks.match_buildings(new_import_file.pk, self.fake_user.pk)
+
+        # A different street with the same number and postal code.
+        elm_st = BuildingSnapshot.objects.get(pk=elm_st.pk)
+        self.assertNotEqual(elm_st.canonical_building, None)
+        self.assertNotEqual(
+            elm_st.canonical_building.pk, other_street.canonical_building.pk
+        )
+        self.assertFalse(elm_st.children.exists())
+
+        # Only the tax lot block in common: a possible match at most.
+        child = BuildingSnapshot.objects.get(
+            canonical_building=same_tax_lot.canonical_building,
+            parents=greenfield,
+        )
+        self.assertEqual(child.match_type, POSSIBLE_MATCH)
+
     def test_get_ancestors(self):
         """Tests get_ancestors(building), returns all non-composite, non-raw
             BuildingSnapshot instances.
@@ -689,6 +1011,62 @@ class TestTasks(TestCase):
             import_file=self.import_file
         ).count(), 512)
 
+    def test_save_raw_data_streaming(self):
+        """Chunk tasks read the stored file without parsing or copying it."""
+        with patch.object(
+                reader, 'MCMParser', wraps=reader.MCMParser) as mcm_parser, \
+                patch(
+                    'seed.data_importer.models.tempfile.NamedTemporaryFile',
+                    wraps=tempfile.NamedTemporaryFile) as temp_file:
+            with self.settings(
+                    RAW_SAVE_STREAMING=True, IMPORT_CHUNK_MIN_SIZE=100):
+                tasks.save_raw_data(self.import_file.pk)
+
+        self.assertEqual(BuildingSnapshot.objects.filter(
+            import_file=self.import_file
+        ).count(), 512)
+        # Only _save_raw_data looked at the file's layout.
+        self.assertEqual(mcm_parser.call_count, 1)
+        self.assertEqual(temp_file.call_count, 1)
+
+    def test_save_raw_data_chunk_bulk_insert(self):
+        """Bulk staging matches the per-row path with far fewer queries."""
+        chunk = [
+            {u'Property Id': str(i), u'Address 1': u'{0} Main St'.format(i)}
+            for i in range(50)
+        ]
+        results = {}
+        for bulk in (False, True):
+            import_file = ImportFile.objects.create(
+                import_record=self.import_record,
+                source_type='Assessed Raw',
+            )
+            with self.settings(RAW_SAVE_BULK_INSERT=bulk):
+                with CaptureQueriesContext(connection) as queries:
+                    tasks._save_raw_data_chunk(
+                        chunk, import_file.pk, 'fake_cache_key', 1
+                    )
+            results[bulk] = (
+                len(queries),
+                list(BuildingSnapshot.objects.filter(
+                    import_file=import_file
+                ).order_by('pk'))
+            )
+
+        per_row_queries, per_row = results[False]
+        bulk_queries, bulk = results[True]
+        self.assertLess(bulk_queries * 10, per_row_queries)
+        self.assertEqual(len(bulk), len(per_row))
+        for row_bs, bulk_bs in zip(per_row, bulk):
+            self.assertDictEqual(bulk_bs.extra_data, row_bs.extra_data)
+            self.assertEqual(bulk_bs.source_type, row_bs.source_type)
+            self.assertEqual(bulk_bs.super_organization, self.fake_org)
+            self.assertEqual(bulk_bs.tax_lot_id_source_id, bulk_bs.pk)
+            self.assertEqual(
+                bulk_bs.extra_data_sources,
+                {k: bulk_bs.pk for k in bulk_bs.extra_data}
+            )
+
     def test_delete_organization_buildings(self):
         """tests the delete builings for an org"""
         # start with the normal use case
@@ -4,8 +4,15 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+from django.db import DEFAULT_DB_ALIAS, connection, connections
 from django.test import TestCase
+from seed.lib.superperms.orgs.models import Organization
+from seed.models import Column, ColumnMapping, column_index_version_key
+from seed.utils import chunks
+from seed.utils.cache import delete_cache, get_cache_version
 from seed.utils.generic import split_model_fields
+from seed.utils.mapping import get_column_mapping_index
+from seed.utils.stages import StageTimer
 
 
 class DummyClass(object):
@@ -42,3 +49,111 @@ class TestGenericUtils(TestCase):
         obj_fields, non_obj_fields = split_model_fields(obj, fields_to_split)
         self.assertEqual(obj_fields, [])
         self.assertEqual(non_obj_fields, [f4])
+
+
+class TestColumnMappingIndex(TestCase):
+
+    def setUp(self):
+        self.org = Organization.objects.create()
+        self.version_key = column_index_version_key(self.org.pk)
+
+    def test_get_column_mapping_index(self):
+        """The index is built from the dest columns it is given."""
+        index = get_column_mapping_index(
+            self.org.pk, [u'address_line_1', u'city']
+        )
+        self.assertEqual(
+            index.best_match(u'Address Line 1', top_n=1),
+            [(u'address_line_1', 100)]
+        )
+        index = get_column_mapping_index(self.org.pk, [u'city'])
+        self.assertEqual(index.categories, [u'city'])
+
+    def test_column_changes_invalidate_index(self):
+        """Saving Columns and ColumnMappings bumps the org's version."""
+        version = get_cache_version(self.version_key)
+        raw_col = Column.objects.create(
+            organization=self.org, column_name='address'
+        )
+        self.assertGreater(get_cache_version(self.version_key), version)
+
+        version = get_cache_version(self.version_key)
+        mapping = ColumnMapping.objects.create(super_organization=self.org)
+        mapping.column_raw.add(raw_col)
+        self.assertEqual(get_cache_version(self.version_key), version + 2)
+
+        version = get_cache_version(self.version_key)
+        mapping.delete()
+        self.assertGreater(get_cache_version(self.version_key), version)
+
+
+class TestChunkPlanner(TestCase):
+
+    def setUp(self):
+        self.cost_key = chunks.get_cost_key('map', 1, 'Assessed Raw')
+        delete_cache(self.cost_key)
+
+    def tearDown(self):
+        delete_cache(self.cost_key)
+
+    def test_get_chunk_size_without_measurements(self):
+        """Row and column counts decide the size until costs are known."""
+        with self.settings(
+            IMPORT_CHUNK_MIN_SIZE=10, IMPORT_CHUNK_MAX_SIZE=1000,
+            IMPORT_CHUNK_DEFAULT_SIZE=100, IMPORT_CHUNK_REFERENCE_COLUMNS=50,
+            IMPORT_CHUNK_MIN_TASKS=4, IMPORT_CHUNK_MAX_TASKS=100,
+        ):
+            self.assertEqual(chunks.get_chunk_size(10000), 100)
+            # Wide files get smaller chunks.
+            self.assertEqual(chunks.get_chunk_size(2000, 200), 25)
+            # Small files are still spread over a few tasks.
+            self.assertEqual(chunks.get_chunk_size(200), 50)
+            self.assertEqual(chunks.get_chunk_size(20), 10)
+            # Huge files don't make huge chords.
+            self.assertEqual(chunks.get_chunk_size(50000), 500)
+            self.assertEqual(chunks.get_chunk_size(500000), 1000)
+
+    def test_get_chunk_size_with_measurements(self):
+        """Measured per-row cost sizes chunks to the target duration."""
+        chunks.record_chunk_cost(self.cost_key, 100, 2.0)
+        self.assertAlmostEqual(chunks.get_row_cost(self.cost_key), 0.02)
+        chunks.record_chunk_cost(self.cost_key, 100, 4.0)
+        self.assertAlmostEqual(
+            chunks.get_row_cost(self.cost_key),
+            0.3 * 0.04 + 0.7 * 0.02
+        )
+
+        with self.settings(
+            IMPORT_CHUNK_TARGET_SECONDS=13, IMPORT_CHUNK_MIN_TASKS=1
+        ):
+            self.assertEqual(
+                chunks.get_chunk_size(10000, cost_key=self.cost_key), 500
+            )
+
+    def test_merge_chunk_positions(self):
+        positions = [(0, 25), (100, 25), (230, 25), (400, 10)]
+        self.assertEqual(
+            chunks.merge_chunk_positions(positions, 50),
+            [(0, 50), (230, 35)]
+        )
+        self.assertEqual(
+            chunks.merge_chunk_positions(positions, 10), positions
+        )
+
+
+class TestStageTimer(TestCase):
+
+    def test_counts_queries(self):
+        with StageTimer() as outer:
+            with StageTimer() as inner:
+                Organization.objects.count()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    self.assertEqual(cursor.fetchone(), (1,))
+            Organization.objects.count()
+
+        self.assertEqual(inner.queries, 2)
+        self.assertEqual(outer.queries, 3)
+        self.assertGreaterEqual(outer.seconds, inner.seconds)
+        # The connection's own cursor is back once the timers are done.
+        self.assertNotIn('cursor', vars(connections[DEFAULT_DB_ALIAS]))
@@ -31,6 +31,7 @@ from seed.models import (
     Project,
     ProjectBuilding,
     FLOAT,
+    record_matching_stage,
 )
 from seed.views.main import (
     DEFAULT_CUSTOM_COLUMNS,
@@ -1699,6 +1700,45 @@ class TestMCMViews(TestCase):
             new_expected_mappings
         )
 
+    def test_get_matching_stats(self):
+        """Per-stage matching stats, added up across tasks."""
+        record_matching_stage(
+            self.import_file.pk, 'id_matching', 1.5, queries=10, rows=5
+        )
+        record_matching_stage(
+            self.import_file.pk, 'merges', 2.0, queries=4, rows=2
+        )
+        record_matching_stage(
+            self.import_file.pk, 'merges', 1.0, queries=3, rows=1
+        )
+
+        resp = self.client.get(
+            reverse_lazy("seed:get_matching_stats"),
+            {'import_file_id': self.import_file.pk},
+            content_type='application/json'
+        )
+        body = json.loads(resp.content)
+
+        self.assertEqual(body['status'], 'success')
+        self.assertEqual(body['stages'], [
+            {
+                'stage': 'id_matching',
+                'seconds': 1.5,
+                'queries': 10,
+                'rows': 5,
+                'calls': 1,
+            },
+            {
+                'stage': 'merges',
+                'seconds': 3.0,
+                'queries': 7,
+                'rows': 3,
+                'calls': 2,
+            },
+        ])
+        self.assertEqual(body['seconds'], 4.5)
+        self.assertEqual(body['queries'], 17)
+
     def test_get_raw_column_names(self):
         """Good case for ``get_raw_column_names``."""
         resp = self.client.post(
@@ -63,6 +63,11 @@ urlpatterns = patterns(
         'get_PM_filter_by_counts',
         name='get_PM_filter_by_counts'
     ),
+    url(
+        r'^get_matching_stats/$',
+        'get_matching_stats',
+        name='get_matching_stats'
+    ),
     url(
         r'^delete_duplicates_from_import_file/$',
         'delete_duplicates_from_import_file',
@@ -0,0 +1,187 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+import re
+from collections import OrderedDict
+
+import usaddress
+from django.utils.encoding import force_text
+from streetaddress import StreetAddressFormatter
+
+# Number of addresses whose normalized form is kept in memory.
+NORMALIZE_CACHE_SIZE = 10000
+
+_normalize_cache = OrderedDict()
+_normalize_stats = {'hits': 0, 'misses': 0}
+
+
+def _normalize_address_direction(direction):
+    direction = direction.lower().replace('.', '')
+    direction_map = {
+        'east': 'e',
+        'west': 'w',
+        'north': 'n',
+        'south': 's',
+        'northeast': 'ne',
+        'northwest': 'nw',
+        'southeast': 'se',
+        'southwest': 'sw'
+    }
+    if direction in direction_map:
+        return direction_map[direction]
+    return direction
+
+
+POST_TYPE_MAP = {
+    'avenue': 'ave',
+}
+
+
+def _normalize_address_post_type(post_type):
+    value = post_type.lower().replace('.', '')
+    return POST_TYPE_MAP.get(value, value)
+
+
+ADDRESS_NUMBER_RE = re.compile((
+    r''
+    r'(?P<start>[0-9]+)'  # The left part of the range
+    r'\s?'  # Optional whitespace before the separator
+    r'[\\/-]?'  # Optional Separator
+    r'\s?'  # Optional whitespace after the separator
+    r'(?<=[\s\\/-])'  # Enforce match of at least one separator char.
+    r'(?P<end>[0-9]+)'  # THe right part of the range
+))
+
+
+def _normalize_address_number(address_number):
+    """
+    Given the numeric portion of an address, normalize it.
+    - strip leading zeros from numbers.
+    - remove whitespace from ranges.
+    - convert ranges to use dash as separator.
+    - expand any numbers that appear to have had their leading digits
+      truncated.
+    """
+    match = ADDRESS_NUMBER_RE.match(address_number)
+    if match:
+        # This address number is a range, so normalize it.
+        components = match.groupdict()
+        range_start = components['start'].lstrip("0")
+        range_end = components['end'].lstrip("0")
+        if len(range_end) < len(range_start):
+            # The end range value is omitting a common prefix.  Add it back.
+            prefix_length = len(range_start) - len(range_end)
+            range_end = range_start[:prefix_length] + range_end
+        return '-'.join([range_start, range_end])
+
+    # some addresses have leading zeros, strip them here
+    return address_number.lstrip("0")
+
+
+def _normalize_address_str(address_val):
+    """
+    Normalize the address to conform to short abbreviations.
+
+    If an invalid address_val is provided, None is returned.
+
+    If a valid address is provided, a normalized version is returned.
+    """
+
+    # if this string is empty the regular expression in the sa wont
+    # like it, and fail, so leave returning nothing
+    if not address_val:
+        return None
+
+    # now parse the address into number, street name and street type
+    # Keep it unicode; str() fails on non-ASCII addresses.
+    address_val = force_text(address_val)
+    try:
+        addr = usaddress.tag(address_val)[0]
+    except usaddress.RepeatedLabelError:
+        # usaddress can't parse this at all
+        normalized_address = address_val
+    else:
+        # Address can be parsed, so let's format it.
+        normalized_address = ''
+
+        if 'AddressNumber' in addr and addr['AddressNumber'] is not None:
+            normalized_address = _normalize_address_number(addr['AddressNumber'])
+
+        if 'StreetNamePreDirectional' in addr and addr['StreetNamePreDirectional'] is not None:
+            normalized_address = normalized_address + ' ' + _normalize_address_direction(
+                    addr['StreetNamePreDirectional'])  # NOQA
+
+        if 'StreetName' in addr and addr['StreetName'] is not None:
+            normalized_address = normalized_address + ' ' + addr['StreetName']
+
+        if 'StreetNamePostType' in addr and addr['StreetNamePostType'] is not None:
+            # remove any periods from abbreviations
+            normalized_address = normalized_address + ' ' + _normalize_address_post_type(
+                    addr['StreetNamePostType'])  # NOQA
+
+        if 'StreetNamePostDirectional' in addr and addr['StreetNamePostDirectional'] is not None:
+            normalized_address = normalized_address + ' ' + _normalize_address_direction(
+                    addr['StreetNamePostDirectional'])  # NOQA
+
+        formatter = StreetAddressFormatter()
+        normalized_address = formatter.abbrev_street_avenue_etc(normalized_address)
+
+    return normalized_address.lower().strip()
+
+
+def normalize_address_str(address_val):
+    """Normalize the address to conform to short abbreviations.
+
+    Parsing an address with usaddress is slow, and the same addresses
+    come up again and again during an import, so results are memoised in
+    a LRU cache of ``NORMALIZE_CACHE_SIZE`` entries;
+    see ``normalize_cache_info``.
+
+    :param address_val: str, the address to normalize, e.g. address_line_1.
+    :returns: str, or None if address_val is empty.
+    """
+    if not address_val:
+        return None
+
+    try:
+        result = _normalize_cache.pop(address_val)
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable, don't bother caching it.
+        return _normalize_address_str(address_val)
+    else:
+        _normalize_stats['hits'] += 1
+        _normalize_cache[address_val] = result
+        return result
+
+    _normalize_stats['misses'] += 1
+    result = _normalize_address_str(address_val)
+    _normalize_cache[address_val] = result
+    while len(_normalize_cache) > NORMALIZE_CACHE_SIZE:
+        _normalize_cache.popitem(last=False)
+
+    return result
+
+
+def normalize_cache_info():
+    """Return hit/miss counters and size of the address cache.
+
+    :returns: dict, {'hits': int, 'misses': int, 'size': int, 'maxsize': int}
+    """
+    return {
+        'hits': _normalize_stats['hits'],
+        'misses': _normalize_stats['misses'],
+        'size': len(_normalize_cache),
+        'maxsize': NORMALIZE_CACHE_SIZE,
+    }
+
+
+def clear_normalize_cache():
+    """Empty the address cache and reset its counters."""
+    _normalize_cache.clear()
+    _normalize_stats['hits'] = 0
+    _normalize_stats['misses'] = 0
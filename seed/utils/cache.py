@@ -4,6 +4,8 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
+import uuid
+
 from django.core.cache import cache as django_cache
 from django.core.cache.backends.base import DEFAULT_TIMEOUT
 
@@ -20,10 +22,27 @@ def get_cache_raw(key, default=None):
     return django_cache.get(key, default)
 
 
+# Progress is counted in integer units with atomic cache increments, so
+# chord members running in parallel don't overwrite each other's progress.
+# ``increment_cache`` takes a percentage; a unit is a millionth of a percent,
+# small enough that rounding increments to units doesn't add up.
+PROGRESS_UNITS_PER_PERCENT = 1000000
+PROGRESS_UNITS_TOTAL = 100 * PROGRESS_UNITS_PER_PERCENT
+# Counters live longer than the progress dicts, as increments don't (and
+# can't atomically) refresh their timeout.
+PROGRESS_COUNTER_TIMEOUT = 60 * 60 * 24
+
+
+def _progress_units_key(progress_key):
+    return u'{0}:units'.format(progress_key)
+
+
 def set_cache(progress_key, status, data):
     """
     Sets the cache key to a pickled dictionary containing at least status and progress.
     If data is not a dict, it is assumed to be a progress percentage.
+
+    The progress set here replaces any made with ``increment_cache`` so far.
     """
     if type(status) != str:
         raise ValueError('Invalid value for status; must be a string')
@@ -35,25 +54,64 @@ def set_cache(progress_key, status, data):
         result = data
     result['status'] = status
     set_cache_raw(progress_key, result, DEFAULT_TIMEOUT)
+    django_cache.delete(_progress_units_key(progress_key))
 
     return result
 
 
 def get_cache(progress_key, default=None):
-    """Unpickles the cache key to a dictionary and resets the timeout"""
+    """Unpickles the cache key to a dictionary.
+
+    Progress made with ``increment_cache`` since the last ``set_cache`` is
+    added to the stored progress. Reading doesn't refresh the timeout.
+    """
     if default is not None:
         if type(default) != dict:
             default = {'status': 'Unknown', 'progress': default}
     data = get_cache_raw(progress_key, default)
+    units = get_cache_raw(_progress_units_key(progress_key))
     if data is None:
         # Cache accessed before it was created
         data = {'status': 'parsing', 'progress': 0.0}
-    else:
-        # Set cache to same value to reset timeout
-        set_cache(progress_key, data['status'], data)
+    if units is not None:
+        data = dict(data, status='parsing')
+        data['progress'] = _add_progress_units(data.get('progress'), units)
     return data
 
 
+def _add_progress_units(progress, units):
+    try:
+        progress = float(progress or 0.0)
+    except (TypeError, ValueError):
+        progress = 0.0
+    progress += float(units) / PROGRESS_UNITS_PER_PERCENT
+    return min(100.0, round(progress, 3))
+
+
+def increment_counter(key, delta=1, timeout=None):
+    """Atomically add delta to the integer at key, creating it if needed.
+
+    :returns: int, the new value.
+    """
+    django_cache.add(key, 0, timeout)
+    try:
+        return django_cache.incr(key, delta)
+    except ValueError:
+        # Deleted between add and incr.
+        django_cache.add(key, delta, timeout)
+        return delta
+
+
+def increment_progress(progress_key, units):
+    """Atomically add ``units`` (of ``PROGRESS_UNITS_TOTAL``) of progress.
+
+    :returns: int, the units done since the last ``set_cache``.
+    """
+    return increment_counter(
+        _progress_units_key(progress_key), units, PROGRESS_COUNTER_TIMEOUT
+    )
+
+
 def set_cache_state(progress_key, state):
     """Sets the cache key or progress_key to a bool."""
     if type(state) != bool:
@@ -91,20 +149,68 @@ def unlock_cache(progress_key, timeout=DEFAULT_TIMEOUT):
 
 def get_lock(lock_key, default=0):
     """Return the locked status. If the lock key does not exist, return 0"""
-    return get_cache_raw(lock_key, default)
+    value = get_cache_raw(lock_key)
+    if value is None:
+        return default
+    # Locks from ``acquire_lock`` hold their owner's token.
+    return 0 if value == 0 else 1
+
+
+def acquire_lock(lock_key, timeout=60):
+    """Take the lock if nobody holds it.
+
+    :param lock_key: str, the cache key of the lock.
+    :param timeout: int, seconds until the lock expires unless renewed.
+    :returns: str, the owner token to renew and release the lock with, or
+        None if the lock is held by someone else.
+    """
+    token = uuid.uuid4().hex
+    if django_cache.add(lock_key, token, timeout):
+        return token
+    return None
+
+
+def renew_lock(lock_key, token, timeout=60):
+    """Push back the expiry of a lock we hold.
+
+    :returns: bool, False if the lock is no longer ours.
+    """
+    if django_cache.get(lock_key) != token:
+        return False
+    set_cache_raw(lock_key, token, timeout)
+    return True
+
+
+def release_lock(lock_key, token):
+    """Release a lock, but only if we still hold it.
+
+    The check and delete are two cache calls, so this narrows, rather than
+    closes, the window for deleting a lock someone else took after ours
+    expired.
+    """
+    if django_cache.get(lock_key) == token:
+        django_cache.delete(lock_key)
 
 
 def increment_cache(key, increment):
     """Increment cache by value increment, never exceed 100."""
-    value = get_cache(key)
-    value = float(value['progress'])
-    if value + increment >= 100.0:
-        value = 100.0
-    else:
-        value += increment
+    # Make sure there's a progress dict to add the units to.
+    django_cache.add(key, {'status': 'parsing', 'progress': 0.0}, DEFAULT_TIMEOUT)
+    increment_progress(
+        key, int(round(increment * PROGRESS_UNITS_PER_PERCENT))
+    )
+    return {'status': 'parsing', 'progress': get_cache(key)['progress']}
+
+
+def get_cache_version(key):
+    """Return the version counter stored at key, 0 if it was never bumped."""
+    return get_cache_raw(key, 0)
+
 
-    set_cache(key, 'parsing', value)
-    return {'status': 'parsing', 'progress': value}
+def bump_cache_version(key):
+    """Increment the version counter at key, making older entries stale."""
+    # The counter never expires, so versions can't be reused.
+    return increment_counter(key, 1, None)
 
 
 def clear_cache():
@@ -0,0 +1,117 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+
+Chunk sizing for the save/map/cleanse chords.
+
+Each stage of an import splits its rows into chunks and runs one Celery
+task per chunk. The chunk size is picked from the number of rows and
+columns, and from the per-row cost measured on earlier chunks of the same
+stage for the same org and source type.
+"""
+import math
+
+from django.conf import settings
+
+from seed.utils.cache import get_cache_raw, set_cache_raw
+
+# Weight of the newest measurement in the moving average of per-row cost.
+COST_SMOOTHING = 0.3
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_cost_key(stage, organization_id, source_type):
+    """Cache key of the measured per-row cost for a stage.
+
+    :param stage: str, e.g. 'save_raw', 'map' or 'cleanse'.
+    :param organization_id: int, the org the import belongs to.
+    :param source_type: the source type of the rows being processed.
+    """
+    return 'chunk_cost:{0}:{1}:{2}'.format(
+        stage, organization_id, source_type
+    )
+
+
+def get_row_cost(cost_key):
+    """Return the average seconds per row for cost_key, or None."""
+    return get_cache_raw(cost_key)
+
+
+def record_chunk_cost(cost_key, num_rows, seconds):
+    """Fold the time a chunk took into the average per-row cost.
+
+    :param cost_key: str, from ``get_cost_key``.
+    :param num_rows: int, number of rows in the chunk.
+    :param seconds: float, how long the chunk took.
+    """
+    if not cost_key or not num_rows:
+        return
+
+    cost = float(seconds) / num_rows
+    previous = get_row_cost(cost_key)
+    if previous is not None:
+        cost = COST_SMOOTHING * cost + (1 - COST_SMOOTHING) * previous
+    # Keep measurements around for later imports.
+    set_cache_raw(cost_key, cost, None)
+
+
+def get_chunk_size(num_rows, num_columns=None, cost_key=None):
+    """Pick how many rows each task of a chord should process.
+
+    In order of precedence, the size is:
+
+    * kept between IMPORT_CHUNK_MIN_SIZE and IMPORT_CHUNK_MAX_SIZE,
+    * large enough that there are at most IMPORT_CHUNK_MAX_TASKS tasks,
+    * small enough that there are at least IMPORT_CHUNK_MIN_TASKS tasks,
+    * sized so a chunk takes about IMPORT_CHUNK_TARGET_SECONDS, if earlier
+      chunks were measured, else IMPORT_CHUNK_DEFAULT_SIZE scaled down for
+      files wider than IMPORT_CHUNK_REFERENCE_COLUMNS.
+
+    :param num_rows: int or None, rows to process.
+    :param num_columns: (optional) int, columns per row.
+    :param cost_key: (optional) str, from ``get_cost_key``.
+    :rtype: int
+    """
+    min_size = _setting('IMPORT_CHUNK_MIN_SIZE', 25)
+    max_size = _setting('IMPORT_CHUNK_MAX_SIZE', 1000)
+
+    cost = get_row_cost(cost_key) if cost_key else None
+    if cost:
+        size = _setting('IMPORT_CHUNK_TARGET_SECONDS', 10) / cost
+    else:
+        size = _setting('IMPORT_CHUNK_DEFAULT_SIZE', 100)
+        reference_columns = _setting('IMPORT_CHUNK_REFERENCE_COLUMNS', 50)
+        if num_columns and num_columns > reference_columns:
+            size = size * reference_columns / float(num_columns)
+
+    if num_rows:
+        min_tasks = _setting('IMPORT_CHUNK_MIN_TASKS', 4)
+        max_tasks = _setting('IMPORT_CHUNK_MAX_TASKS', 500)
+        size = min(size, math.ceil(num_rows / float(min_tasks)))
+        size = max(size, math.ceil(num_rows / float(max_tasks)))
+
+    return int(max(min_size, min(max_size, size)))
+
+
+def merge_chunk_positions(positions, chunk_size):
+    """Merge consecutive (position, count) chunks into larger ones.
+
+    :param positions: list of (position, count), as returned by
+        ``MCMParser.chunk_positions``.
+    :param chunk_size: int, the number of rows we want per chunk; merged
+        chunks hold as many of the input chunks as fit in it, at least one.
+    :rtype: list of (position, count)
+    """
+    merged = []
+    for position, count in positions:
+        if merged and merged[-1][1] + count <= chunk_size:
+            merged[-1] = (merged[-1][0], merged[-1][1] + count)
+        else:
+            merged.append((position, count))
+
+    return merged
@@ -13,11 +13,13 @@ EXCLUDE_FIELDS = [
     'confidence',
     'created',
     'extra_data',
+    'fingerprint',
     'id',
     'import_file',
     'last_modified_by',
     'match_type',
     'modified',
+    'normalized_address',
     'parents',
     'pk',
     'seed_org',
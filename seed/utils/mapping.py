@@ -4,8 +4,12 @@
 :copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
 :author
 """
-from seed.models import BuildingSnapshot
+import hashlib
+
+from seed.lib.mcm.matchers import CandidateIndex
+from seed.models import BuildingSnapshot, column_index_version_key
 from seed.utils import constants
+from seed.utils.cache import get_cache_raw, get_cache_version, set_cache_raw
 
 
 def get_mappable_columns(exclude_fields=None):
@@ -48,3 +52,30 @@ def _get_column_names(column_mapping, attr_name='column_raw'):
     return [
         t for t in attr.all().values_list('column_name', flat=True)
     ]
+
+
+def get_column_mapping_index(org_id, dest_columns):
+    """Return a ``CandidateIndex`` of dest_columns, cached for the org.
+
+    The cached index goes stale whenever the org's (or the shared) Columns
+    or ColumnMappings change; see ``seed.models.invalidate_column_index``.
+
+    :param org_id: int, the organization the suggestions are for.
+    :param dest_columns: list of str, the columns we're mapping to.
+    :rtype: ``seed.lib.mcm.matchers.CandidateIndex``
+    """
+    digest = hashlib.sha1(
+        u'\n'.join(sorted(dest_columns)).encode('utf-8')
+    ).hexdigest()
+    key = 'column_mapping_index:{0}:{1}:{2}:{3}'.format(
+        org_id,
+        get_cache_version(column_index_version_key(None)),
+        get_cache_version(column_index_version_key(org_id)),
+        digest,
+    )
+    index = get_cache_raw(key)
+    if index is None:
+        index = CandidateIndex(dest_columns)
+        set_cache_raw(key, index)
+
+    return index
@@ -0,0 +1,244 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+import re
+from collections import defaultdict
+
+
+class AddressIndex(object):
+    """Hash index from normalized address to canonical snapshot PKs.
+
+    Built once per match run, so that finding the canonical buildings at an
+    address is a dict lookup instead of a scan of every canonical address.
+
+    ``blocking_keys`` is an optional callable taking a normalized address
+    and returning the keys of the blocks it belongs to (e.g. its street
+    number, or a phonetic code of its street name). When given, addresses
+    are also indexed by block, and ``candidates`` returns the addresses
+    sharing a block with the one looked up, for fuzzy comparison.
+
+    Usage:
+        >>> index = AddressIndex()
+        >>> index.add('123 test st', 4)
+        >>> index.get('123 test st')
+        4
+
+    """
+
+    def __init__(self, blocking_keys=None):
+        self.blocking_keys = blocking_keys
+        self._pks = defaultdict(list)
+        self._blocks = defaultdict(set)
+
+    def add(self, address, pk):
+        """Index pk under address; empty addresses are ignored."""
+        if not address:
+            return
+
+        self._pks[address].append(pk)
+        if self.blocking_keys:
+            for key in self.blocking_keys(address):
+                self._blocks[key].add(address)
+
+    def pks(self, address):
+        """Return every PK indexed under address, in the order added."""
+        if not address or address not in self._pks:
+            return []
+        return list(self._pks[address])
+
+    def get(self, address, default=None):
+        """Return the PK added last for address.
+
+        This is the PK a ``{address: pk}`` dict built from the same
+        buildings would hold.
+        """
+        pks = self.pks(address)
+        return pks[-1] if pks else default
+
+    def candidates(self, address):
+        """Return the indexed addresses that share a block with address."""
+        if not address or not self.blocking_keys:
+            return []
+
+        found = set()
+        for key in self.blocking_keys(address):
+            found.update(self._blocks.get(key, ()))
+        return sorted(found)
+
+    def __contains__(self, address):
+        return bool(address) and address in self._pks
+
+    def __getitem__(self, address):
+        if address not in self:
+            raise KeyError(address)
+        return self.get(address)
+
+    def __len__(self):
+        return len(self._pks)
+
+
+# Fields that identify a building; any of them can match any other.
+ID_FIELDS = ('pm_property_id', 'tax_lot_id', 'custom_id_1')
+
+
+class IdIndex(object):
+    """In-memory index of canonical snapshots by their ID values.
+
+    A snapshot is found by any of its ``ID_FIELDS`` values, whichever
+    field the value is in on either side, within the same scope (the
+    super organization, by default).
+
+    Matching merges snapshots into new ones, so ``replace`` swaps the
+    merged snapshots for their child; later lookups then see the tip of
+    the lineage, as a fresh query would.
+
+    Usage:
+        >>> index = IdIndex([canonical_snapshot])
+        >>> index.candidates(unmatched_snapshot)
+        [<BuildingSnapshot ...>]
+
+    """
+
+    def __init__(
+        self, snapshots=(), id_fields=ID_FIELDS,
+        scope_field='super_organization_id'
+    ):
+        self.id_fields = id_fields
+        self.scope_field = scope_field
+        self._snapshots = {}
+        self._by_key = defaultdict(set)
+        for snapshot in snapshots:
+            self.add(snapshot)
+
+    def ids(self, snapshot):
+        """Return the set of non-empty ID values of snapshot."""
+        values = set()
+        for field in self.id_fields:
+            value = getattr(snapshot, field, None)
+            if value:
+                values.add(value)
+        return values
+
+    def _keys(self, snapshot):
+        scope = getattr(snapshot, self.scope_field, None)
+        return [(scope, value) for value in self.ids(snapshot)]
+
+    def add(self, snapshot):
+        """Index snapshot under each of its ID values."""
+        self._snapshots[snapshot.pk] = snapshot
+        for key in self._keys(snapshot):
+            self._by_key[key].add(snapshot.pk)
+
+    def remove(self, snapshot):
+        """Drop snapshot from the index, if it's there."""
+        snapshot = self._snapshots.pop(snapshot.pk, None)
+        if snapshot is None:
+            return
+        for key in self._keys(snapshot):
+            self._by_key[key].discard(snapshot.pk)
+
+    def replace(self, snapshots, child):
+        """Swap merged snapshots for the child they were merged into."""
+        for snapshot in snapshots:
+            self.remove(snapshot)
+        self.add(child)
+
+    def candidates(self, snapshot):
+        """Return indexed snapshots sharing an ID with snapshot, by PK."""
+        pks = set()
+        for key in self._keys(snapshot):
+            pks.update(self._by_key.get(key, ()))
+        return [self._snapshots[pk] for pk in sorted(pks)]
+
+    def __len__(self):
+        return len(self._snapshots)
+
+
+# Fields ``fuzzy_blocking_keys`` reads.
+FUZZY_BLOCK_FIELDS = (
+    'normalized_address', 'address_line_1', 'postal_code', 'tax_lot_id'
+)
+
+STREET_NUMBER_RE = re.compile(r'\s*(\d+)')
+TAX_LOT_PREFIX_RE = re.compile(r'[\s/\-.]+')
+
+
+def split_street_address(values):
+    """Split a building's street address into its number and street name.
+
+    :param values: dict, with the ``FUZZY_BLOCK_FIELDS`` of a building.
+    :returns: tuple, (street number or None, lower cased street name).
+    """
+    address = values.get('normalized_address') or values.get('address_line_1')
+    address = unicode(address or '').strip().lower()
+    number = STREET_NUMBER_RE.match(address)
+    if not number:
+        return None, address
+    return number.group(1), address[number.end():].strip()
+
+
+def fuzzy_blocking_keys(values):
+    """Return the blocks of likely matches a building belongs to.
+
+    Buildings are only compared with the ones sharing one of these:
+
+    * the street number, within the same 5 digit postal code,
+    * the first part of the tax lot ID, e.g. '435' for '435/422'.
+
+    :param values: dict, with the ``FUZZY_BLOCK_FIELDS`` of a building.
+    :rtype: list of tuples
+    """
+    keys = []
+    number, _ = split_street_address(values)
+    if number:
+        postal_code = unicode(values.get('postal_code') or '').strip()[:5]
+        keys.append(('street', number, postal_code))
+
+    tax_lot_id = unicode(values.get('tax_lot_id') or '').strip()
+    if tax_lot_id:
+        keys.append(('tax_lot', TAX_LOT_PREFIX_RE.split(tax_lot_id)[0].lower()))
+
+    return keys
+
+
+class BlockIndex(object):
+    """Index of PKs by blocking key, for finding fuzzy match candidates.
+
+    Comparing every building with every canonical building is quadratic;
+    instead a building is only compared with those sharing a block.
+    Blocks holding more than ``max_block_size`` PKs are too common to
+    say much, and are skipped, which bounds the candidates per building.
+
+    Usage:
+        >>> index = BlockIndex(fuzzy_blocking_keys, max_block_size=50)
+        >>> index.add({'address_line_1': '12 Main St'}, 4)
+        >>> index.candidates({'address_line_1': '12 Main Street'})
+        [4]
+
+    """
+
+    def __init__(self, blocking_keys, max_block_size=None):
+        self.blocking_keys = blocking_keys
+        self.max_block_size = max_block_size
+        self._blocks = defaultdict(set)
+
+    def add(self, values, pk):
+        """Index pk under each block of values."""
+        for key in self.blocking_keys(values):
+            self._blocks[key].add(pk)
+
+    def candidates(self, values):
+        """Return the PKs sharing a block with values, sorted."""
+        pks = set()
+        for key in self.blocking_keys(values):
+            block = self._blocks.get(key, ())
+            if self.max_block_size and len(block) > self.max_block_size:
+                continue
+            pks.update(block)
+        return sorted(pks)
+
+    def __len__(self):
+        return len(self._blocks)
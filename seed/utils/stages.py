@@ -0,0 +1,79 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+:copyright (c) 2014 - 2016, The Regents of the University of California, through Lawrence Berkeley National Laboratory (subject to receipt of any required approvals from the U.S. Department of Energy) and contributors. All rights reserved.  # NOQA
+:author
+"""
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class _CountingCursor(object):
+    """Cursor wrapper counting the statements executed through it."""
+
+    def __init__(self, cursor, timer):
+        self.cursor = cursor
+        self.timer = timer
+
+    def execute(self, *args, **kwargs):
+        self.timer.queries += 1
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.timer.queries += 1
+        return self.cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.cursor.__exit__(exc_type, exc_value, traceback)
+
+
+class StageTimer(object):
+    """Measure the wall time and database queries of a block of code.
+
+    Queries are counted by wrapping the cursors the connection hands out
+    during the block; unlike Django's debug cursor, no SQL is kept.
+    The code being measured sets ``rows`` to the number of rows it handled.
+
+    Usage:
+        >>> with StageTimer() as timer:
+        ...     timer.rows = len(do_work())
+        >>> timer.seconds, timer.queries, timer.rows
+
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.seconds = 0.0
+        self.queries = 0
+        self.rows = 0
+
+    def __enter__(self):
+        connection = connections[self.using]
+        # Nested timers wrap the outer one's cursor, so both count.
+        self._patched_cursor = vars(connection).get('cursor')
+        make_cursor = connection.cursor
+
+        def cursor(*args, **kwargs):
+            return _CountingCursor(make_cursor(*args, **kwargs), self)
+
+        connection.cursor = cursor
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.time() - self._start
+        connection = connections[self.using]
+        if self._patched_cursor is None:
+            del connection.cursor
+        else:
+            connection.cursor = self._patched_cursor
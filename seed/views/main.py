@@ -31,15 +31,18 @@ from seed.decorators import ajax_request
 from seed.lib.superperms.orgs.decorators import has_perm
 from seed import models, tasks
 from seed.models import (
-    get_column_mapping,
+    get_column_mapping_resolver,
     save_snapshot_match,
     BuildingSnapshot,
     Column,
     ColumnMapping,
     ProjectBuilding,
     get_ancestors,
+    get_tip,
+    get_tips,
     unmatch_snapshot_tree as unmatch_snapshot,
     CanonicalBuilding,
+    MatchingStageStats,
     ASSESSED_BS,
     PORTFOLIO_BS,
     GREEN_BUTTON_BS,
@@ -57,7 +60,9 @@ from seed.utils.projects import (
     get_projects,
 )
 from seed.utils.time import convert_to_js_timestamp
-from seed.utils.mapping import get_mappable_types, get_mappable_columns
+from seed.utils.mapping import (
+    get_column_mapping_index, get_mappable_types, get_mappable_columns
+)
 from seed.utils.cache import get_cache, set_cache
 from .. import search
 from seed.lib.exporter import Exporter
@@ -973,7 +978,8 @@ def get_match_tree(request):
     # since our tree has the structure of two parents and one child, we can go
     # to the tip and look up, otherwise it's hard to keep track of the
     # co-parent trees of the children.
-    tree = bs.tip.parent_tree + [bs.tip]
+    tip = get_tip(bs)
+    tree = tip.parent_tree + [tip]
     tree = map(lambda b: b.to_dict(), tree)
     return {
         'status': 'success',
@@ -1110,7 +1116,7 @@ def get_coparents(request):
 
     result = map(lambda b: b.to_dict(), proto_result)
 
-    tip = root.tip
+    tip = get_tip(root)
     tree = tip.parent_tree + [tip]
     tree = map(lambda b: b.to_dict(), tree)
     response = {
@@ -1166,6 +1172,47 @@ def get_PM_filter_by_counts(request):
     }
 
 
+@api_endpoint
+@ajax_request
+@login_required
+def get_matching_stats(request):
+    """
+    Retrieves where the time went while matching a given ImportFile record,
+    stage by stage, in the order the stages first ran.
+
+    :GET: Expects import_file_id corresponding to the ImportFile in question.
+
+    Returns::
+
+        {'status': 'success',
+         'stages': [
+             {'stage': name of the stage, e.g. 'id_matching' or 'merges',
+              'seconds': wall time spent in the stage,
+              'queries': number of database queries made,
+              'rows': number of rows handled,
+              'calls': number of times the stage ran, e.g. once per shard
+              },
+             ...
+         ],
+         'seconds': total wall time of all stages,
+         'queries': total number of database queries
+        }
+    """
+    import_file_id = request.GET.get('import_file_id', '')
+
+    stages = [
+        stats.to_dict() for stats in MatchingStageStats.objects.filter(
+            import_file__pk=import_file_id
+        )
+    ]
+    return {
+        'status': 'success',
+        'stages': stages,
+        'seconds': sum(stage['seconds'] for stage in stages),
+        'queries': sum(stage['queries'] for stage in stages),
+    }
+
+
 @api_endpoint
 @ajax_request
 @login_required
@@ -1308,12 +1355,19 @@ def get_column_mapping_suggestions(request):
 
     else:
         # All other input types
+        dest_columns = column_types.keys()
+        organization = import_file.import_record.super_organization
+        # Load all of the previous mappings for the file's headers at once.
+        previous_mapping = get_column_mapping_resolver(
+            import_file.first_row_columns, organization
+        )
         suggested_mappings = mapper.build_column_mapping(
             import_file.first_row_columns,
-            column_types.keys(),
-            previous_mapping=get_column_mapping,
-            map_args=[import_file.import_record.super_organization],
-            thresh=20  # percentage match we require
+            dest_columns,
+            previous_mapping=previous_mapping,
+            map_args=[organization],
+            thresh=20,  # percentage match we require
+            index=get_column_mapping_index(org_id, dest_columns)
         )
         # replace None with empty string for column names
         for m in suggested_mappings:
@@ -2362,7 +2416,7 @@ def get_raw_report_data(from_date, end_date, orgs, x_var, y_var):
     data = defaultdict(lambda: defaultdict(dict))
 
     # get a unique list of canonical buildings
-    canonical_buildings = set(bldg.tip for bldg in bldgs)
+    canonical_buildings = set(get_tips(bldgs).values())
 
     # "deleted" buildings just get their canonicalbuilding field set to false
     # filter them out here.  There may be a way to do this in one query with the above but I